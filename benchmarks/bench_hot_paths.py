@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+热点路径基准测试，以合成的 CTP 回报数据离线运行，不需要 vn.py 及 CTP 前置：
+
+    python benchmarks/bench_hot_paths.py --output before.json
+    python benchmarks/bench_hot_paths.py --output after.json --compare before.json
+
+测试项：
+
+* codec.tick / codec.order / codec.trade / codec.position / codec.instrument / codec.commission / codec.account：
+  各类 CTP 回报解码为 DataDict 的吞吐
+* md.parse / md.on_tick / md.callback：行情解析、网关 on_tick、行情回调全程，统计每秒笔数及每笔耗时分位数
+* md.callback.profiled：开启回调耗时统计时的行情回调全程，与 md.callback 之差即统计本身的开销
+* md.events：事件源 events() 由行情队列生成 TICK 事件
+* td.on_order / td.on_trade：订单及成交回报在回调线程中的处理（记录后放入事件队列），统计每秒笔数
+* td.process_order / td.process_trade：策略线程从事件队列取出回报后发布事件并更新账户，统计每秒笔数
+* td.fill_latency：事件队列中积压 --backlog 笔行情时，成交回报从回调到策略线程发布 TRADE 事件的耗时
+* portfolio.read / portfolio.tick_read / portfolio.resync_read：不同持仓数量下读取 portfolio 的耗时，
+  分别为无变化、每次读取前有一笔行情、每次读取前重新同步
+
+结果以 JSON 输出，--compare 时与此前的结果逐项比较，吞吐下降或耗时上升超过 --threshold 时返回非零值。
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from datetime import date, datetime
+from timeit import default_timer
+
+import logbook
+
+from rqalpha.environment import Environment
+from rqalpha.utils import RqAttrDict
+from rqalpha.utils.logger import system_log
+
+from rqalpha_mod_vnpy.backends import select_backend
+from rqalpha_mod_vnpy import synthetic
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+def measure(func, payloads):
+    """
+    逐笔计时，返回吞吐及耗时分位数（微秒）。
+    """
+    timer = default_timer
+    latencies = []
+    append = latencies.append
+    start = timer()
+    for payload in payloads:
+        t = timer()
+        func(payload)
+        append(timer() - t)
+    elapsed = timer() - start
+    latencies.sort()
+    return {
+        'count': len(payloads),
+        'ops_per_sec': len(payloads) / elapsed if elapsed else 0.,
+        'p50_us': percentile(latencies, .5) * 1e6,
+        'p99_us': percentile(latencies, .99) * 1e6,
+        'max_us': latencies[-1] * 1e6 if latencies else 0.,
+    }
+
+
+class BenchInstrument(object):
+    def __init__(self, ins_dict):
+        self.order_book_id = ins_dict.order_book_id
+        self.contract_multiplier = ins_dict.contract_multiplier
+        self.type = 'Future'
+        self.de_listed_date = datetime.max
+
+
+class BenchDataProxy(object):
+    """
+    由合约缓存提供合约及保证金数据，代替依赖数据包的 DataProxy。
+    """
+    def __init__(self, cache):
+        self._cache = cache
+
+    def instruments(self, order_book_id):
+        return BenchInstrument(self._cache.ins[order_book_id])
+
+    def get_margin_info(self, order_book_id):
+        ins_dict = self._cache.ins[order_book_id]
+        return {'long_margin_ratio': ins_dict.long_margin_ratio, 'short_margin_ratio': ins_dict.short_margin_ratio}
+
+    def get_trading_dates(self, start_date, end_date):
+        return []
+
+
+class BenchPriceBoard(object):
+    def __init__(self, cache):
+        self._cache = cache
+
+    def get_last_price(self, order_book_id):
+        tick = self._cache.snapshot.get(order_book_id)
+        return float('nan') if tick is None else tick.last
+
+
+class BenchBroker(object):
+    def __init__(self, gateway):
+        self._gateway = gateway
+
+    def get_open_orders(self, order_book_id=None):
+        return [o for o in self._gateway.open_orders if order_book_id is None or o.order_book_id == order_book_id]
+
+
+def make_env():
+    config = RqAttrDict({'base': {
+        'start_date': date.today(),
+        'future_starting_cash': 1000000.,
+        'margin_multiplier': 1,
+    }})
+    env = Environment(config)
+    env.calendar_dt = env.trading_dt = datetime.now()
+    return env
+
+
+def make_gateway(env, instruments):
+    from rqalpha_mod_vnpy.ctp.data_cache import DataCache
+    from rqalpha_mod_vnpy.ctp.data_dict import InstrumentDict, AccountDict, CommissionDict
+    from rqalpha_mod_vnpy.ctp.gateway import CtpGateway
+    from rqalpha_mod_vnpy.ctp.api import CtpTdApi
+
+    cache = DataCache()
+    gateway = CtpGateway(env, cache, './vnpy_temp', 'bench', 'bench', '9999')
+    gateway.td_api = CtpTdApi(gateway, './vnpy_temp', 'bench', 'bench', '9999', None, None, None)
+    gateway.td_api.front_id = 1
+    gateway.td_api.session_id = 1
+
+    ins_cache = {}
+    for instrument_id in instruments:
+        ins_dict = InstrumentDict({'InstrumentID': instrument_id, 'ExchangeID': 'SHFE', 'VolumeMultiple': 10,
+                                   'LongMarginRatio': .1, 'ShortMarginRatio': .1})
+        ins_cache[ins_dict.order_book_id] = ins_dict
+    cache.cache_ins(ins_cache)
+    for instrument_id in instruments:
+        commission_dict = CommissionDict({
+            'InstrumentID': instrument_id, 'OpenRatioByMoney': .0001, 'CloseRatioByMoney': .0001,
+            'CloseTodayRatioByMoney': .0001, 'OpenRatioByVolume': 0., 'CloseRatioByVolume': 0.,
+            'CloseTodayRatioByVolume': 0.})
+        cache.cache_commission(commission_dict.underlying_symbol, commission_dict)
+    cache.cache_account(AccountDict({'PreBalance': 1000000.}))
+    cache.cache_position({})
+    cache.cache_qry_order({})
+    gateway._data_update_date = date.today()
+    gateway.subscribed = list(ins_cache.keys())
+
+    env.data_proxy = BenchDataProxy(cache)
+    env.price_board = BenchPriceBoard(cache)
+    env.broker = BenchBroker(gateway)
+    env.portfolio = gateway.get_portfolio()
+    return gateway
+
+
+def make_position_dicts(instruments, prices):
+    from rqalpha_mod_vnpy.ctp.data_dict import PositionDict
+    pos_dicts = {}
+    for instrument_id in instruments:
+        price = prices[instrument_id]
+        pos_dict = PositionDict({
+            'InstrumentID': instrument_id, 'PosiDirection': synthetic.defineDict['THOST_FTDC_PD_Long'],
+            'YdPosition': 2, 'TodayPosition': 0, 'Position': 2, 'Commission': 0., 'CloseProfit': 0.,
+            'OpenCost': price * 20, 'PreSettlementPrice': price})
+        pos_dicts[pos_dict.order_book_id] = pos_dict
+    return pos_dicts
+
+
+def bench_codecs(results, n_messages):
+    from rqalpha_mod_vnpy.ctp.data_dict import (TickDict, OrderDict, TradeDict, PositionDict, InstrumentDict,
+                                                CommissionDict, AccountDict)
+
+    market = synthetic.SyntheticMarket()
+    ids = market.instrument_ids
+    define = synthetic.defineDict
+    orders, trades = make_td_payloads(market, n_messages // 2 + 1)
+    exchanges = ('SHFE', 'DCE', 'CZCE', 'CFFEX', 'INE')
+    for i, (order, trade) in enumerate(zip(orders, trades)):
+        order['ExchangeID'] = trade['ExchangeID'] = exchanges[i % len(exchanges)]
+        order['CombOffsetFlag'] = trade['OffsetFlag'] = define[('THOST_FTDC_OF_Open', 'THOST_FTDC_OF_Close',
+                                                                'THOST_FTDC_OF_CloseToday')[i % 3]]
+    positions = [{
+        'InstrumentID': ids[i % len(ids)], 'PosiDirection': define[('THOST_FTDC_PD_Long', 'THOST_FTDC_PD_Short')[i % 2]],
+        'YdPosition': i % 3, 'TodayPosition': i % 2, 'Position': i % 3 + i % 2, 'Commission': 1., 'CloseProfit': 0.,
+        'OpenCost': 10000., 'PreSettlementPrice': 1000.,
+    } for i in range(n_messages)]
+    instruments = [{
+        'InstrumentID': ids[i % len(ids)] if i % 4 else 'SP a1901&a1905', 'ExchangeID': 'SHFE', 'VolumeMultiple': 10,
+        'LongMarginRatio': .1, 'ShortMarginRatio': .1,
+    } for i in range(n_messages)]
+    commissions = [{
+        'InstrumentID': ids[i % len(ids)], 'OpenRatioByMoney': .0001 * (i % 2), 'CloseRatioByMoney': .0001 * (i % 2),
+        'CloseTodayRatioByMoney': 0., 'OpenRatioByVolume': 2. * (1 - i % 2), 'CloseRatioByVolume': 2. * (1 - i % 2),
+        'CloseTodayRatioByVolume': 0.,
+    } for i in range(n_messages)]
+
+    results['codec.tick'] = measure(TickDict, [market.next_tick(ids[i % len(ids)]) for i in range(n_messages)])
+    results['codec.order'] = measure(OrderDict, orders[:n_messages])
+    results['codec.trade'] = measure(TradeDict, trades[:n_messages])
+    results['codec.position'] = measure(PositionDict, positions)
+    results['codec.instrument'] = measure(InstrumentDict, instruments)
+    results['codec.commission'] = measure(CommissionDict, commissions)
+    results['codec.account'] = measure(AccountDict, [{'PreBalance': 1000000.}] * n_messages)
+
+
+def bench_md(results, n_ticks, n_instruments):
+    from rqalpha_mod_vnpy.ctp.data_dict import TickDict
+    from rqalpha_mod_vnpy.ctp.api import CtpMdApi
+    from rqalpha_mod_vnpy.history import BarHistory
+    from rqalpha_mod_vnpy.ctp.profiling import CallbackProfiler
+
+    market = synthetic.SyntheticMarket()
+    ids = market.instrument_ids
+    payloads = [market.next_tick(ids[i % len(ids)]) for i in range(n_ticks)]
+
+    env = make_env()
+    gateway = make_gateway(env, ids)
+    gateway.add_tick_hook(BarHistory(['1m']).on_tick)
+    md_api = CtpMdApi(gateway, './vnpy_temp', 'bench', 'bench', '9999', None)
+
+    results['md.parse'] = measure(TickDict, payloads)
+
+    ticks = [TickDict(data) for data in payloads]
+    results['md.on_tick'] = measure(gateway.on_tick, ticks)
+    gateway.multiplexer.clear()
+
+    results['md.callback'] = measure(md_api.onRtnDepthMarketData, payloads)
+    gateway.multiplexer.clear()
+
+    profiled_md_api = CallbackProfiler().profiled(CtpMdApi)(gateway, './vnpy_temp', 'bench', 'bench', '9999', None)
+    results['md.callback.profiled'] = measure(profiled_md_api.onRtnDepthMarketData, payloads)
+    return env, gateway
+
+
+def make_event_source(env, gateway):
+    # events() 启动的时段判断线程在 all_day 下持续运行，使用事件源的测试项放在最后执行以免影响其他测试项
+    from rqalpha_mod_vnpy.vnpy_event_source import VNPYEventSource, TimePeriod
+
+    event_source = VNPYEventSource(env, RqAttrDict({'all_day': True}), gateway)
+    event_source._before_trading_processed = True
+    event_source._time_period = TimePeriod.TRADING
+    return event_source.events(date.today(), date.today(), 'tick')
+
+
+def bench_events(results, env, gateway):
+    n = gateway.multiplexer.qsize()
+    events = make_event_source(env, gateway)
+    results['md.events'] = measure(lambda _: next(events), range(n))
+
+
+def make_td_payloads(market, n_orders):
+    ids = market.instrument_ids
+    define = synthetic.defineDict
+    orders = []
+    trades = []
+    for i in range(n_orders):
+        instrument_id = ids[i % len(ids)]
+        order = {
+            'InstrumentID': instrument_id, 'ExchangeID': 'SHFE', 'OrderRef': str(i + 1), 'FrontID': 1,
+            'SessionID': 1, 'OrderSysID': str(i + 1), 'Direction': define['THOST_FTDC_D_Buy'],
+            'CombOffsetFlag': define['THOST_FTDC_OF_Open'], 'LimitPrice': market.prices[instrument_id],
+            'VolumeTotalOriginal': 1, 'VolumeTraded': 0, 'OrderStatus': define['THOST_FTDC_OST_NoTradeQueueing'],
+        }
+        orders.append(order)
+        filled = dict(order, VolumeTraded=1, OrderStatus=define['THOST_FTDC_OST_AllTraded'])
+        orders.append(filled)
+        trades.append({
+            'InstrumentID': instrument_id, 'ExchangeID': 'SHFE', 'OrderRef': str(i + 1), 'OrderSysID': str(i + 1),
+            'TradeID': str(i + 1), 'Direction': define['THOST_FTDC_D_Buy'],
+            'OffsetFlag': define['THOST_FTDC_OF_Open'], 'Price': market.prices[instrument_id], 'Volume': 1,
+        })
+    return orders, trades
+
+
+def drain(multiplexer):
+    items = []
+    while multiplexer.qsize():
+        items.append(multiplexer.get(0)[1])
+    return items
+
+
+def bench_td(results, n_orders, n_instruments):
+    market = synthetic.SyntheticMarket()
+    env = make_env()
+    gateway = make_gateway(env, market.instrument_ids)
+    td_api = gateway.td_api
+    orders, trades = make_td_payloads(market, n_orders)
+
+    def process(item):
+        handler, data = item
+        handler(data)
+
+    results['td.on_order'] = measure(td_api.onRtnOrder, orders)
+    results['td.process_order'] = measure(process, drain(gateway.multiplexer))
+    results['td.on_trade'] = measure(td_api.onRtnTrade, trades)
+    results['td.process_trade'] = measure(process, drain(gateway.multiplexer))
+
+
+def bench_fill_latency(results, n_fills, backlog):
+    from rqalpha.events import EVENT
+    from rqalpha_mod_vnpy.ctp.data_dict import TickDict
+
+    market = synthetic.SyntheticMarket()
+    ids = market.instrument_ids
+    env = make_env()
+    gateway = make_gateway(env, ids)
+    _, trades = make_td_payloads(market, n_fills)
+    ticks = [TickDict(market.next_tick(ids[i % len(ids)])) for i in range(backlog)]
+    events = make_event_source(env, gateway)
+
+    filled = []
+    env.event_bus.add_listener(EVENT.TRADE, lambda event: filled.append(default_timer()))
+
+    latencies = []
+    for trade in trades:
+        gateway.multiplexer.clear()
+        for tick in ticks:
+            gateway.on_tick(tick)
+        start = default_timer()
+        gateway.td_api.onRtnTrade(trade)
+        while len(filled) <= len(latencies):
+            next(events)
+        latencies.append(filled[-1] - start)
+    latencies.sort()
+    results['td.fill_latency'] = {
+        'count': len(latencies),
+        'ops_per_sec': len(latencies) / sum(latencies) if latencies else 0.,
+        'p50_us': percentile(latencies, .5) * 1e6,
+        'p99_us': percentile(latencies, .99) * 1e6,
+        'max_us': latencies[-1] * 1e6 if latencies else 0.,
+    }
+
+
+def bench_portfolio(results, position_counts, reads):
+    from rqalpha_mod_vnpy.ctp.data_dict import TickDict
+
+    for n_positions in position_counts:
+        synthetic.configure(instruments=n_positions, seed=1)
+        market = synthetic.SyntheticMarket()
+        ids = market.instrument_ids
+        env = make_env()
+        gateway = make_gateway(env, ids)
+        cache = gateway._cache
+        cache.cache_position(make_position_dicts(ids, market.prices))
+        ticks = [TickDict(market.next_tick(ids[i % len(ids)])) for i in range(reads)]
+        for tick in ticks[:len(ids)]:
+            cache.cache_snapshot(tick)
+
+        def read(_):
+            portfolio = gateway.get_portfolio()
+            return portfolio.total_value
+
+        def tick_read(tick):
+            cache.cache_snapshot(tick)
+            return gateway.get_portfolio().total_value
+
+        def resync_read(_):
+            cache.cache_account(cache._account_dict)
+            return gateway.get_portfolio().total_value
+
+        read(None)
+        results['portfolio.read[%d]' % n_positions] = measure(read, range(reads))
+        results['portfolio.tick_read[%d]' % n_positions] = measure(tick_read, ticks)
+        results['portfolio.resync_read[%d]' % n_positions] = measure(resync_read, range(max(reads // 100, 10)))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+# (字段, 数值越大越好)，吞吐下降或耗时上升超过阈值均判定为性能下降
+COMPARED_FIELDS = (
+    ('ops_per_sec', True),
+    ('p50_us', False),
+    ('p99_us', False),
+    ('max_us', False),
+)
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print('%-44s %14s %14s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for field, higher_is_better in COMPARED_FIELDS:
+            if field not in results[name] or field not in baseline[name]:
+                continue
+            old, new = baseline[name][field], results[name][field]
+            change = new / old - 1 if old else 0.
+            print('%-44s %14.1f %14.1f %+7.1f%%' % ('%s.%s' % (name, field), old, new, change * 100))
+            if (change < -threshold) if higher_is_better else (change > threshold):
+                regressions.append('%s.%s' % (name, field))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--instruments', type=int, default=50)
+    parser.add_argument('--positions', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20000, help='codec.* 每类回报的笔数')
+    parser.add_argument('--fills', type=int, default=200)
+    parser.add_argument('--backlog', type=int, default=1000, help='测试成交延迟时事件队列中积压的行情笔数')
+    parser.add_argument('--output', help='结果写入的 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--compare', help='与此前输出的 JSON 文件比较')
+    parser.add_argument('--threshold', type=float, default=.1, help='判定为性能下降的吞吐下降或耗时上升比例')
+    args = parser.parse_args()
+
+    # 与实盘相同，不输出 debug 日志
+    system_log.level = logbook.INFO
+    select_backend('SYNTHETIC', None)
+    synthetic.configure(instruments=args.instruments, seed=1)
+
+    results = {}
+    bench_codecs(results, args.messages)
+    env, gateway = bench_md(results, args.ticks, args.instruments)
+    bench_td(results, args.orders, args.instruments)
+    bench_portfolio(results, args.positions, args.reads)
+    bench_events(results, env, gateway)
+    bench_fill_latency(results, args.fills, args.backlog)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': vars(args),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('性能下降: %s' % ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
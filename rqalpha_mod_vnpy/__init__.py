@@ -21,8 +21,56 @@ __config__ = {
     "vn_trader_path": None,
     "all_day": True,
     "query_interval": 2,
+    "order_rate_limit": 6,
+    "cancel_rate_limit": 6,
+    "split_close_orders": True,
+    "dominant_switch_ratio": 1.1,
     "default_data_source": True,
     "temp_path": "./vnpy_temp",
+    "history_frequencies": ["1m"],
+    "history_cache_size": 256,
+    "lazy_bundle": True,
+    "risk": {
+        "max_net_position": None,
+        "max_gross_position": None,
+        "max_outstanding_volume": None,
+        "max_orders_per_second": None,
+        "max_cancel_ratio": None,
+    },
+    "topic_mode": {
+        "private": "RESTART",
+        "public": "RESTART",
+    },
+    "wal": {
+        "enabled": False,
+        "sync_interval": 0.05,
+    },
+    "paper_trading": {
+        "enabled": False,
+        "latency": 0.05,
+        "queue_position": True,
+    },
+    "metrics": {
+        "enabled": False,
+        "host": "127.0.0.1",
+        "port": 9108,
+        "file": None,
+        "interval": 15,
+    },
+    "hot_path_journal": {
+        "path": None,
+    },
+    "callback_profiling": {
+        "enabled": False,
+        "report_interval": 300,
+    },
+    "synthetic": {
+        "tick_rate": 100,
+        "instruments": 20,
+        "starting_cash": 1000000,
+        "seed": None,
+    },
+    "accounts": {},
     "CTP": {
         'userID': None,
         'password': None,
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rqalpha.api.api_base import export_as_api
+from rqalpha.environment import Environment
+
+
+@export_as_api
+def switch_account(name):
+    """
+    此后的下单发往名为 name 的账户，默认账户名为 default。
+
+    :param str name: 账户名
+    """
+    Environment.get_instance().broker.select_account(name)
+
+
+@export_as_api
+def get_account_portfolio(name):
+    """
+    获取名为 name 的账户的 portfolio，默认账户的 portfolio 即 context.portfolio。
+
+    :param str name: 账户名
+    """
+    return Environment.get_instance().broker.get_account_portfolio(name)
+
+
+@export_as_api
+def schedule_timer(func, interval=None, at=None, repeat=True):
+    """
+    注册定时器，到期时以 func(context) 调用，返回定时器 id。定时器只在交易时段内触发，与行情在同一线程中依次处理。
+
+    :param func: 回调函数
+    :param float interval: 每隔 interval 秒触发一次
+    :param at: 每天到达 at 时刻（"HH:MM[:SS]" 或 datetime.time）时触发，与 interval 二选一
+    :param bool repeat: 为 False 时只触发一次
+    """
+    return Environment.get_instance().event_source.schedule_timer(func, interval, at, repeat)
+
+
+@export_as_api
+def cancel_timer(timer_id):
+    """
+    取消 :func:`schedule_timer` 注册的定时器，定时器存在时返回 True。
+
+    :param int timer_id: 定时器 id
+    """
+    return Environment.get_instance().event_source.cancel_timer(timer_id)
+
+
+@export_as_api
+def get_dominant_contract(underlying_symbol):
+    """
+    获取品种当前的主力合约，由盘中行情的持仓量确定，尚未收到该品种的行情时返回 None。
+    主力合约切换时发出 VNPY_EVENT.DOMINANT_CHANGED 事件。
+
+    :param str underlying_symbol: 品种，例如 'RB'
+    """
+    return Environment.get_instance().data_source.get_dominant_contract(underlying_symbol)
+
+
+@export_as_api
+def get_underlying_contracts(underlying_symbol):
+    """
+    获取柜台返回的某品种的全部合约，按到期日先后排列。
+
+    :param str underlying_symbol: 品种，例如 'RB'
+    """
+    return Environment.get_instance().data_source.get_underlying_contracts(underlying_symbol)
+
+
+@export_as_api
+def get_exchange_underlyings(exchange_id=None):
+    """
+    获取某交易所的全部品种，exchange_id 为 None 时返回所有交易所的品种。
+
+    :param str exchange_id: 交易所代码，例如 'SHFE'
+    """
+    return Environment.get_instance().data_source.get_exchange_underlyings(exchange_id)
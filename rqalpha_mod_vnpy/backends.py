@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+接口后端注册表。
+
+后端为一个函数，接收 mod 配置，返回 ``(MdApi, TdApi, defineDict)``。``gateway_type`` 在此注册表中查找，
+由 ``rqalpha_mod_vnpy.vnpy`` 在首次导入时加载，可以通过 :func:`register_backend` 注册新的后端。
+"""
+
+import os
+import sys
+
+
+_backends = {}
+_selected = {'name': 'CTP', 'config': None}
+
+
+def register_backend(name, loader):
+    _backends[name.upper()] = loader
+
+
+def select_backend(name, mod_config):
+    name = name.upper()
+    if name not in _backends:
+        raise RuntimeError('未知的 gateway_type: {}，可选: {}'.format(name, ', '.join(sorted(_backends))))
+    _selected['name'] = name
+    _selected['config'] = mod_config
+
+
+def load_backend():
+    return _backends[_selected['name']](_selected['config'])
+
+
+def load_ctp(mod_config):
+    # 未经 select_backend 选择（如在 mod 启动之前直接导入 ctp 模块）或未设置 vn_trader_path 时，
+    # 从 sys.path 中导入 vn.py 的 CTP 封装
+    if mod_config is not None and mod_config.vn_trader_path is not None:
+        sys.path.append(os.path.join(mod_config.vn_trader_path, 'gateway/ctpGateway'))
+
+    from vnctpmd import MdApi
+    from vnctptd import TdApi
+    from ctpDataType import defineDict
+    return MdApi, TdApi, defineDict
+
+
+def load_synthetic(mod_config):
+    from . import synthetic
+    if mod_config is not None:
+        synthetic.configure(**dict(mod_config.synthetic.items()))
+    return synthetic.MdApi, synthetic.TdApi, synthetic.defineDict
+
+
+register_backend('CTP', load_ctp)
+register_backend('SYNTHETIC', load_synthetic)
@@ -18,7 +18,10 @@ from functools import wraps
 import os
 from rqalpha.const import ORDER_TYPE, SIDE, POSITION_EFFECT
 
-from .data_dict import TickDict, PositionDict, AccountDict, InstrumentDict, OrderDict, TradeDict, CommissionDict
+from .data_dict import TickDict, PositionDict, PositionDetailDict, AccountDict, InstrumentDict, OrderDict, TradeDict, \
+    CommissionDict
+from .request_queue import RequestQueue
+from .flow_index import FlowIndex, TOPIC_MODES
 
 from ..vnpy import *
 from ..utils import make_order_book_id
@@ -72,12 +75,14 @@ class CtpMdApi(MdApi):
     def onFrontConnected(self):
         """服务器连接"""
         self.connected = True
+        self.gateway.on_front_connected('md')
         self.login()
 
     def onFrontDisconnected(self, n):
         """服务器断开"""
         self.connected = False
         self.logged_in = False
+        self.gateway.on_front_disconnected('md', n)
 
     def onHeartBeatWarning(self, n):
         """心跳报警"""
@@ -114,6 +119,8 @@ class CtpMdApi(MdApi):
         tick_dict = TickDict(data)
         if tick_dict.is_valid:
             self.gateway.on_tick(tick_dict)
+        else:
+            self.gateway.on_tick_dropped()
 
     def onRspSubForQuoteRsp(self, data, error, n, last):
         """订阅期权询价"""
@@ -166,7 +173,8 @@ class CtpMdApi(MdApi):
 
 class CtpTdApi(TdApi):
 
-    def __init__(self, gateway, temp_path, user_id, password, broker_id, address, auth_code, user_production_info, api_name='ctp_td'):
+    def __init__(self, gateway, temp_path, user_id, password, broker_id, address, auth_code, user_production_info,
+                 api_name='ctp_td', order_rate=None, cancel_rate=None):
         super(CtpTdApi, self).__init__()
 
         self.gateway = gateway
@@ -190,14 +198,21 @@ class CtpTdApi(TdApi):
         self.require_authentication = False
 
         self.pos_cache = {}
+        self.pos_detail_cache = []
         self.ins_cache = {}
         self.order_cache = {}
 
         self.api_name = api_name
+        self.request_queue = RequestQueue(api_name, order_rate, cancel_rate)
+
+        self.private_topic = TOPIC_MODES['RESTART']
+        self.public_topic = TOPIC_MODES['RESTART']
+        self.flow_index = FlowIndex()
 
     def onFrontConnected(self):
         """服务器连接"""
         self.connected = True
+        self.gateway.on_front_connected('td')
         if self.require_authentication:
             self.authenticate()
         else:
@@ -207,6 +222,7 @@ class CtpTdApi(TdApi):
         """服务器断开"""
         self.connected = False
         self.logged_in = False
+        self.gateway.on_front_disconnected('td', n)
 
     def onHeartBeatWarning(self, n):
         """心跳报警"""
@@ -223,8 +239,8 @@ class CtpTdApi(TdApi):
     def onRspUserLogin(self, data, error, n, last):
         """登陆回报"""
         if error['ErrorID'] == 0:
-            self.front_id = str(data['FrontID'])
-            self.session_id = str(data['SessionID'])
+            self.front_id = data['FrontID']
+            self.session_id = data['SessionID']
             self.logged_in = True
             self.qrySettlementInfoConfirm()
         else:
@@ -249,6 +265,7 @@ class CtpTdApi(TdApi):
         """发单错误（柜台）"""
         order_dict = OrderDict(data, rejected=True)
         if order_dict.is_valid:
+            self._fill_session(order_dict)
             self.gateway.on_order(order_dict)
 
     def onRspParkedOrderInsert(self, data, error, n, last):
@@ -312,7 +329,7 @@ class CtpTdApi(TdApi):
         """报单回报"""
         order_dict = OrderDict(data)
         if order_dict.is_valid:
-            self.order_cache[order_dict.order_id] = order_dict
+            self.order_cache[(order_dict.front_id, order_dict.session_id, order_dict.order_ref)] = order_dict
         if last:
             return self.order_cache
 
@@ -385,9 +402,14 @@ class CtpTdApi(TdApi):
         """"""
         pass
 
-    def onRspQryInvestorPositionDetail(self, data, error, n, last):
-        """"""
-        pass
+    @query_in_sync
+    def onRspQryInvestorPositionDetail(self, data, last):
+        """持仓明细查询回报"""
+        detail_dict = PositionDetailDict(data)
+        if detail_dict.is_valid:
+            self.pos_detail_cache.append(detail_dict)
+        if last:
+            return self.pos_detail_cache
 
     def onRspQryNotice(self, data, error, n, last):
         """"""
@@ -495,14 +517,20 @@ class CtpTdApi(TdApi):
 
     def onRtnOrder(self, data):
         """报单回报"""
+        flow_key = self.flow_index.add_order(data)
+        if flow_key is None:
+            return
         order_dict = OrderDict(data)
         if order_dict.is_valid:
-            self.gateway.on_order(order_dict)
+            self.gateway.on_order(order_dict, flow_key)
 
     def onRtnTrade(self, data):
         """成交回报"""
+        flow_key = self.flow_index.add_trade(data)
+        if flow_key is None:
+            return
         trade_dict = TradeDict(data)
-        self.gateway.on_trade(trade_dict)
+        self.gateway.on_trade(trade_dict, flow_key)
 
     def onErrRtnOrderInsert(self, data, error):
         """发单错误回报（交易所）"""
@@ -510,6 +538,7 @@ class CtpTdApi(TdApi):
         self.gateway.on_err(error)
         order_dict = OrderDict(data, rejected=True)
         if order_dict.is_valid:
+            self._fill_session(order_dict)
             self.gateway.on_order(order_dict)
 
     def onErrRtnOrderAction(self, data, error):
@@ -698,12 +727,13 @@ class CtpTdApi(TdApi):
 
     def connect(self):
         """初始化连接"""
+        self.request_queue.start()
         if not self.connected:
             if not os.path.exists(self.temp_path):
                 os.makedirs(self.temp_path)
             self.createFtdcTraderApi(self.temp_path)
-            self.subscribePrivateTopic(0)
-            self.subscribePublicTopic(0)
+            self.subscribePrivateTopic(self.private_topic)
+            self.subscribePublicTopic(self.public_topic)
             self.registerFront(self.address)
             self.init()
         else:
@@ -785,6 +815,17 @@ class CtpTdApi(TdApi):
         self.reqQryInvestorPosition(req, self.req_id)
         return self.req_id
 
+    def qryPositionDetail(self):
+        """查询持仓明细"""
+        self.pos_detail_cache = []
+        self.req_id += 1
+        req = {
+            'BrokerID': self.broker_id,
+            'InvestorID': self.user_id,
+        }
+        self.reqQryInvestorPositionDetail(req, self.req_id)
+        return self.req_id
+
     def qryOrder(self):
         """订单查询"""
         self.order_cache = {}
@@ -826,7 +867,7 @@ class CtpTdApi(TdApi):
         }
 
         self.req_id += 1
-        self.reqOrderInsert(req, self.req_id)
+        self.request_queue.put_order(self.reqOrderInsert, req, self.req_id)
         return self.req_id
 
     def cancelOrder(self, order):
@@ -835,22 +876,35 @@ class CtpTdApi(TdApi):
         if ins_dict is None:
             return None
 
+        key = self.gateway.get_order_key(order)
+        if key is None:
+            key = (self.front_id, self.session_id, str(order.order_id))
+        front_id, session_id, order_ref = key
+
         self.req_id += 1
         req = {
             'InstrumentID': ins_dict.instrument_id,
             'ExchangeID': ins_dict.exchange_id,
-            'OrderRef': str(order.order_id),
-            'FrontID': int(self.front_id),
-            'SessionID': int(self.session_id),
+            'OrderRef': order_ref,
+            'FrontID': front_id,
+            'SessionID': session_id,
 
             'ActionFlag': defineDict['THOST_FTDC_AF_Delete'],
             'BrokerID': self.broker_id,
             'InvestorID': self.user_id,
         }
 
-        self.reqOrderAction(req, self.req_id)
+        self.request_queue.put_cancel(self.reqOrderAction, req, self.req_id)
         return self.req_id
 
+    def _fill_session(self, order_dict):
+        # 报单录入的错误回报中不含 FrontID 及 SessionID，均来自本会话
+        if order_dict.front_id is None:
+            order_dict.front_id = self.front_id
+            order_dict.session_id = self.session_id
+
     def close(self):
         """关闭"""
+        self.request_queue.stop()
         self.exit()
+        self.flow_index.close()
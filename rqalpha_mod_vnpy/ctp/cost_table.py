@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import six
+
+from rqalpha.const import SIDE, POSITION_EFFECT, COMMISSION_TYPE
+
+
+EFFECT_INDEX = {
+    POSITION_EFFECT.OPEN: 0,
+    POSITION_EFFECT.CLOSE: 1,
+    POSITION_EFFECT.CLOSE_TODAY: 2,
+}
+
+
+def effect_index(position_effect):
+    # 开平未知（如未指定开平的订单）时按平仓费率计算，与 CTP 对非平今的平仓收取平仓费率一致
+    return EFFECT_INDEX.get(position_effect, 1)
+
+
+class InstrumentCost(object):
+    """
+    单个合约的费用参数。
+
+    手续费率已按收取方式展开为按金额及按手数两组费率，按金额的费率已乘以合约乘数，
+    手续费 = 价格 * 手数 * money_rates[开平] + 手数 * volume_rates[开平]，
+    保证金 = 价格 * 手数 * 合约乘数 * 多头或空头保证金率。
+    """
+    __slots__ = ('order_book_id', 'slot', 'contract_multiplier', 'long_margin_ratio', 'short_margin_ratio',
+                 'money_rates', 'volume_rates', 'future_info')
+
+    def __init__(self, order_book_id, slot, contract_multiplier, long_margin_ratio, short_margin_ratio, future_info):
+        self.order_book_id = order_book_id
+        self.slot = slot
+        self.contract_multiplier = contract_multiplier
+        self.long_margin_ratio = long_margin_ratio
+        self.short_margin_ratio = short_margin_ratio
+        self.money_rates = (0., 0., 0.)
+        self.volume_rates = (0., 0., 0.)
+        self.future_info = future_info
+
+    def set_commission(self, info):
+        ratios = (info.get('open_commission_ratio') or 0., info.get('close_commission_ratio') or 0.,
+                  info.get('close_commission_today_ratio') or 0.)
+        if info.get('commission_type') == COMMISSION_TYPE.BY_MONEY:
+            self.money_rates = tuple(r * self.contract_multiplier for r in ratios)
+            self.volume_rates = (0., 0., 0.)
+        else:
+            self.money_rates = (0., 0., 0.)
+            self.volume_rates = ratios
+
+    def commission(self, price, quantity, position_effect):
+        i = effect_index(position_effect)
+        return price * quantity * self.money_rates[i] + quantity * self.volume_rates[i]
+
+    def margin(self, price, quantity, side):
+        margin_ratio = self.long_margin_ratio if side == SIDE.BUY else self.short_margin_ratio
+        return price * quantity * self.contract_multiplier * margin_ratio
+
+
+class CostTable(object):
+    """
+    合约费用表，在合约及手续费数据返回时构建，成交时直接查表计算手续费。
+
+    同时以合约槽位为行维护费率数组，供 :meth:`batch_commission` 对整批成交向量化计算手续费。
+    """
+    def __init__(self):
+        self._costs = {}
+        self._by_underlying = {}
+        self._money_rates = np.zeros((0, 3))
+        self._volume_rates = np.zeros((0, 3))
+
+    def build(self, ins_cache, future_info_cache):
+        costs = {}
+        by_underlying = {}
+        for order_book_id, ins_dict in six.iteritems(ins_cache):
+            cost = InstrumentCost(order_book_id, len(costs), ins_dict.contract_multiplier,
+                                  ins_dict.long_margin_ratio, ins_dict.short_margin_ratio,
+                                  future_info_cache.get(ins_dict.underlying_symbol, {}))
+            cost.set_commission(cost.future_info.get('speculation', {}))
+            costs[order_book_id] = cost
+            by_underlying.setdefault(ins_dict.underlying_symbol, []).append(cost)
+        self._money_rates = np.zeros((len(costs), 3))
+        self._volume_rates = np.zeros((len(costs), 3))
+        for cost in six.itervalues(costs):
+            self._set_rates(cost)
+        self._by_underlying = by_underlying
+        self._costs = costs
+
+    def update_commission(self, underlying_symbol, info):
+        for cost in self._by_underlying.get(underlying_symbol, ()):
+            cost.set_commission(info)
+            self._set_rates(cost)
+
+    def _set_rates(self, cost):
+        self._money_rates[cost.slot] = cost.money_rates
+        self._volume_rates[cost.slot] = cost.volume_rates
+
+    def get(self, order_book_id):
+        return self._costs.get(order_book_id)
+
+    def commission(self, order_book_id, price, quantity, position_effect):
+        cost = self._costs.get(order_book_id)
+        if cost is None:
+            return 0.
+        return cost.commission(price, quantity, position_effect)
+
+    def margin(self, order_book_id, price, quantity, side):
+        """
+        按合约查询回报中的多头或空头保证金率计算保证金，未乘以保证金倍数，费用表中没有的合约保证金为 0。
+        """
+        cost = self._costs.get(order_book_id)
+        if cost is None:
+            return 0.
+        return cost.margin(price, quantity, side)
+
+    def batch_commission(self, order_book_ids, prices, quantities, position_effects):
+        """
+        批量计算手续费，返回与输入等长的数组，费用表中没有的合约手续费为 0。
+        """
+        costs = self._costs
+        slots = np.array([costs[o].slot if o in costs else -1 for o in order_book_ids], dtype=np.int64)
+        effects = np.array([effect_index(e) for e in position_effects], dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        quantities = np.asarray(quantities, dtype=np.float64)
+
+        known = slots >= 0
+        commissions = np.zeros(len(slots))
+        money_rates = self._money_rates[slots[known], effects[known]]
+        volume_rates = self._volume_rates[slots[known], effects[known]]
+        commissions[known] = (prices[known] * money_rates + volume_rates) * quantities[known]
+        return commissions
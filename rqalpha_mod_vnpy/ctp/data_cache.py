@@ -1,24 +1,134 @@
+from threading import Lock
+
 import six
 
 from rqalpha.model.position import Positions
 from rqalpha.model.position.future_position import FuturePosition
-from rqalpha.model.account.future_account import FutureAccount, margin_of
 from rqalpha.model.order import Order
+from rqalpha.environment import Environment
 from rqalpha.const import SIDE, POSITION_EFFECT, ORDER_STATUS
 
+from .cost_table import CostTable
+from .instrument_index import InstrumentIndex, DominantTracker
+from .data_dict import CLOSE_TODAY_EXCHANGES
+from .lot_ledger import LotLedger
+from .tick_fields import DerivedTickFields
+from .valuation import ValuationEngine, VNPYFutureAccount, ACCOUNT_EVENT_HANDLERS
 
-class DataCache(object):
+
+class CopyOnWriteDict(object):
+    """
+    写时复制的字典。
+
+    :meth:`set` 及 :meth:`append` 复制整个字典，修改副本后再替换引用；读取方通过 :attr:`current` 的一次引用读取
+    拿到某个版本，该版本此后不会再有任何修改，可以在不加锁的情况下遍历。
+
+    :meth:`store` 只在新增键时复制，更新已有键时直接替换值的引用，适用于每笔行情都写入、读取方只按键查询的快照：
+    已拿到的版本中键不变，遍历不会出错，但值可能是更新后的。写入方之间以锁互斥。值本身应视为不可变对象。
+    """
+    def __init__(self):
+        self._data = {}
+        self._version = 0
+        self._lock = Lock()
+
+    @property
+    def current(self):
+        return self._data
+
+    @property
+    def version(self):
+        return self._version
+
+    def set(self, key, value):
+        with self._lock:
+            data = dict(self._data)
+            data[key] = value
+            self._data = data
+            self._version += 1
+
+    def store(self, key, value):
+        with self._lock:
+            data = self._data
+            if key in data:
+                # 键的集合不变，不必复制；发布的值不会再被修改，读取方拿到的是新值或旧值之一
+                data[key] = value
+                return
+            data = dict(data)
+            data[key] = value
+            self._data = data
+            self._version += 1
+
+    def append(self, key, item):
+        # 值为元组，追加时生成新元组，读取方已拿到的元组不受影响
+        with self._lock:
+            data = dict(self._data)
+            data[key] = data.get(key, ()) + (item, )
+            self._data = data
+            self._version += 1
+
+
+class OrderIndex(object):
+    """
+    订单索引，以 (FrontID, SessionID, OrderRef) 为主键，并以 (ExchangeID, OrderSysID) 为辅助键。
+    """
+    def __init__(self):
+        self._orders = {}
+        self._sys_id_orders = {}
+        self._keys = {}
+
+    def add(self, key, order):
+        self._orders[key] = order
+        self._keys[order.order_id] = key
+
+    def link_sys_id(self, exchange_id, order_sys_id, order):
+        self._sys_id_orders[(exchange_id, order_sys_id)] = order
+
+    def get(self, key):
+        return self._orders.get(key)
+
+    def get_by_sys_id(self, exchange_id, order_sys_id):
+        return self._sys_id_orders.get((exchange_id, order_sys_id))
+
+    def key_of(self, order):
+        return self._keys.get(order.order_id)
+
+
+class SplitOrderIndex(object):
+    """
+    拆分为平今、平昨两笔报单的订单。策略持有的原订单不报往柜台，其状态及成交由各子订单汇总。
+    """
+    def __init__(self):
+        self._parents = {}
+        self._children = {}
+
+    def add(self, parent, children):
+        self._children[parent.order_id] = tuple(children)
+        for child in children:
+            self._parents[child.order_id] = parent
+
+    def parent_of(self, order):
+        return self._parents.get(order.order_id)
+
+    def children_of(self, order):
+        return self._children.get(order.order_id, ())
+
+
+class MarketCache(object):
+    """
+    合约、费率及行情快照等与账户无关的数据，可由多个账户的 :class:`DataCache` 共用。
+    """
     def __init__(self):
         self._ins_cache = {}
         self._future_info_cache = {}
-        self._account_dict = None
-        self._pos_cache = {}
-        self._trade_cache = {}
-        self._qry_order_cache = {}
+        self._cost_table = CostTable()
+        self._snapshot_cache = CopyOnWriteDict()
+        self._price_listeners = []
+        self._tick_fields = DerivedTickFields(self)
+        self._index = InstrumentIndex()
+        self._dominant = DominantTracker()
 
-        self._snapshot_cache = {}
-
-        self._order_cache = {}
+    def add_price_listener(self, listener):
+        self._price_listeners.append(listener)
 
     def cache_ins(self, ins_cache):
         self._ins_cache = ins_cache
@@ -27,6 +137,10 @@ class DataCache(object):
                 'short_margin_ratio': ins_dict.short_margin_ratio,
                 'margin_type': ins_dict.margin_type,
             }} for ins_dict in self._ins_cache.values()}
+        self._cost_table.build(self._ins_cache, self._future_info_cache)
+        self._tick_fields.refresh_multipliers()
+        self._index.build(self._ins_cache)
+        self._dominant.rebuild(self._index.underlying_map)
 
     def cache_commission(self, underlying_symbol, commission_dict):
         self._future_info_cache[underlying_symbol]['speculation'].update({
@@ -35,45 +149,221 @@ class DataCache(object):
             'close_commission_today_ratio': commission_dict.close_today_ratio,
             'commission_type': commission_dict.commission_type,
         })
+        self._cost_table.update_commission(underlying_symbol,
+                                           self._future_info_cache[underlying_symbol]['speculation'])
+
+    def derive_tick(self, tick_dict):
+        self._tick_fields.update(tick_dict)
+
+    def track_dominant(self, tick_dict):
+        return self._dominant.update(tick_dict)
+
+    def cache_snapshot(self, tick_dict):
+        self._snapshot_cache.store(tick_dict.order_book_id, tick_dict)
+        for listener in self._price_listeners:
+            listener(tick_dict.order_book_id, tick_dict.last)
+
+    @property
+    def ins(self):
+        return self._ins_cache
+
+    @property
+    def future_info(self):
+        return self._future_info_cache
+
+    @property
+    def cost_table(self):
+        return self._cost_table
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def dominant(self):
+        return self._dominant
+
+    @property
+    def snapshot(self):
+        return self._snapshot_cache.current
+
+
+class DataCache(object):
+    """
+    单个账户的持仓、订单及成交数据。未传入 market 时自行创建 :class:`MarketCache`。
+    """
+    def __init__(self, market=None):
+        self._market = MarketCache() if market is None else market
+        # 所属网关的名称，由网关设置，传给账户
+        self.account_name = None
+        self._account_dict = None
+        self._pos_cache = {}
+        self._trade_cache = CopyOnWriteDict()
+        self._trade_ids = set()
+        self._qry_order_cache = {}
+
+        self._order_index = OrderIndex()
+        self._split_orders = SplitOrderIndex()
+        self._ledger = LotLedger()
+
+        # 由同步数据构建的账户，此后由账户自身监听的订单及成交事件增量维护，仅在重新同步时重建。
+        # 回调线程只递增 _sync_version，由读取方比较版本后重建，避免两个线程同时写 _account。
+        # 行情及交易回调线程都可能递增版本，递增在 _sync_lock 下进行
+        self._sync_version = 0
+        self._sync_lock = Lock()
+        self._account = None
+        self._account_version = -1
+        self._valuation = ValuationEngine(self)
+        self._market.add_price_listener(self._valuation.set_price)
+
+    @property
+    def market(self):
+        return self._market
+
+    def register_event(self, event_bus):
+        """
+        代替账户注册其监听的事件，只调用一次，事件转发给账户。账户首次同步后才创建，之前收到的事件忽略。
+        """
+        for event_type, handler in ACCOUNT_EVENT_HANDLERS:
+            event_bus.prepend_listener(event_type, self._forward_to_account(handler))
+
+    def _forward_to_account(self, handler):
+        def forward(event):
+            account = self._account
+            if account is not None:
+                return getattr(account, handler)(event)
+        return forward
+
+    def cache_ins(self, ins_cache):
+        self._market.cache_ins(ins_cache)
+
+    def cache_commission(self, underlying_symbol, commission_dict):
+        self._market.cache_commission(underlying_symbol, commission_dict)
+
+    def _invalidate(self):
+        with self._sync_lock:
+            self._sync_version += 1
 
     def cache_position(self, pos_cache):
         self._pos_cache = pos_cache
+        self._invalidate()
 
     def cache_account(self, account_dict):
         self._account_dict = account_dict
+        self._invalidate()
 
     def cache_qry_order(self, order_cache):
         self._qry_order_cache = order_cache
+        self._invalidate()
+
+    def seed_ledger(self, details=None):
+        """
+        由持仓明细建立持仓台账，details 为 None 时改由持仓汇总及当日成交建立。需在持仓及订单同步之后调用，
+        尚未成交的平今、平昨订单据此冻结可平数量。
+        """
+        if details is not None:
+            self._ledger.seed(details)
+        else:
+            self._ledger.seed_positions(self._pos_cache, self.trades)
+        for order_dict in six.itervalues(self._qry_order_cache):
+            if (order_dict.status == ORDER_STATUS.ACTIVE and order_dict.position_effect != POSITION_EFFECT.OPEN and
+                    order_dict.exchange_id in CLOSE_TODAY_EXCHANGES):
+                order = self.get_cached_order(order_dict)
+                self._ledger.reserve(order.order_id, order_dict.order_book_id, order_dict.side,
+                                     order_dict.position_effect, order_dict.unfilled_quantity)
+        self._invalidate()
+
+    def derive_tick(self, tick_dict):
+        self._market.derive_tick(tick_dict)
+
+    def track_dominant(self, tick_dict):
+        return self._market.track_dominant(tick_dict)
 
     def cache_snapshot(self, tick_dict):
-        self._snapshot_cache[tick_dict.order_book_id] = tick_dict
+        self._market.cache_snapshot(tick_dict)
 
     def cache_trade(self, trade_dict):
-        if trade_dict.order_book_id not in self._trade_cache:
-            self._trade_cache[trade_dict.order_book_id] = []
-        self._trade_cache[trade_dict.order_book_id].append(trade_dict)
+        # 同一笔成交可能既来自预写日志又来自私有流的重传
+        if trade_dict.trade_id in self._trade_ids:
+            return False
+        self._trade_ids.add(trade_dict.trade_id)
+        self._trade_cache.append(trade_dict.order_book_id, trade_dict)
+        self._invalidate()
+        return True
 
     def get_cached_order(self, order_dict):
-        try:
-            order = self._order_cache[order_dict.order_id]
-        except KeyError:
+        key = (order_dict.front_id, order_dict.session_id, order_dict.order_ref)
+        order = self._order_index.get(key)
+        if order is None:
             order = Order.__from_create__(order_dict.order_book_id, order_dict.quantity, order_dict.side, order_dict.style, order_dict.position_effect)
-            self.cache_order(order)
+            self._order_index.add(key, order)
+        if order_dict.order_sys_id:
+            self._order_index.link_sys_id(order_dict.exchange_id, order_dict.order_sys_id, order)
+        return order
+
+    def get_order_by_trade(self, trade_dict, front_id, session_id):
+        order = self._order_index.get_by_sys_id(trade_dict.exchange_id, trade_dict.order_sys_id)
+        if order is None:
+            # 成交回报先于带 OrderSysID 的订单回报到达时，按本会话的 OrderRef 查找
+            order = self._order_index.get((front_id, session_id, trade_dict.order_ref))
         return order
 
-    def cache_order(self, order):
-        self._order_cache[order.order_id] = order
+    def cache_order(self, order, front_id, session_id):
+        self._order_index.add((front_id, session_id, str(order.order_id)), order)
+
+    def restore_order(self, key, order_book_id, quantity, side, style, position_effect):
+        # 恢复已报出但尚未收到回报的订单，此后的回报按 key 找到该订单
+        if self._order_index.get(key) is None:
+            self._order_index.add(key, Order.__from_create__(order_book_id, quantity, side, style, position_effect))
+
+    def get_order_key(self, order):
+        return self._order_index.key_of(order)
+
+    def link_split_order(self, parent, children):
+        self._split_orders.add(parent, children)
+
+    def get_split_parent(self, order):
+        return self._split_orders.parent_of(order)
+
+    def get_split_children(self, order):
+        return self._split_orders.children_of(order)
 
     @property
     def ins(self):
-        return self._ins_cache
+        return self._market.ins
 
     @property
     def future_info(self):
-        return self._future_info_cache
+        return self._market.future_info
+
+    @property
+    def cost_table(self):
+        return self._market.cost_table
+
+    @property
+    def pos(self):
+        return self._pos_cache
+
+    @property
+    def ledger(self):
+        return self._ledger
+
+    @property
+    def trades(self):
+        """
+        当日成交，order_book_id -> 按到达先后排列的成交元组。返回的字典此后不会再被修改。
+        """
+        return self._trade_cache.current
 
     @property
-    def positions(self):
+    def account_dict(self):
+        return self._account_dict
+
+    @property
+    def qry_orders(self):
+        return self._qry_order_cache
+
+    def _build_positions(self):
         ps = Positions(FuturePosition)
         for order_book_id, pos_dict in six.iteritems(self._pos_cache):
             position = FuturePosition(order_book_id)
@@ -89,66 +379,46 @@ class DataCache(object):
             position._buy_avg_open_price = pos_dict.buy_avg_open_price
             position._sell_avg_open_price = pos_dict.sell_avg_open_price
 
-            if order_book_id in self._trade_cache:
-                trades = sorted(self._trade_cache[order_book_id], key=lambda t: t.trade_id, reverse=True)
-
-                buy_today_holding_list = []
-                sell_today_holding_list = []
-                for trade_dict in trades:
-                    if trade_dict.side == SIDE.BUY and trade_dict.position_effect == POSITION_EFFECT.OPEN:
-                        buy_today_holding_list.append((trade_dict.price, trade_dict.amount))
-                    elif trade_dict.side == SIDE.SELL and trade_dict.position_effect == POSITION_EFFECT.OPEN:
-                        sell_today_holding_list.append((trade_dict.price, trade_dict.amount))
-
-                self.process_today_holding_list(pos_dict.buy_today_quantity, buy_today_holding_list)
-                self.process_today_holding_list(pos_dict.sell_today_quantity, sell_today_holding_list)
-
-                position._buy_today_holding_list = buy_today_holding_list
-                position._sell_today_holding_list = sell_today_holding_list
+            position._buy_today_holding_list = self._ledger.holding_list(order_book_id, SIDE.BUY)
+            position._sell_today_holding_list = self._ledger.holding_list(order_book_id, SIDE.SELL)
 
             ps[order_book_id] = position
 
         return ps
 
-    def process_today_holding_list(self, today_quantity, holding_list):
-        print(today_quantity, holding_list)
-        # check if list is empty
-        if not holding_list:
-            return
-        cum_quantity = sum(quantity for price, quantity in holding_list)
-        left_quantity = cum_quantity - today_quantity
-        while left_quantity > 0:
-            oldest_price, oldest_quantity = holding_list.pop()
-            if oldest_quantity > left_quantity:
-                consumed_quantity = left_quantity
-                holding_list.append(oldest_price, oldest_quantity - left_quantity)
-            else:
-                consumed_quantity = oldest_quantity
-            left_quantity -= consumed_quantity
-
-    @property
-    def account(self):
+    def _build_account(self, account):
         static_value = self._account_dict.yesterday_portfolio_value
-        ps = self.positions
+        ps = self._build_positions()
         realized_pnl = sum(position.realized_pnl for position in six.itervalues(ps))
         cost = sum(position.transaction_cost for position in six.itervalues(ps))
         margin = sum(position.margin for position in six.itervalues(ps))
         total_cash = static_value + realized_pnl - cost - margin
+        cost_table = self.cost_table
+        frozen_cash = sum(
+            [cost_table.margin(order_dict.order_book_id, order_dict.price, order_dict.unfilled_quantity,
+                               order_dict.side) for order_dict in self._qry_order_cache.values()
+             if order_dict.status == ORDER_STATUS.ACTIVE and order_dict.position_effect == POSITION_EFFECT.OPEN])
+        if frozen_cash:
+            frozen_cash *= Environment.get_instance().config.base.margin_multiplier
+
+        if account is None:
+            account = VNPYFutureAccount(total_cash, ps, self._valuation, register_event=False,
+                                        account_name=self.account_name)
+            account._frozen_cash = frozen_cash
+        else:
+            account.rebuild(total_cash, ps, frozen_cash)
+        return account
 
-        account = FutureAccount(total_cash, ps)
-        account._frozen_cash = sum(
-            [margin_of(order_dict.order_book_id, order_dict.unfilled_quantity, order_dict.price) for order_dict in
-             self._qry_order_cache.values() if order_dict.status == ORDER_STATUS.ACTIVE])
-        return account, static_value
+    @property
+    def account(self):
+        # 账户只创建一次，重新同步后在原对象上重建
+        sync_version = self._sync_version
+        account = self._account
+        if account is None or self._account_version != sync_version:
+            account = self._account = self._build_account(account)
+            self._account_version = sync_version
+        return account, self._account_dict.yesterday_portfolio_value
 
     @property
     def snapshot(self):
-        return self._snapshot_cache
-
-
-class RQObjectCache(object):
-    def __init__(self):
-        self.orders = {}
-
-    def cache_order(self, order):
-        self.orders[order.order_id] = order
+        return self._market.snapshot
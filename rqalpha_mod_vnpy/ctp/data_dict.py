@@ -1,4 +1,7 @@
-import numpy as np
+from datetime import date
+from operator import itemgetter
+
+from six.moves import zip
 
 from rqalpha.const import SIDE, POSITION_EFFECT, ORDER_STATUS, COMMISSION_TYPE, MARGIN_TYPE
 from rqalpha.model.order import LimitOrder
@@ -7,11 +10,179 @@ from ..utils import make_order_book_id, make_underlying_symbol, is_future
 from ..vnpy import *
 
 
+# 以下为 CTP 回报字段的解码表及字段映射，在模块加载时构造一次，解码时只做查表及批量赋值
+
 SIDE_REVERSE = {
     defineDict['THOST_FTDC_D_Buy']: SIDE.BUY,
     defineDict['THOST_FTDC_D_Sell']: SIDE.SELL,
 }
 
+POSI_DIRECTION_REVERSE = {
+    defineDict['THOST_FTDC_PD_Net']: SIDE.BUY,
+    defineDict['THOST_FTDC_PD_Long']: SIDE.BUY,
+    defineDict['THOST_FTDC_PD_Short']: SIDE.SELL,
+}
+
+ORDER_STATUS_REVERSE = {
+    defineDict['THOST_FTDC_OST_PartTradedQueueing']: ORDER_STATUS.ACTIVE,
+    defineDict['THOST_FTDC_OST_NoTradeQueueing']: ORDER_STATUS.ACTIVE,
+    defineDict['THOST_FTDC_OST_AllTraded']: ORDER_STATUS.FILLED,
+    defineDict['THOST_FTDC_OST_Canceled']: ORDER_STATUS.CANCELLED,
+}
+
+EXCHANGES = ('SHFE', 'INE', 'DCE', 'CZCE', 'CFFEX')
+# 区分平今与平昨的交易所
+CLOSE_TODAY_EXCHANGES = ('SHFE', 'INE')
+
+OFFSET_FLAG_OPEN = defineDict['THOST_FTDC_OF_Open']
+OFFSET_FLAG_CLOSE_TODAY = defineDict['THOST_FTDC_OF_CloseToday']
+
+
+def _build_position_effect_reverse():
+    table = {}
+    for exchange_id in EXCHANGES:
+        for name in ('Open', 'Close', 'ForceClose', 'CloseToday', 'CloseYesterday'):
+            flag = defineDict['THOST_FTDC_OF_' + name]
+            if flag == OFFSET_FLAG_OPEN:
+                effect = POSITION_EFFECT.OPEN
+            elif flag == OFFSET_FLAG_CLOSE_TODAY and exchange_id in CLOSE_TODAY_EXCHANGES:
+                effect = POSITION_EFFECT.CLOSE_TODAY
+            else:
+                effect = POSITION_EFFECT.CLOSE
+            table[(exchange_id, flag)] = effect
+    return table
+
+
+# (交易所, 开平标志) -> POSITION_EFFECT
+POSITION_EFFECT_REVERSE = _build_position_effect_reverse()
+
+
+def decode_position_effect(exchange_id, offset_flag):
+    effect = POSITION_EFFECT_REVERSE.get((exchange_id, offset_flag))
+    if effect is None:
+        effect = POSITION_EFFECT.OPEN if offset_flag == OFFSET_FLAG_OPEN else POSITION_EFFECT.CLOSE
+    return effect
+
+
+def _field_map(fields):
+    """
+    由 (字典键, CTP 字段) 列表得到键的元组及一次取出所有字段值的 itemgetter。
+    """
+    keys = tuple(key for key, _ in fields)
+    getter = itemgetter(*(field for _, field in fields))
+    return keys, getter
+
+
+TICK_KEYS, _tick_fields = _field_map((
+    ('open', 'OpenPrice'),
+    ('last', 'LastPrice'),
+    ('low', 'LowestPrice'),
+    ('high', 'HighestPrice'),
+    ('prev_close', 'PreClosePrice'),
+    ('volume', 'Volume'),
+    ('total_turnover', 'Turnover'),
+    ('open_interest', 'OpenInterest'),
+    ('prev_settlement', 'SettlementPrice'),
+    ('b1', 'BidPrice1'),
+    ('b2', 'BidPrice2'),
+    ('b3', 'BidPrice3'),
+    ('b4', 'BidPrice4'),
+    ('b5', 'BidPrice5'),
+    ('b1_v', 'BidVolume1'),
+    ('b2_v', 'BidVolume2'),
+    ('b3_v', 'BidVolume3'),
+    ('b4_v', 'BidVolume4'),
+    ('b5_v', 'BidVolume5'),
+    ('a1', 'AskPrice1'),
+    ('a2', 'AskPrice2'),
+    ('a3', 'AskPrice3'),
+    ('a4', 'AskPrice4'),
+    ('a5', 'AskPrice5'),
+    ('a1_v', 'AskVolume1'),
+    ('a2_v', 'AskVolume2'),
+    ('a3_v', 'AskVolume3'),
+    ('a4_v', 'AskVolume4'),
+    ('a5_v', 'AskVolume5'),
+    ('limit_up', 'UpperLimitPrice'),
+    ('limit_down', 'LowerLimitPrice'),
+))
+
+TICK_DEFAULTS = dict.fromkeys(('order_book_id', 'date', 'action_day', 'time') + TICK_KEYS + (
+    # 派生字段，由 DerivedTickFields 在网关收到行情时填写
+    'delta_volume', 'delta_turnover', 'vwap', 'tick_vwap', 'mid', 'spread'))
+TICK_DEFAULTS['is_valid'] = False
+
+# 夜盘时段，HHMMSSmmm
+NIGHT_SESSION_START = 180000000
+NIGHT_SESSION_END = 30000000
+
+POSITION_SIDE_KEYS = {
+    side: tuple(prefix + key for key in ('old_quantity', 'quantity', 'today_quantity', 'transaction_cost',
+                                         'realized_pnl', 'open_cost', 'avg_open_price'))
+    for side, prefix in ((SIDE.BUY, 'buy_'), (SIDE.SELL, 'sell_'))
+}
+
+POSITION_DEFAULTS = {
+    'buy_old_quantity': 0,
+    'buy_quantity': 0,
+    'buy_today_quantity': 0,
+    'buy_transaction_cost': 0.,
+    'buy_realized_pnl': 0.,
+    'buy_avg_open_price': 0.,
+    'sell_old_quantity': 0,
+    'sell_quantity': 0,
+    'sell_today_quantity': 0,
+    'sell_transaction_cost': 0.,
+    'sell_realized_pnl': 0.,
+    'sell_avg_open_price': 0.,
+    'prev_settle_price': 0.,
+    'buy_open_cost': 0.,
+    'sell_open_cost': 0.,
+    'is_valid': False,
+}
+
+_position_fields = itemgetter('Position', 'TodayPosition', 'YdPosition', 'Commission', 'CloseProfit', 'OpenCost')
+
+INSTRUMENT_KEYS, _instrument_fields = _field_map((
+    ('exchange_id', 'ExchangeID'),
+    ('contract_multiplier', 'VolumeMultiple'),
+    ('long_margin_ratio', 'LongMarginRatio'),
+    ('short_margin_ratio', 'ShortMarginRatio'),
+    ('instrument_id', 'InstrumentID'),
+))
+
+INSTRUMENT_DEFAULTS = dict.fromkeys(('order_book_id', 'underlying_symbol', 'margin_type', 'expire_date') +
+                                    INSTRUMENT_KEYS)
+INSTRUMENT_DEFAULTS['is_valid'] = False
+
+_commission_by_money = itemgetter('OpenRatioByMoney', 'CloseRatioByMoney', 'CloseTodayRatioByMoney')
+_commission_by_volume = itemgetter('OpenRatioByVolume', 'CloseRatioByVolume', 'CloseTodayRatioByVolume')
+
+COMMISSION_DEFAULTS = dict.fromkeys((
+    'underlying_symbol', 'close_ratio', 'open_ratio', 'close_today_ratio', 'commission_type'))
+COMMISSION_DEFAULTS['is_valid'] = False
+
+ORDER_DEFAULTS = dict.fromkeys((
+    'order_id', 'order_ref', 'order_book_id', 'front_id', 'session_id', 'exchange_id', 'order_sys_id',
+    'quantity', 'filled_quantity', 'unfilled_quantity', 'side', 'price', 'position_effect', 'status'))
+ORDER_DEFAULTS['is_valid'] = False
+
+POSITION_DETAIL_KEYS, _position_detail_fields = _field_map((
+    ('exchange_id', 'ExchangeID'),
+    ('trade_id', 'TradeID'),
+    ('open_date', 'OpenDate'),
+    ('quantity', 'Volume'),
+    ('open_price', 'OpenPrice'),
+))
+
+POSITION_DETAIL_DEFAULTS = dict.fromkeys(('order_book_id', 'side', 'is_today') + POSITION_DETAIL_KEYS)
+POSITION_DETAIL_DEFAULTS['is_valid'] = False
+
+TRADE_DEFAULTS = dict.fromkeys((
+    'order_id', 'order_ref', 'order_sys_id', 'trade_id', 'order_book_id', 'side', 'exchange_id',
+    'position_effect', 'amount', 'price'))
+TRADE_DEFAULTS['is_valid'] = False
+
 
 class DataDict(dict):
     def __init__(self, d=None):
@@ -24,165 +195,94 @@ class DataDict(dict):
         return DataDict(super(DataDict, self).copy())
 
     def __getattr__(self, item):
-        return self.__getitem__(item)
+        try:
+            return self.__getitem__(item)
+        except KeyError:
+            # pickle 等通过 getattr 探测 __getstate__ 等属性，需要得到 AttributeError
+            raise AttributeError(item)
 
     def __setattr__(self, key, value):
         self.__setitem__(key, value)
 
 
+def _action_day(action_day, trading_day, time):
+    # date 为交易日，夜盘行情的交易日是下一个交易日，行情的自然日取 ActionDay。大商所夜盘的 ActionDay 填的是交易日，
+    # 夜盘时段 ActionDay 与交易日相同时改用本机日期
+    try:
+        action_day = int(action_day)
+    except (TypeError, ValueError):
+        action_day = 0
+    if action_day and (action_day != trading_day or NIGHT_SESSION_END <= time < NIGHT_SESSION_START):
+        return action_day
+    if time >= NIGHT_SESSION_START or time < NIGHT_SESSION_END:
+        today = date.today()
+        return today.year * 10000 + today.month * 100 + today.day
+    return action_day or trading_day
+
+
 class TickDict(DataDict):
     def __init__(self, data):
-        super(TickDict, self).__init__()
-        self.order_book_id = None
-        self.date = None
-        self.time = None
-        self.open = None
-        self.last = None
-        self.low = None
-        self.high = None
-        self.prev_close = None
-        self.volume = None
-        self.total_turnover = None
-        self.open_interest = None
-        self.prev_settlement = None
-
-        self.b1 = None
-        self.b2 = None
-        self.b3 = None
-        self.b4 = None
-        self.b5 = None
-
-        self.b1_v = None
-        self.b2_v = None
-        self.b3_v = None
-        self.b4_v = None
-        self.b5_v = None
-
-        self.a1 = None
-        self.a2 = None
-        self.a3 = None
-        self.a4 = None
-        self.a5 = None
-
-        self.a1_v = None
-        self.a2_v = None
-        self.a3_v = None
-        self.a4_v = None
-        self.a5_v = None
-
-        self.limit_down = None
-        self.limit_up = None
-
-        self.is_valid = False
-
+        super(TickDict, self).__init__(TICK_DEFAULTS)
         self.update_data(data)
 
     def update_data(self, data):
-        self.order_book_id = make_order_book_id(data['InstrumentID'])
+        # 热点路径，直接写字典项，不经过 DataDict 的属性赋值
+        self['order_book_id'] = make_order_book_id(data['InstrumentID'])
         try:
-            self.date = int(data['TradingDay'])
-            self.time = int((data['UpdateTime'].replace(':', ''))) * 1000 + int(data['UpdateMillisec'])
-            # self.time = int(''.join((data['UpdateTime'].replace(':', ''), str(data['UpdateMillisec']))))
-            self.open = data['OpenPrice']
-            self.last = data['LastPrice']
-            self.low = data['LowestPrice']
-            self.high = data['HighestPrice']
-            self.prev_close = data['PreClosePrice']
-            self.volume = data['Volume']
-            self.total_turnover = data['Turnover']
-            self.open_interest = data['OpenInterest']
-            self.prev_settlement = data['SettlementPrice']
-
-            self.b1 = data['BidPrice1']
-            self.b2 = data['BidPrice2']
-            self.b3 = data['BidPrice3']
-            self.b4 = data['BidPrice4']
-            self.b5 = data['BidPrice5']
-            self.b1_v = data['BidVolume1']
-            self.b2_v = data['BidVolume2']
-            self.b3_v = data['BidVolume3']
-            self.b4_v = data['BidVolume4']
-            self.b5_v = data['BidVolume5']
-            self.a1 = data['AskPrice1']
-            self.a2 = data['AskPrice2']
-            self.a3 = data['AskPrice3']
-            self.a4 = data['AskPrice4']
-            self.a5 = data['AskPrice5']
-            self.a1_v = data['AskVolume1']
-            self.a2_v = data['AskVolume2']
-            self.a3_v = data['AskVolume3']
-            self.a4_v = data['AskVolume4']
-            self.a5_v = data['AskVolume5']
-
-            self.limit_up = data['UpperLimitPrice']
-            self.limit_down = data['LowerLimitPrice']
-            self.is_valid = True
+            trading_day = self['date'] = int(data['TradingDay'])
+            time = self['time'] = int((data['UpdateTime'].replace(':', ''))) * 1000 + int(data['UpdateMillisec'])
         except ValueError:
-            self.is_valid = False
+            self['is_valid'] = False
+            return
+        self['action_day'] = _action_day(data.get('ActionDay'), trading_day, time)
+        self.update(zip(TICK_KEYS, _tick_fields(data)))
+        self['is_valid'] = True
 
 
 class PositionDict(DataDict):
     def __init__(self, data, ins_dict=None):
-
-        super(PositionDict, self).__init__()
-        self.order_book_id = make_order_book_id(data['InstrumentID'])
-        self.buy_old_quantity = 0
-        self.buy_quantity = 0
-        self.buy_today_quantity = 0
-        self.buy_transaction_cost = 0.
-        self.buy_realized_pnl = 0.
-        self.buy_avg_open_price = 0.
-        self.sell_old_quantity = 0
-        self.sell_quantity = 0
-        self.sell_today_quantity = 0
-        self.sell_transaction_cost = 0.
-        self.sell_realized_pnl = 0.
-        self.sell_avg_open_price = 0.
-        self.prev_settle_price = 0.
-
-        self.buy_open_cost = 0.
-        self.sell_open_cost = 0.
-
-        self.contract_multiplier = ins_dict.contract_multiplier if ins_dict is not None else 1
-
-        self.is_valid = False
-
+        super(PositionDict, self).__init__(POSITION_DEFAULTS)
+        self['order_book_id'] = make_order_book_id(data['InstrumentID'])
+        self['contract_multiplier'] = ins_dict.contract_multiplier if ins_dict is not None else 1
         self.update_data(data)
 
     def update_data(self, data):
+        # 上期所及能源中心的今仓与昨仓分为两条记录返回，其余交易所为一条，逐条累加
+        side = POSI_DIRECTION_REVERSE.get(data['PosiDirection'])
+        if side is not None:
+            old_key, quantity_key, today_key, cost_key, pnl_key, open_cost_key, avg_key = POSITION_SIDE_KEYS[side]
+            position, today_position, yd_position, commission, close_profit, open_cost = _position_fields(data)
+            if yd_position:
+                self[old_key] = position - today_position
+            if today_position:
+                self[today_key] = today_position
+
+            quantity = self[quantity_key] = self[quantity_key] + position
+            self[cost_key] += commission
+            self[pnl_key] += close_profit
+            open_cost = self[open_cost_key] = self[open_cost_key] + open_cost
+            self[avg_key] = open_cost / (quantity * self['contract_multiplier']) if quantity > 0 else 0
 
-        if data['PosiDirection'] in [defineDict["THOST_FTDC_PD_Net"], defineDict["THOST_FTDC_PD_Long"]]:
-            if data['YdPosition'] and not data['TodayPosition']:
-                self.buy_old_quantity = data['Position']
-            if data['YdPosition'] and data['TodayPosition']:
-                self.buy_old_quantity = data['Position'] - data['TodayPosition']
-            if data['TodayPosition']:
-                self.buy_today_quantity = data['TodayPosition']
-
-            self.buy_quantity += data['Position']
-            self.buy_transaction_cost += data['Commission']
-            self.buy_realized_pnl += data['CloseProfit']
-
-            self.buy_open_cost += data['OpenCost']
-            self.buy_avg_open_price = self.buy_open_cost / (self.buy_quantity * self.contract_multiplier) if self.buy_quantity > 0 else 0
-
-        elif data['PosiDirection'] == defineDict["THOST_FTDC_PD_Short"]:
-            if data['YdPosition']:
-                self.sell_old_quantity = data['Position']
-            if data['TodayPosition']:
-                self.sell_today_quantity = data['TodayPosition']
+        if data['PreSettlementPrice']:
+            self['prev_settle_price'] = data['PreSettlementPrice']
 
-            self.sell_quantity += data['Position']
-            self.sell_transaction_cost += data['Commission']
-            self.sell_realized_pnl += data['CloseProfit']
+        self['is_valid'] = True
 
-            self.sell_open_cost += data['OpenCost']
-            self.sell_avg_open_price = self.sell_open_cost / (self.sell_quantity * self.contract_multiplier) if self.sell_quantity > 0 else 0
 
-        if data['PreSettlementPrice']:
-            self.prev_settle_price = data['PreSettlementPrice']
+class PositionDetailDict(DataDict):
+    def __init__(self, data):
+        super(PositionDetailDict, self).__init__(POSITION_DETAIL_DEFAULTS)
+        self.update_data(data)
 
-        self.is_valid = True
+    def update_data(self, data):
+        # 每条记录对应一笔尚未平完的开仓成交，Volume 为剩余手数
+        if not data['InstrumentID'] or not data['Volume']:
+            return
+        self['order_book_id'] = make_order_book_id(data['InstrumentID'])
+        self['side'] = SIDE_REVERSE.get(data['Direction'], SIDE.BUY)
+        self.update(zip(POSITION_DETAIL_KEYS, _position_detail_fields(data)))
+        self['is_today'] = data['OpenDate'] == data['TradingDay']
+        self['is_valid'] = True
 
 
 class AccountDict(DataDict):
@@ -193,187 +293,124 @@ class AccountDict(DataDict):
 
 class InstrumentDict(DataDict):
     def __init__(self, data):
-        super(InstrumentDict, self).__init__()
-        self.order_book_id = None
-        self.underlying_symbol = None
-        self.exchange_id = None
-        self.contract_multiplier = None
-        self.long_margin_ratio = None
-        self.short_margin_ratio = None
-        self.margin_type = None
-        self.instrument_id = None
-
-        self.is_valid = False
-
+        super(InstrumentDict, self).__init__(INSTRUMENT_DEFAULTS)
         self.update_data(data)
 
     def update_data(self, data):
-        if is_future(data['InstrumentID']):
-            self.order_book_id = make_order_book_id(data['InstrumentID'])
-            self.underlying_symbol = make_underlying_symbol(data['InstrumentID'])
-            self.exchange_id = data['ExchangeID']
-            self.contract_multiplier = data['VolumeMultiple']
-            self.long_margin_ratio = data['LongMarginRatio']
-            self.short_margin_ratio = data['ShortMarginRatio']
-            self.margin_type = MARGIN_TYPE.BY_MONEY
-            self.instrument_id = data['InstrumentID']
-            self.is_valid = True
+        instrument_id = data['InstrumentID']
+        if is_future(instrument_id):
+            self['order_book_id'] = make_order_book_id(instrument_id)
+            self['underlying_symbol'] = make_underlying_symbol(instrument_id)
+            self.update(zip(INSTRUMENT_KEYS, _instrument_fields(data)))
+            self['margin_type'] = MARGIN_TYPE.BY_MONEY
+            # YYYYMMDD 格式的字符串
+            self['expire_date'] = data.get('ExpireDate') or None
+            self['is_valid'] = True
         else:
-            self.is_valid = False
+            self['is_valid'] = False
 
 
 class CommissionDict(DataDict):
     def __init__(self, data):
-        super(CommissionDict, self).__init__()
-        self.underlying_symbol = None
-        self.close_ratio = None
-        self.open_ratio = None
-        self.close_today_ratio = None
-        self.commission_type = None
-
-        self.is_valid = False
+        super(CommissionDict, self).__init__(COMMISSION_DEFAULTS)
         self.update_data(data)
 
     def update_data(self, data):
-        self.underlying_symbol = make_underlying_symbol(data['InstrumentID'])
-        if data['OpenRatioByMoney'] == 0 and data['CloseRatioByMoney']:
-            self.open_ratio = data['OpenRatioByVolume']
-            self.close_ratio = data['CloseRatioByVolume']
-            self.close_today_ratio = data['CloseTodayRatioByVolume']
-            if data['OpenRatioByVolume'] != 0 or data['CloseRatioByVolume'] != 0:
-                self.commission_type = COMMISSION_TYPE.BY_VOLUME
-            else:
-                self.commission_type = None
+        self['underlying_symbol'] = make_underlying_symbol(data['InstrumentID'])
+        by_money = _commission_by_money(data)
+        by_volume = _commission_by_volume(data)
+        if by_money[0] == 0 and by_money[1] == 0:
+            ratios = by_volume
+            other = by_money
+            commission_type = COMMISSION_TYPE.BY_VOLUME
         else:
-            self.open_ratio = data['OpenRatioByMoney']
-            self.close_ratio = data['CloseRatioByMoney']
-            self.close_today_ratio = data['CloseTodayRatioByMoney']
-            if data['OpenRatioByVolume'] == 0 and data['CloseRatioByVolume'] == 0:
-                self.commission_type = COMMISSION_TYPE.BY_MONEY
-            else:
-                self.commission_type = None
-        self.is_valid = True
+            ratios = by_money
+            other = by_volume
+            commission_type = COMMISSION_TYPE.BY_MONEY
+        self['open_ratio'], self['close_ratio'], self['close_today_ratio'] = ratios
+        if commission_type == COMMISSION_TYPE.BY_VOLUME:
+            # 按手数及按金额的费率都为 0 时无法确定收费方式
+            self['commission_type'] = commission_type if ratios[0] != 0 or ratios[1] != 0 else None
+        else:
+            # 同时有按手数及按金额的费率时无法确定收费方式
+            self['commission_type'] = commission_type if other[0] == 0 and other[1] == 0 else None
+        self['is_valid'] = True
 
 
 class OrderDict(DataDict):
     def __init__(self, data, rejected=False):
-        super(OrderDict, self).__init__()
-        self.order_id = None
-        self.order_book_id = None
-        self.front_id = None
-        self.session_id = None
-        self.exchange_id = None
-
-        self.quantity = None
-        self.filled_quantity = None
-        self.unfilled_quantity = None
-        self.side = None
-        self.price = None
-        self.position_effect = None
-        self.status = None
-
-        self.style = None
-        self.is_valid = False
-
+        super(OrderDict, self).__init__(ORDER_DEFAULTS)
         self.update_data(data, rejected)
 
+    @property
+    def style(self):
+        # 回报中的订单均为限价单，用到时才构造
+        price = self['price']
+        return LimitOrder(price) if price is not None else None
+
     def update_data(self, data, rejected=False):
         if not data['InstrumentID']:
             return
+        order_ref = self['order_ref'] = data['OrderRef'].strip()
         try:
-            self.order_id = int(data['OrderRef'])
+            self['order_id'] = int(order_ref)
         except ValueError:
-            self.order_id = np.nan
+            self['order_id'] = float('nan')
 
-        self.order_book_id = make_order_book_id(data['InstrumentID'])
+        self['order_book_id'] = make_order_book_id(data['InstrumentID'])
 
         if 'FrontID' in data:
-            self.front_id = data['FrontID']
-            self.session_id = data['SessionID']
+            self['front_id'] = data['FrontID']
+            self['session_id'] = data['SessionID']
+        order_sys_id = data.get('OrderSysID')
+        if order_sys_id:
+            self['order_sys_id'] = order_sys_id.strip()
 
-        self.quantity = data['VolumeTotalOriginal']
+        quantity = self['quantity'] = data['VolumeTotalOriginal']
 
         if 'VolumeTraded' in data:
-            self.filled_quantity = data['VolumeTraded']
-            self.unfilled_quantity = self.quantity - self.filled_quantity
-
-        self.side = SIDE_REVERSE.get(data['Direction'], SIDE.BUY)
-        self.price = data['LimitPrice']
-        self.exchange_id = data['ExchangeID']
-
-        if self.exchange_id == 'SHFE':
-            if data['CombOffsetFlag'] == defineDict['THOST_FTDC_OF_Open']:
-                self.position_effect = POSITION_EFFECT.OPEN
-            elif data['CombOffsetFlag'] == defineDict['THOST_FTDC_OF_CloseToday']:
-                self.position_effect = POSITION_EFFECT.CLOSE_TODAY
-            else:
-                self.position_effect = POSITION_EFFECT.CLOSE
-        else:
-            if data['CombOffsetFlag'] == defineDict['THOST_FTDC_OF_Open']:
-                self.position_effect = POSITION_EFFECT.OPEN
-            else:
-                self.position_effect = POSITION_EFFECT.CLOSE
+            filled_quantity = self['filled_quantity'] = data['VolumeTraded']
+            self['unfilled_quantity'] = quantity - filled_quantity
 
-        if rejected:
-            self.status = ORDER_STATUS.REJECTED
-        else:
-            if 'OrderStatus' in data:
-                if data['OrderStatus'] in [defineDict["THOST_FTDC_OST_PartTradedQueueing"], defineDict["THOST_FTDC_OST_NoTradeQueueing"]]:
-                    self.status = ORDER_STATUS.ACTIVE
-                elif data['OrderStatus'] == defineDict["THOST_FTDC_OST_AllTraded"]:
-                    self.status = ORDER_STATUS.FILLED
-                elif data['OrderStatus'] == defineDict["THOST_FTDC_OST_Canceled"]:
-                    self.status = ORDER_STATUS.CANCELLED
-                else:
-                    return
+        self['side'] = SIDE_REVERSE.get(data['Direction'], SIDE.BUY)
+        self['price'] = data['LimitPrice']
+        exchange_id = self['exchange_id'] = data['ExchangeID']
+        self['position_effect'] = decode_position_effect(exchange_id, data['CombOffsetFlag'])
 
-        self.style = LimitOrder(self.price)
+        if rejected:
+            self['status'] = ORDER_STATUS.REJECTED
+        elif 'OrderStatus' in data:
+            status = ORDER_STATUS_REVERSE.get(data['OrderStatus'])
+            if status is None:
+                return
+            self['status'] = status
 
-        self.is_valid = True
+        self['is_valid'] = True
 
 
 class TradeDict(DataDict):
     def __init__(self, data):
-        super(TradeDict, self).__init__()
-        self.order_id = None
-        self.trade_id = None
-        self.order_book_id = None
-
-        self.side = None
-        self.exchange_id = None
-        self.position_effect = None
-        self.amount = None
-        self.style = None
-        self.price = None
-
-        self.is_valid = False
-        
+        super(TradeDict, self).__init__(TRADE_DEFAULTS)
         self.update_data(data)
 
-    def update_data(self, data):
-        self.order_id = int(data['OrderRef'])
-        self.trade_id = data['TradeID']
-        self.order_book_id = make_order_book_id(data['InstrumentID'])
+    @property
+    def style(self):
+        price = self['price']
+        return LimitOrder(price) if price is not None else None
 
-        self.side = SIDE_REVERSE.get(data['Direction'], SIDE.BUY)
+    def update_data(self, data):
+        order_ref = self['order_ref'] = data['OrderRef'].strip()
+        self['order_id'] = int(order_ref)
+        self['order_sys_id'] = data['OrderSysID'].strip()
+        self['trade_id'] = data['TradeID']
+        self['order_book_id'] = make_order_book_id(data['InstrumentID'])
 
-        self.exchange_id = data['ExchangeID']
+        self['side'] = SIDE_REVERSE.get(data['Direction'], SIDE.BUY)
 
-        if self.exchange_id == 'SHFE':
-            if data['OffsetFlag'] == defineDict['THOST_FTDC_OF_Open']:
-                self.position_effect = POSITION_EFFECT.OPEN
-            elif data['OffsetFlag'] == defineDict['THOST_FTDC_OF_CloseToday']:
-                self.position_effect = POSITION_EFFECT.CLOSE_TODAY
-            else:
-                self.position_effect = POSITION_EFFECT.CLOSE
-        else:
-            if data['OffsetFlag'] == defineDict['THOST_FTDC_OF_Open']:
-                self.position_effect = POSITION_EFFECT.OPEN
-            else:
-                self.position_effect = POSITION_EFFECT.CLOSE
+        exchange_id = self['exchange_id'] = data['ExchangeID']
+        self['position_effect'] = decode_position_effect(exchange_id, data['OffsetFlag'])
 
-        self.amount = data['Volume']
-        self.price = data['Price']
-        self.style = LimitOrder(self.price)
+        self['amount'] = data['Volume']
+        self['price'] = data['Price']
 
-        self.is_valid = True
+        self['is_valid'] = True
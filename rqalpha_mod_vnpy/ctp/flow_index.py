@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from threading import Lock
+
+from rqalpha.utils.logger import system_log
+
+from ..vnpy import defineDict
+
+
+TOPIC_MODES = {
+    'RESTART': defineDict['THOST_TERT_RESTART'],
+    'RESUME': defineDict['THOST_TERT_RESUME'],
+    'QUICK': defineDict['THOST_TERT_QUICK'],
+}
+
+
+def topic_mode(name):
+    try:
+        return TOPIC_MODES[name.upper()]
+    except (KeyError, AttributeError):
+        raise ValueError('未知的流订阅方式 {}，可选 {}'.format(name, ', '.join(sorted(TOPIC_MODES))))
+
+
+def order_key(data):
+    # 同一订单的每次状态变化各对应一条回报，状态、报单提交状态及成交量都相同的回报是重传。
+    # 报单引用及成交编号每个交易日重新编号，键中包含交易日
+    return 'O%s|%s|%s|%s|%s|%s|%s' % (data.get('TradingDay'), data.get('FrontID'), data.get('SessionID'),
+                                      data['OrderRef'], data.get('OrderStatus'), data.get('OrderSubmitStatus'),
+                                      data.get('VolumeTraded'))
+
+
+def trade_key(data):
+    # 成交编号在交易所内按买卖方向每日唯一
+    return 'T%s|%s|%s|%s' % (data.get('TradingDay'), data['ExchangeID'], data['TradeID'], data['Direction'])
+
+
+class FlowIndex(object):
+    """
+    私有流中已处理过的订单及成交回报。重新订阅私有流后柜台重传的回报在构造 OrderDict、TradeDict 之前即被丢弃。
+
+    调用 :meth:`open` 后，新处理的回报在其预写日志记录 fsync 之后才由 :meth:`persist` 追加写入文件，
+    文件中的记录总有对应的预写日志记录，崩溃后不会丢弃预写日志中没有的回报。load 为 True 时先读入文件中已有的记录，
+    重启后以 RESUME 方式订阅时，柜台已推送但上次未处理完的回报可以据此区分。
+    """
+    def __init__(self):
+        self._keys = set()
+        self._file = None
+        # persist 在预写日志的 fsync 线程中调用
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def open(self, path, load=False):
+        self.close()
+        self._keys = set()
+        if load and os.path.exists(path):
+            with open(path, 'r') as f:
+                self._keys.update(line.rstrip('\n') for line in f)
+            system_log.info('读入 {} 条已处理的回报记录', len(self._keys))
+        with self._lock:
+            self._file = open(path, 'a')
+
+    def reset(self):
+        """
+        清空已处理的回报记录，不写文件。未配置预写日志时在换日同步前调用，记录不会无限增长。
+        """
+        self.close()
+        self._keys = set()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def persist(self, keys):
+        """
+        写入记录已经 fsync 到预写日志的回报。
+        """
+        if not keys:
+            return
+        with self._lock:
+            if self._file is not None:
+                self._file.write(''.join(key + '\n' for key in keys))
+                self._file.flush()
+
+    def _add(self, key):
+        keys = self._keys
+        if key in keys:
+            return None
+        keys.add(key)
+        return key
+
+    def add_order(self, data):
+        """
+        回报未处理过时记录并返回其键，随预写日志记录传给 WriteAheadLog.append，已处理过时返回 None。
+        """
+        return self._add(order_key(data))
+
+    def add_trade(self, data):
+        return self._add(trade_key(data))
@@ -13,27 +13,48 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from time import sleep
-from six import iteritems
+import os
+from time import sleep, time
+from six import iteritems, itervalues
 from datetime import date
-from Queue import Queue, Empty
 
-from rqalpha.utils.logger import system_log
-from rqalpha.const import ACCOUNT_TYPE, ORDER_STATUS
-from rqalpha.environment import Environment
+from rqalpha.utils.logger import system_log, user_system_log
+from rqalpha.const import ACCOUNT_TYPE, ORDER_STATUS, ORDER_TYPE, POSITION_EFFECT
 from rqalpha.events import EVENT
 from rqalpha.events import Event as RqEvent
-from rqalpha.model.order import Order
+from rqalpha.model.order import Order, LimitOrder, MarketOrder
 from rqalpha.model.trade import Trade
 from rqalpha.model.portfolio import Portfolio
 
+from ..metrics import MetricsRegistry
+from ..journal import EventJournal, ORDER, TRADE
+from ..multiplexer import EventMultiplexer, PRIORITY_TD, PRIORITY_TICK
+from ..events import VNPY_EVENT
 from .api import CtpTdApi, CtpMdApi
-from ..utils import cal_commission
+from .sim_api import SimTdApi, load_bundle_instruments
+from .data_dict import CLOSE_TODAY_EXCHANGES
+from .flow_index import topic_mode, TOPIC_MODES
+from .wal import INSTRUMENTS, COMMISSION, SYNC, SUBMIT, ORDER as WAL_ORDER, TRADE as WAL_TRADE
+
+
+DEFAULT_ACCOUNT = 'default'
+
+# 等待登录及查询结果时的轮询间隔
+POLL_INTERVAL = 0.01
 
 
 class CtpGateway(object):
-    def __init__(self, env, data_cache, temp_path, user_id, password, broker_id, retry_times=5, retry_interval=1):
+    """
+    单个 CTP 账户的网关。
+
+    多账户时每个账户各有一个网关及交易连接，其中一个网关持有行情连接并负责同步合约及费率数据，
+    其余网关通过 :meth:`share_market_data` 共用其行情及 :class:`MarketCache`。
+    """
+    def __init__(self, env, data_cache, temp_path, user_id, password, broker_id, retry_times=5, retry_interval=1,
+                 order_rate_limit=None, cancel_rate_limit=None, name=DEFAULT_ACCOUNT, metrics=None,
+                 journal=None, multiplexer=None, split_close_orders=True):
         self._env = env
+        self.name = name
 
         self.td_api = None
         self.md_api = None
@@ -46,75 +67,375 @@ class CtpGateway(object):
         self._retry_times = retry_times
         self._retry_interval = retry_interval
 
+        self._order_rate_limit = order_rate_limit
+        self._cancel_rate_limit = cancel_rate_limit
+
         self._query_returns = {}
-        self._tick_que = Queue()
+        # 行情及订单、成交回报经此交给策略线程处理，多账户时各网关共用
+        self.multiplexer = multiplexer if multiplexer is not None else EventMultiplexer(metrics)
+        self._tick_hooks = []
         self._cache = data_cache
+        self._cache.account_name = name
+        self._market_gateway = None
+        self._profiler = None
+        self._wal = None
+        self._private_topic = 'RESTART'
+        self._public_topic = 'RESTART'
+        # 同步之前收到的新成交笔数，据此判断从预写日志恢复时是否需要重新查询持仓
+        self._unsynced_trades = 0
+        self._split_close_orders = split_close_orders
+        self._journal = journal if journal is not None else EventJournal(enabled=False)
 
         self.subscribed = []
         self.open_orders = []
-        self.order_objects = {}
+
+        self._portfolio = None
+        self._portfolio_static_value = None
 
         self._data_update_date = date.min
 
+        # 只注册一次，connect_and_sync_data 在断线重连后会再次调用
+        self._cache.register_event(env.event_bus)
+        env.event_bus.add_listener(EVENT.POST_UNIVERSE_CHANGED, self.on_universe_changed)
+
+        self._init_metrics(metrics if metrics is not None else MetricsRegistry())
+
+    def _init_metrics(self, registry):
+        account = self.name
+        self._ticks_total = registry.counter('vnpy_ticks_total', '收到的有效行情笔数', account=account)
+        self._ticks_dropped = registry.counter('vnpy_ticks_dropped_total', '因数据无效丢弃的行情笔数', account=account)
+        self._ticks_filtered = registry.counter('vnpy_ticks_filtered_total', '不在策略合约池中、未推送给策略的行情笔数',
+                                                account=account)
+        registry.gauge('vnpy_open_orders', '未完成订单数', account=account).set_function(lambda: len(self.open_orders))
+        registry.gauge('vnpy_request_queue_depth', '等待发往柜台的报单及撤单请求数', account=account).set_function(
+            lambda: self.td_api.request_queue.depth if self.td_api is not None else 0)
+        self._query_rtt = {query: registry.histogram('vnpy_query_rtt_seconds', '查询请求的往返时间',
+                                                     buckets=(.01, .05, .1, .25, .5, 1., 2.5, 5., 10.),
+                                                     account=account, query=query)
+                           for query in ('instrument', 'account', 'position', 'position_detail', 'order',
+                                         'commission')}
+        self._front_connects = {}
+        self._reconnects = {}
+        self._disconnects = {}
+        for api in ('md', 'td'):
+            self._front_connects[api] = 0
+            self._reconnects[api] = registry.counter('vnpy_reconnects_total', '与前置断开后重新连接的次数',
+                                                     account=account, api=api)
+            self._disconnects[api] = registry.counter('vnpy_disconnects_total', '与前置断开的次数',
+                                                      account=account, api=api)
+
     def connect_and_sync_data(self):
+        state = None
+        if self._data_update_date != date.today():
+            if self._wal is not None:
+                state = self._wal.recover()
+                # 能从预写日志恢复时读入已处理的回报记录，柜台重传的回报直接丢弃
+                self.td_api.flow_index.open(os.path.splitext(self._wal.path)[0] + '.flow', load=state.synced)
+                self._wal.set_durable_listener(self.td_api.flow_index.persist)
+                if not state.synced:
+                    state = None
+            else:
+                self.td_api.flow_index.reset()
+            self._apply_topic_modes(state is not None)
+
         self._connect()
         self.on_log('同步数据中。')
 
         if self._data_update_date != date.today():
-            self._qry_instrument()
-            self._qry_account()
-            self._qry_position()
-            self._qry_order()
+            if state is not None:
+                self._restore(state)
+            else:
+                if self._market_gateway is None:
+                    self._qry_instrument()
+                self._qry_account()
+                self._qry_position()
+                self._qry_order()
+            self._qry_position_detail()
             self._data_update_date = date.today()
-            self._qry_commission()
-
-        self._subscribe_all()
+            if self._market_gateway is None:
+                self._qry_commission()
+            if self._wal is not None:
+                self._wal.append(SYNC, (self._cache.account_dict, self._cache.pos, self._cache.qry_orders))
+            self._unsynced_trades = 0
+
+        if self._market_gateway is None:
+            self._subscribe_all()
         self.on_log('数据同步完成。')
 
-        self._env.event_bus.add_listener(EVENT.POST_UNIVERSE_CHANGED, self.on_universe_changed)
+        if self._market_gateway is None and self._env.portfolio is not None:
+            # 账户在原对象上重建，昨日权益变化时 portfolio 以新的单位净值重建
+            self._env.portfolio = self.get_portfolio()
+
+    def set_profiler(self, profiler):
+        """
+        在 init_*_api 之前调用，此后创建的接口的回调均由 profiler 统计耗时。
+        """
+        self._profiler = profiler
+
+    def set_wal(self, wal):
+        """
+        在 connect_and_sync_data 之前调用。wal 中已有当天的同步快照时据此恢复，不再查询合约、费率及订单，
+        此后的报单、订单回报及成交回报均写入 wal。
+        """
+        self._wal = wal
+
+    def set_topic_modes(self, private='RESTART', public='RESTART'):
+        """
+        设置私有流及公共流的订阅方式，可选 RESTART、RESUME 及 QUICK。私有流只在能从预写日志恢复时按设置订阅，
+        否则仍以 RESTART 方式订阅，以便由重传的成交回报得到当日的开仓价格。
+        """
+        topic_mode(private)
+        topic_mode(public)
+        self._private_topic = private.upper()
+        self._public_topic = public.upper()
+
+    def _apply_topic_modes(self, recovered):
+        private = self._private_topic
+        if private != 'RESTART' and not recovered:
+            self.on_log('没有可恢复的当日预写日志，私有流以 RESTART 方式订阅')
+            private = 'RESTART'
+        self.td_api.private_topic = topic_mode(private)
+        self.td_api.public_topic = topic_mode(self._public_topic)
+
+    def _restore(self, state):
+        if self._market_gateway is None:
+            if state.ins:
+                self._cache.cache_ins(state.ins)
+            else:
+                self._qry_instrument()
+            for underlying_symbol, commission_dict in iteritems(state.commissions):
+                if underlying_symbol in self._cache.future_info:
+                    self._cache.cache_commission(underlying_symbol, commission_dict)
+        # 昨日权益当天不会变化，持仓只在同步之后有新成交时重新查询。QUICK 方式不推送登录前的回报，无从判断，总是查询
+        self._cache.cache_account(state.account)
+        if state.trades_since_sync or self._unsynced_trades or self.td_api.private_topic == TOPIC_MODES['QUICK']:
+            self._qry_position()
+        else:
+            self._cache.cache_position(state.positions)
+        for trade_dict in itervalues(state.trades):
+            self._cache.cache_trade(trade_dict)
+        for key, order_book_id, quantity, side, style, position_effect in state.submits:
+            self._cache.restore_order(key, order_book_id, quantity, side, style, position_effect)
+        self._cache_qry_orders(state.orders)
+        self.on_log('已从预写日志恢复至第 {} 条记录，同步之后成交 {} 笔'.format(state.seq, state.trades_since_sync))
+
+    def _api_class(self, cls):
+        return cls if self._profiler is None else self._profiler.profiled(cls)
 
     def init_md_api(self, md_address):
-        self.md_api = CtpMdApi(self, self.temp_path, self.user_id, self.password, self.broker_id, md_address)
+        self.md_api = self._api_class(CtpMdApi)(self, self.temp_path, self.user_id, self.password, self.broker_id,
+                                                md_address)
         self._query_returns[self.md_api.api_name] = {}
 
     def init_td_api(self, td_address, auth_code=None, user_production_info=None):
-        self.td_api = CtpTdApi(self, self.temp_path, self.user_id, self.password, self.broker_id, td_address, auth_code, user_production_info)
+        self.td_api = self._api_class(CtpTdApi)(self, self.temp_path, self.user_id, self.password, self.broker_id,
+                                                td_address, auth_code, user_production_info,
+                                                order_rate=self._order_rate_limit,
+                                                cancel_rate=self._cancel_rate_limit)
         self._query_returns[self.td_api.api_name] = {}
 
+    def init_sim_td_api(self, bundle_path, starting_cash, latency=0., queue_position=True):
+        instruments, commissions = load_bundle_instruments(bundle_path)
+        self.td_api = self._api_class(SimTdApi)(self, self.temp_path, self.user_id, self.password, self.broker_id,
+                                                None, instruments, commissions, starting_cash, latency=latency,
+                                                queue_position=queue_position, order_rate=self._order_rate_limit,
+                                                cancel_rate=self._cancel_rate_limit)
+        self._query_returns[self.td_api.api_name] = {}
+
+    def share_market_data(self, gateway):
+        """
+        使用 gateway 的行情连接及合约、费率数据，本网关不再登录行情服务器，也不再查询合约及费率。
+        需在 gateway 之后同步数据。
+        """
+        if self.md_api is not None:
+            raise RuntimeError('账户 {} 已有行情连接'.format(self.name))
+        self._market_gateway = gateway
+
+    def add_tick_hook(self, hook):
+        if self._market_gateway is not None:
+            self._market_gateway.add_tick_hook(hook)
+        else:
+            self._tick_hooks.append(hook)
+
+    @property
+    def account(self):
+        return self._cache.account[0]
+
     def submit_order(self, order):
-        self.td_api.sendOrder(order)
-        self._cache.cache_order(order)
+        self.submit_orders([order])
+
+    def submit_orders(self, orders):
+        if not orders:
+            return
+        account = self.account
+
+        # 同一批次中每个合约只校验一次
+        ins_dicts = {}
+        accepted = []
+        rejected = []
+        for order in orders:
+            order_book_id = order.order_book_id
+            if order_book_id not in ins_dicts:
+                ins_dicts[order_book_id] = self.get_ins_dict(order_book_id)
+            if ins_dicts[order_book_id] is None:
+                rejected.append(order)
+            else:
+                accepted.append(order)
+
+        for order in rejected:
+            self.reject_order(order, 'Order was rejected: instrument %s is not available.' % order.order_book_id,
+                              account)
+
+        for order in accepted:
+            self._cache.cache_order(order, self.td_api.front_id, self.td_api.session_id)
+            if self._wal is not None:
+                style = MarketOrder() if order.type == ORDER_TYPE.MARKET else LimitOrder(order.price)
+                self._wal.append(SUBMIT, (self._cache.get_order_key(order), order.order_book_id, order.quantity,
+                                          order.side, style, order.position_effect))
+            self.td_api.sendOrder(order)
+
+    def split_close_orders(self, orders):
+        """
+        上期所及能源中心的平仓单须指明平今或平昨，按持仓台账把平仓数量拆分为平今及平昨两笔，优先按订单原有的开平方向，
+        不足部分由另一笔补足，并冻结相应的可平数量。可平数量不足的订单直接拒绝，不再报往柜台。
+
+        返回需报往柜台的订单。策略持有的订单保持不变：无需拆分时原样报出，需要拆分时以子订单代替原订单报出，
+        子订单的回报及成交汇总到原订单上，策略只看到原订单的事件。
+        """
+        if not self._split_close_orders:
+            return orders
+        ledger = self._cache.ledger
+        result = []
+        for order in orders:
+            ins_dict = self.get_ins_dict(order.order_book_id)
+            if ins_dict is None or order.position_effect == POSITION_EFFECT.OPEN:
+                result.append(order)
+                continue
+            exchange_id = ins_dict.exchange_id
+            parts = ledger.split_close(order.order_book_id, exchange_id, order.side, order.position_effect,
+                                       order.quantity)
+            if parts is None:
+                self.reject_order(order, 'Order was rejected: not enough position of %s to close.'
+                                  % order.order_book_id)
+                continue
+            if not ledger.seeded or exchange_id not in CLOSE_TODAY_EXCHANGES:
+                result.append(order)
+                continue
+
+            if parts == [(order.position_effect, order.quantity)]:
+                result.append(order)
+                ledger.reserve(order.order_id, order.order_book_id, order.side, order.position_effect, order.quantity)
+                continue
+
+            style = MarketOrder() if order.type == ORDER_TYPE.MARKET else LimitOrder(order.price)
+            children = []
+            for position_effect, quantity in parts:
+                child = Order.__from_create__(order.order_book_id, quantity, order.side, style, position_effect)
+                child.set_frozen_price(order.frozen_price)
+                children.append(child)
+                ledger.reserve(child.order_id, child.order_book_id, child.side, position_effect, quantity)
+                user_system_log.info('订单 {} 中的 {} 手以子订单 {} 报出，开平方向为 {}'.format(
+                    order.order_id, quantity, child.order_id, position_effect))
+            self._cache.link_split_order(order, children)
+            result.extend(children)
+        return result
+
+    def reject_order(self, order, reason, account=None):
+        if account is None:
+            account = self.account
+        self._cache.ledger.release(order.order_id)
+        self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_PENDING_NEW, account=account, order=order))
+        order.mark_rejected(reason)
+        self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_CREATION_REJECT, account=account, order=order))
 
     def cancel_order(self, order):
-        account = Environment.get_instance().get_account(order.order_book_id)
-        self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_PENDING_CANCEL, account=account, order=order))
-        self.td_api.cancelOrder(order)
+        self.cancel_orders([order])
+
+    def cancel_orders(self, orders):
+        orders = [order for order in orders if not order.is_final()]
+        if not orders:
+            return
+        account = self.account
+        for order in orders:
+            self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_PENDING_CANCEL, account=account, order=order))
+        for order in orders:
+            children = self._cache.get_split_children(order)
+            if not children:
+                self.td_api.cancelOrder(order)
+            for child in children:
+                if not child.is_final():
+                    self.td_api.cancelOrder(child)
 
     def get_portfolio(self):
         future_account, static_value = self._cache.account
-        start_date = self._env.config.base.start_date
-        future_starting_cash = self._env.config.base.future_starting_cash
-        return Portfolio(start_date, static_value/future_starting_cash, future_starting_cash, {ACCOUNT_TYPE.FUTURE: future_account})
+        if self._portfolio is None or static_value != self._portfolio_static_value:
+            start_date = self._env.config.base.start_date
+            future_starting_cash = self._env.config.base.future_starting_cash
+            self._portfolio = Portfolio(start_date, static_value/future_starting_cash, future_starting_cash,
+                                        {ACCOUNT_TYPE.FUTURE: future_account})
+            self._portfolio_static_value = static_value
+        return self._portfolio
+
+    def get_snapshot(self, order_book_id):
+        return self._cache.snapshot.get(order_book_id)
 
     def get_ins_dict(self, order_book_id):
         return self._cache.ins.get(order_book_id)
 
-    def get_tick(self):
-        while True:
-            try:
-                return self._tick_que.get(block=True, timeout=1)
-            except Empty:
-                self.on_debug('Get tick timeout.')
+    def owns(self, order):
+        return self._cache.get_order_key(order) is not None or bool(self._cache.get_split_children(order))
+
+    def get_order_key(self, order):
+        return self._cache.get_order_key(order)
+
+    def get_pos_dicts(self):
+        return self._cache.pos
+
+    def get_request_queue_stats(self):
+        return self.td_api.request_queue.stats()
 
     def exit(self):
         self.td_api.close()
-        self.md_api.close()
+        if self.md_api is not None:
+            self.md_api.close()
+        if self._wal is not None:
+            self._wal.close()
 
     def on_universe_changed(self, event):
         self.subscribed = event.universe
 
     def on_query(self, api_name, n, result):
-        self._query_returns[api_name][n] = result
+        self._query_returns[api_name][n] = (result, time())
+
+    @staticmethod
+    def _wait_until(func, timeout):
+        # 轮询 func 直至其返回值不为 None 或超时，返回 func 最后一次的结果
+        deadline = time() + timeout
+        while True:
+            result = func()
+            if result is not None or time() >= deadline:
+                return result
+            sleep(POLL_INTERVAL)
+
+    def _pop_query_return(self, req_id, sent_time, query):
+        returns = self._query_returns[self.td_api.api_name]
+        if req_id not in returns:
+            return None
+        result, received_time = returns.pop(req_id)
+        self._query_rtt[query].observe(received_time - sent_time)
+        return result
+
+    def on_front_connected(self, api):
+        self._front_connects[api] += 1
+        if self._front_connects[api] > 1:
+            self._reconnects[api].inc()
+
+    def on_front_disconnected(self, api, reason):
+        self._disconnects[api].inc()
+        self.on_log('CTP {}前置连接断开，原因代码 {}'.format('行情' if api == 'md' else '交易', reason))
+
+    def on_tick_dropped(self):
+        self._ticks_dropped.inc()
 
     def on_debug(self, debug):
         system_log.debug(debug)
@@ -125,16 +446,31 @@ class CtpGateway(object):
     def on_err(self, error):
         system_log.error('CTP 错误，错误代码：%s，错误信息：%s' % (str(error['ErrorID']), error['ErrorMsg'].decode('GBK')))
 
-    def on_order(self, order_dict):
+    def on_order(self, order_dict, flow_key=None):
+        """
+        :param flow_key: 私有流回报在 FlowIndex 中的键，预写日志记录 fsync 之后写入 FlowIndex 的文件
+        """
         if not order_dict.is_valid:
             return
-        self.on_debug('订单回报: %s' % str(order_dict))
+        if self._journal.enabled:
+            self._journal.record(ORDER, order_dict)
+        if self._wal is not None:
+            self._wal.append(WAL_ORDER, order_dict, flow_key)
         if self._data_update_date != date.today():
             return
+        self.multiplexer.put(PRIORITY_TD, (self.process_order, order_dict))
 
+    def process_order(self, order_dict):
+        """
+        在策略线程中更新订单状态并发布订单事件，由 VNPYEventSource 从 multiplexer 中取出后调用。
+        """
         order = self._cache.get_cached_order(order_dict)
+        parent = self._cache.get_split_parent(order)
+        if parent is not None:
+            self._process_split_order(parent, order, order_dict)
+            return
 
-        account = Environment.get_instance().get_account(order.order_book_id)
+        account = self.account
 
         if order.status == ORDER_STATUS.PENDING_NEW:
             self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_PENDING_NEW, account=account, order=order))
@@ -174,42 +510,126 @@ class CtpGateway(object):
                 if order in self.open_orders:
                     self.open_orders.remove(order)
 
-    def on_trade(self, trade_dict):
-        self.on_debug('交易回报: %s' % str(trade_dict))
+        if order.is_final():
+            self._cache.ledger.release(order.order_id)
+
+    def _process_split_order(self, parent, child, order_dict):
+        # 子订单只在内部记录状态，策略看到的是原订单的事件
+        if order_dict.status == ORDER_STATUS.REJECTED:
+            child.mark_rejected('Order was rejected.')
+        elif order_dict.status == ORDER_STATUS.CANCELLED:
+            child.mark_cancelled('%d order has been cancelled.' % child.order_id, user_warn=False)
+        elif order_dict.status == ORDER_STATUS.FILLED:
+            child._status = order_dict.status
+        elif child.status == ORDER_STATUS.PENDING_NEW:
+            child.active()
+        if child.is_final():
+            self._cache.ledger.release(child.order_id)
+
+        if parent.status == ORDER_STATUS.PENDING_NEW:
+            account = self.account
+            self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_PENDING_NEW, account=account, order=parent))
+            parent.active()
+            self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_CREATION_PASS, account=account, order=parent))
+            if parent not in self.open_orders:
+                self.open_orders.append(parent)
+        self._settle_split_order(parent)
+
+    def _settle_split_order(self, parent):
+        """
+        各子订单均已结束且成交均已处理后结束原订单：全部成交时原订单已由成交置为 FILLED，否则视子订单的状态撤销或拒绝。
+        """
+        children = self._cache.get_split_children(parent)
+        if any(not child.is_final() or (child.status == ORDER_STATUS.FILLED and child.unfilled_quantity)
+               for child in children):
+            return
+        if parent in self.open_orders:
+            self.open_orders.remove(parent)
+        if parent.is_final():
+            return
+        account = self.account
+        if any(child.status == ORDER_STATUS.CANCELLED for child in children):
+            parent.mark_cancelled("%d order has been cancelled." % parent.order_id)
+            self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_CANCELLATION_PASS, account=account, order=parent))
+        else:
+            parent.mark_rejected('Order was rejected or cancelled.')
+            self._env.event_bus.publish_event(RqEvent(EVENT.ORDER_UNSOLICITED_UPDATE, account=account, order=parent))
+
+    def on_trade(self, trade_dict, flow_key=None):
+        if self._journal.enabled:
+            self._journal.record(TRADE, trade_dict)
+        if self._wal is not None:
+            self._wal.append(WAL_TRADE, trade_dict, flow_key)
         if self._data_update_date != date.today():
-            self._cache.cache_trade(trade_dict)
+            if self._cache.cache_trade(trade_dict):
+                self._unsynced_trades += 1
+        else:
+            self.multiplexer.put(PRIORITY_TD, (self.process_trade, trade_dict))
+
+    def process_trade(self, trade_dict):
+        """
+        在策略线程中成交订单并发布成交事件，与 :meth:`process_order` 按回报到达的顺序调用。
+        """
+        account = self.account
+
+        if trade_dict.trade_id in account._backward_trade_set:
+            return
+
+        order = self._cache.get_order_by_trade(trade_dict, self.td_api.front_id, self.td_api.session_id)
+        if order is None:
+            order = Order.__from_create__(trade_dict.order_book_id,
+                                          trade_dict.amount, trade_dict.side, trade_dict.style,
+                                          trade_dict.position_effect)
+        # 子订单的成交计入原订单
+        parent = self._cache.get_split_parent(order)
+        commission = self._cache.cost_table.commission(trade_dict.order_book_id, trade_dict.price,
+                                                       trade_dict.amount, order.position_effect)
+        trade = Trade.__from_create__(
+            (parent or order).order_id, trade_dict.price, trade_dict.amount,
+            trade_dict.side, trade_dict.position_effect, trade_dict.order_book_id, trade_id=trade_dict.trade_id,
+            commission=commission, frozen_price=trade_dict.price)
+
+        order.fill(trade)
+        if parent is not None:
+            parent.fill(trade)
+        self._cache.ledger.on_trade(trade_dict.order_book_id, trade_dict.exchange_id, trade_dict.side,
+                                    trade_dict.position_effect, trade_dict.price, trade_dict.amount, order.order_id)
+        self._env.event_bus.publish_event(RqEvent(EVENT.TRADE, account=account, trade=trade))
+        if parent is not None:
+            self._settle_split_order(parent)
+
+    def process_dominant_change(self, change):
+        """
+        在策略线程中发布主力合约切换事件。
+        """
+        underlying_symbol, previous, order_book_id = change
+        if previous is None:
+            self.on_debug('{} 主力合约为 {}'.format(underlying_symbol, order_book_id))
         else:
-            account = Environment.get_instance().get_account(trade_dict.order_book_id)
-
-            if trade_dict.trade_id in account._backward_trade_set:
-                return
-
-            try:
-                order = self.order_objects[trade_dict.order_id]
-            except KeyError:
-                order = Order.__from_create__(trade_dict.order_book_id,
-                                              trade_dict.amount, trade_dict.side, trade_dict.style,
-                                              trade_dict.position_effect)
-            commission = cal_commission(trade_dict, order.position_effect)
-            trade = Trade.__from_create__(
-                trade_dict.order_id, trade_dict.price, trade_dict.amount,
-                trade_dict.side, trade_dict.position_effect, trade_dict.order_book_id, trade_id=trade_dict.trade_id,
-                commission=commission, frozen_price=trade_dict.price)
-
-            order.fill(trade)
-            self._env.event_bus.publish_event(RqEvent(EVENT.TRADE, account=account, trade=trade))
+            self.on_log('{} 主力合约切换：{} -> {}'.format(underlying_symbol, previous, order_book_id))
+        self._env.event_bus.publish_event(RqEvent(VNPY_EVENT.DOMINANT_CHANGED, underlying_symbol=underlying_symbol,
+                                                  previous=previous, order_book_id=order_book_id))
 
     def on_tick(self, tick_dict):
+        self._ticks_total.inc()
+        self._cache.derive_tick(tick_dict)
+        change = self._cache.track_dominant(tick_dict)
+        if change is not None:
+            # 与订单回报同一优先级，策略先收到主力合约切换，再收到引起切换的行情
+            self.multiplexer.put(PRIORITY_TD, (self.process_dominant_change, change))
         if tick_dict.order_book_id in self.subscribed:
-            self._tick_que.put(tick_dict)
+            self.multiplexer.put(PRIORITY_TICK, tick_dict)
+        else:
+            self._ticks_filtered.inc()
         self._cache.cache_snapshot(tick_dict)
+        for hook in self._tick_hooks:
+            hook(tick_dict)
 
     def _connect(self):
         if self.md_api:
             for i in range(self._retry_times):
                 self.md_api.connect()
-                sleep(self._retry_interval * (i+1))
-                if self.md_api.logged_in:
+                if self._wait_until(lambda: self.md_api.logged_in or None, self._retry_interval * (i+1)):
                     self.on_log('CTP 行情服务器登录成功')
                     break
             else:
@@ -218,8 +638,7 @@ class CtpGateway(object):
         if self.td_api:
             for i in range(self._retry_times):
                 self.td_api.connect()
-                sleep(self._retry_interval * (i+1))
-                if self.td_api.logged_in:
+                if self._wait_until(lambda: self.td_api.logged_in or None, self._retry_interval * (i+1)):
                     self.on_log('CTP 交易服务器登录成功')
                     break
             else:
@@ -229,11 +648,12 @@ class CtpGateway(object):
 
     def __qry_instrumnent(self):
         for i in range(self._retry_times):
+            sent_time = time()
             req_id = self.td_api.qryInstrument()
-            sleep(self._retry_interval * (i+1))
-            if req_id in self._query_returns[self.td_api.api_name]:
-                ins_cache = self._query_returns[self.td_api.api_name][req_id].copy()
-                del self._query_returns[self.td_api.api_name][req_id]
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'instrument'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                ins_cache = result.copy()
                 self.on_debug('%d 条合约数据返回。' % len(ins_cache))
                 return ins_cache
         else:
@@ -241,23 +661,38 @@ class CtpGateway(object):
 
     def __qry_position(self):
         for i in range(self._retry_times):
+            sent_time = time()
             req_id = self.td_api.qryPosition()
-            sleep(self._retry_interval * (i+1))
-            if req_id in self._query_returns[self.td_api.api_name]:
-                positions = self._query_returns[self.td_api.api_name][req_id].copy()
-                del self._query_returns[self.td_api.api_name][req_id]
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'position'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                positions = result.copy()
                 self.on_debug('持仓数据返回: %s。' % str(positions.keys()))
                 return positions
 
         # 持仓数据有可能不返回
 
+    def __qry_position_detail(self):
+        for i in range(self._retry_times):
+            sent_time = time()
+            req_id = self.td_api.qryPositionDetail()
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'position_detail'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                details = list(result)
+                self.on_debug('持仓明细返回 %d 条。' % len(details))
+                return details
+
+        # 持仓明细有可能不返回
+
     def __qry_account(self):
         for i in range(self._retry_times):
+            sent_time = time()
             req_id = self.td_api.qryAccount()
-            sleep(self._retry_interval * (i+1))
-            if req_id in self._query_returns[self.td_api.api_name]:
-                account_dict = self._query_returns[self.td_api.api_name][req_id].copy()
-                del self._query_returns[self.td_api.api_name][req_id]
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'account'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                account_dict = result.copy()
                 self.on_debug('账户数据返回: %s' % str(account_dict))
                 return account_dict
         else:
@@ -265,21 +700,23 @@ class CtpGateway(object):
 
     def __qry_commission(self, order_book_id):
         for i in range(self._retry_times):
+            sent_time = time()
             req_id = self.td_api.qryCommission(order_book_id)
-            sleep(self._retry_interval * (i+1))
-            if req_id in self._query_returns[self.td_api.api_name]:
-                commission_dict = self._query_returns[self.td_api.api_name][req_id].copy()
-                del self._query_returns[self.td_api.api_name][req_id]
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'commission'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                commission_dict = result.copy()
                 return commission_dict
         # commission 数据有可能不返回
 
     def __qry_order(self):
         for i in range(self._retry_times):
+            sent_time = time()
             req_id = self.td_api.qryOrder()
-            sleep(self._retry_interval * (i+1))
-            if req_id in self._query_returns[self.td_api.api_name]:
-                order_dict = self._query_returns[self.td_api.api_name][req_id].copy()
-                del self._query_returns[self.td_api.api_name][req_id]
+            result = self._wait_until(lambda: self._pop_query_return(req_id, sent_time, 'order'),
+                                      self._retry_interval * (i+1))
+            if result is not None:
+                order_dict = result.copy()
                 self.on_debug('订单数据返回')
                 return order_dict
         # order 数据有可能不返回
@@ -292,6 +729,8 @@ class CtpGateway(object):
     def _qry_instrument(self):
         ins_cache = self.__qry_instrumnent()
         self._cache.cache_ins(ins_cache)
+        if self._wal is not None:
+            self._wal.append(INSTRUMENTS, ins_cache)
 
     def _qry_account(self):
         account_dict = self.__qry_account()
@@ -301,8 +740,16 @@ class CtpGateway(object):
         positions = self.__qry_position()
         self._cache.cache_position(positions)
 
+    def _qry_position_detail(self):
+        details = self.__qry_position_detail()
+        if details is None:
+            self.on_log('持仓明细查询超时，由持仓汇总及当日成交建立持仓台账')
+        self._cache.seed_ledger(details)
+
     def _qry_order(self):
-        order_cache = self.__qry_order()
+        self._cache_qry_orders(self.__qry_order())
+
+    def _cache_qry_orders(self, order_cache):
         for order_dict in order_cache.values():
             order = self._cache.get_cached_order(order_dict)
             if order_dict.status == ORDER_STATUS.ACTIVE:
@@ -316,6 +763,8 @@ class CtpGateway(object):
                 continue
             commission_dict = self.__qry_commission(order_book_id)
             self._cache.cache_commission(ins_dict.underlying_symbol, commission_dict)
+            if self._wal is not None:
+                self._wal.append(COMMISSION, (ins_dict.underlying_symbol, commission_dict))
         self.on_debug('费率数据返回')
 
     def _subscribe_all(self):
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import six
+
+
+def expiry_key(ins_dict):
+    # 合约查询回报中没有到期日时按合约代码中的年月排序，二者同为字符串，可以直接比较
+    return ins_dict.get('expire_date') or '20' + ins_dict.order_book_id[-4:], ins_dict.order_book_id
+
+
+class InstrumentIndex(object):
+    """
+    合约的二级索引：品种 -> 按到期日先后排列的合约，交易所 -> 品种，以及合约 -> 品种。
+
+    合约数据更新时由 :meth:`build` 整体重建并替换引用，读取方不加锁。
+    """
+    def __init__(self):
+        self._contracts = {}
+        self._underlyings = {}
+        self._underlying_of = {}
+
+    def build(self, ins_cache):
+        by_underlying = {}
+        by_exchange = {}
+        for ins_dict in six.itervalues(ins_cache):
+            by_underlying.setdefault(ins_dict.underlying_symbol, []).append(ins_dict)
+            by_exchange.setdefault(ins_dict.exchange_id, set()).add(ins_dict.underlying_symbol)
+        self._contracts = {underlying_symbol: tuple(ins_dict.order_book_id
+                                                    for ins_dict in sorted(ins_dicts, key=expiry_key))
+                           for underlying_symbol, ins_dicts in six.iteritems(by_underlying)}
+        self._underlyings = {exchange_id: tuple(sorted(underlyings))
+                             for exchange_id, underlyings in six.iteritems(by_exchange)}
+        self._underlying_of = {order_book_id: ins_dict.underlying_symbol
+                               for order_book_id, ins_dict in six.iteritems(ins_cache)}
+
+    def contracts(self, underlying_symbol):
+        return self._contracts.get(underlying_symbol, ())
+
+    def underlyings(self, exchange_id=None):
+        if exchange_id is None:
+            return tuple(sorted(self._contracts))
+        return self._underlyings.get(exchange_id, ())
+
+    def underlying_of(self, order_book_id):
+        return self._underlying_of.get(order_book_id)
+
+    @property
+    def underlying_map(self):
+        return self._underlying_of
+
+
+class DominantTracker(object):
+    """
+    按持仓量跟踪各品种的主力合约，持仓量相同时比较成交量。
+
+    每笔行情只与该品种当前的主力合约比较，新合约的持仓量超过主力合约的 switch_ratio 倍时切换，避免两个合约持仓量
+    接近时来回切换。主力合约自身持仓量下降后，由其他合约在下一笔行情到达时完成切换。只在行情回调线程中更新。
+    """
+    def __init__(self, switch_ratio=1.1):
+        self.switch_ratio = switch_ratio
+        self._underlying_of = {}
+        self._open_interest = {}
+        self._volume = {}
+        self._dominant = {}
+
+    def rebuild(self, underlying_of):
+        self._underlying_of = underlying_of
+        self._dominant = {underlying_symbol: order_book_id
+                          for underlying_symbol, order_book_id in six.iteritems(self._dominant)
+                          if order_book_id in underlying_of}
+
+    def get(self, underlying_symbol):
+        return self._dominant.get(underlying_symbol)
+
+    def update(self, tick):
+        """
+        由一笔行情更新，主力合约变化时返回 (品种, 原主力合约, 新主力合约)，否则返回 None。
+        """
+        order_book_id = tick['order_book_id']
+        underlying_symbol = self._underlying_of.get(order_book_id)
+        if underlying_symbol is None:
+            return None
+        open_interest = self._open_interest[order_book_id] = tick['open_interest']
+        volume = self._volume[order_book_id] = tick['volume']
+
+        dominant = self._dominant.get(underlying_symbol)
+        if dominant == order_book_id:
+            return None
+        if dominant is not None:
+            dominant_open_interest = self._open_interest[dominant]
+            if open_interest != dominant_open_interest:
+                if open_interest <= dominant_open_interest * self.switch_ratio:
+                    return None
+            elif volume <= self._volume[dominant] * self.switch_ratio:
+                return None
+        self._dominant[underlying_symbol] = order_book_id
+        return underlying_symbol, dominant, order_book_id
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+
+import six
+
+from rqalpha.const import SIDE, POSITION_EFFECT
+
+from .data_dict import CLOSE_TODAY_EXCHANGES
+
+
+# 平仓时优先平今仓的交易所，其余交易所先平昨仓
+CLOSE_TODAY_FIRST_EXCHANGES = ('CFFEX', )
+
+TODAY = 0
+YESTERDAY = 1
+
+OPPOSITE_SIDE = {
+    SIDE.BUY: SIDE.SELL,
+    SIDE.SELL: SIDE.BUY,
+}
+
+
+class Holding(object):
+    """
+    单个合约单个方向的持仓，今仓及昨仓分别以 [开仓价, 数量] 的队列保存，先开先平。frozen 为已报出、尚未成交的平仓数量。
+    """
+    __slots__ = ('lots', 'quantity', 'frozen')
+
+    def __init__(self):
+        self.lots = (deque(), deque())
+        self.quantity = [0, 0]
+        self.frozen = [0, 0]
+
+    def available(self, bucket):
+        return self.quantity[bucket] - self.frozen[bucket]
+
+    def add(self, bucket, price, quantity):
+        if quantity <= 0:
+            return
+        lots = self.lots[bucket]
+        if lots and lots[-1][0] == price:
+            lots[-1][1] += quantity
+        else:
+            lots.append([price, quantity])
+        self.quantity[bucket] += quantity
+
+    def consume(self, bucket, quantity):
+        """
+        从最早的一笔开始平掉 quantity 手，返回未能平掉的数量。
+        """
+        lots = self.lots[bucket]
+        while quantity > 0 and lots:
+            lot = lots[0]
+            if lot[1] > quantity:
+                lot[1] -= quantity
+                self.quantity[bucket] -= quantity
+                return 0
+            lots.popleft()
+            self.quantity[bucket] -= lot[1]
+            quantity -= lot[1]
+        return quantity
+
+    def holding_list(self, bucket):
+        # 与 FuturePosition 的持仓列表一致，最新的一笔在前
+        return [(price, quantity) for price, quantity in reversed(self.lots[bucket])]
+
+
+class LotLedger(object):
+    """
+    按合约及方向记录逐笔持仓的台账。
+
+    同步时由持仓明细查询结果建立，此后由成交回报增量更新，在策略线程中读写。上期所及能源中心的平仓单须指明平今或平昨，
+    :meth:`split_close` 据此把平仓数量拆分为平今及平昨两部分，并冻结相应的可平数量，订单成交或结束后解冻。
+    """
+    def __init__(self):
+        self._holdings = {}
+        # order_id -> (持仓, 今昨, 冻结数量)
+        self._reservations = {}
+        self.seeded = False
+
+    def reset(self):
+        self._holdings = {}
+        self._reservations = {}
+        self.seeded = False
+
+    def _holding(self, order_book_id, side):
+        key = (order_book_id, side)
+        holding = self._holdings.get(key)
+        if holding is None:
+            holding = self._holdings[key] = Holding()
+        return holding
+
+    def get(self, order_book_id, side):
+        return self._holdings.get((order_book_id, side))
+
+    def seed(self, details):
+        """
+        由持仓明细建立台账，details 为 PositionDetailDict 的列表，按开仓先后排列。
+        """
+        self.reset()
+        for detail in details:
+            bucket = TODAY if detail.is_today else YESTERDAY
+            self._holding(detail.order_book_id, detail.side).add(bucket, detail.open_price, detail.quantity)
+        self.seeded = True
+
+    def seed_positions(self, pos_cache, trade_cache):
+        """
+        没有持仓明细时，由持仓汇总及当日成交建立台账：昨仓按昨结算价记为一笔，今仓为当日的开仓成交中最近的若干笔，
+        成交回报不全时以开仓均价补足。
+        """
+        self.reset()
+        for order_book_id, pos_dict in six.iteritems(pos_cache):
+            trades = sorted(trade_cache.get(order_book_id, ()), key=lambda t: t.trade_id)
+            for side, old_quantity, today_quantity, avg_open_price in (
+                    (SIDE.BUY, pos_dict.buy_old_quantity, pos_dict.buy_today_quantity, pos_dict.buy_avg_open_price),
+                    (SIDE.SELL, pos_dict.sell_old_quantity, pos_dict.sell_today_quantity,
+                     pos_dict.sell_avg_open_price)):
+                if not old_quantity and not today_quantity:
+                    continue
+                holding = self._holding(order_book_id, side)
+                holding.add(YESTERDAY, pos_dict.prev_settle_price, old_quantity)
+                opened = Holding()
+                for trade_dict in trades:
+                    if trade_dict.side == side and trade_dict.position_effect == POSITION_EFFECT.OPEN:
+                        opened.add(TODAY, trade_dict.price, trade_dict.amount)
+                opened.consume(TODAY, opened.quantity[TODAY] - today_quantity)
+                holding.add(TODAY, avg_open_price, today_quantity - opened.quantity[TODAY])
+                for price, quantity in opened.lots[TODAY]:
+                    holding.add(TODAY, price, quantity)
+        self.seeded = True
+
+    def on_trade(self, order_book_id, exchange_id, side, position_effect, price, quantity, order_id=None):
+        if position_effect == POSITION_EFFECT.OPEN:
+            self._holding(order_book_id, side).add(TODAY, price, quantity)
+            return
+
+        holding = self._holding(order_book_id, OPPOSITE_SIDE[side])
+        reservation = self._reservations.get(order_id)
+        if reservation is not None:
+            _, bucket, frozen = reservation
+            filled = min(frozen, quantity)
+            holding.frozen[bucket] -= filled
+            if frozen > filled:
+                self._reservations[order_id] = (holding, bucket, frozen - filled)
+            else:
+                del self._reservations[order_id]
+
+        if position_effect == POSITION_EFFECT.CLOSE_TODAY:
+            order = (TODAY, YESTERDAY)
+        elif exchange_id in CLOSE_TODAY_EXCHANGES:
+            order = (YESTERDAY, TODAY)
+        elif exchange_id in CLOSE_TODAY_FIRST_EXCHANGES:
+            order = (TODAY, YESTERDAY)
+        else:
+            order = (YESTERDAY, TODAY)
+        left = holding.consume(order[0], quantity)
+        if left:
+            holding.consume(order[1], left)
+
+    def split_close(self, order_book_id, exchange_id, side, position_effect, quantity):
+        """
+        返回平仓单应拆分成的 [(POSITION_EFFECT, 数量), ...]，可平数量不足时返回 None。
+        台账尚未建立、开仓单及不区分平今平昨的交易所原样返回。
+        """
+        if (not self.seeded or position_effect == POSITION_EFFECT.OPEN or
+                exchange_id not in CLOSE_TODAY_EXCHANGES):
+            return [(position_effect, quantity)]
+
+        holding = self.get(order_book_id, OPPOSITE_SIDE[side])
+        if holding is None:
+            return None
+        if position_effect == POSITION_EFFECT.CLOSE_TODAY:
+            buckets = ((TODAY, POSITION_EFFECT.CLOSE_TODAY), (YESTERDAY, POSITION_EFFECT.CLOSE))
+        else:
+            buckets = ((YESTERDAY, POSITION_EFFECT.CLOSE), (TODAY, POSITION_EFFECT.CLOSE_TODAY))
+        parts = []
+        left = quantity
+        for bucket, effect in buckets:
+            part = min(left, holding.available(bucket))
+            if part > 0:
+                parts.append((effect, part))
+                left -= part
+        if left > 0:
+            return None
+        return parts
+
+    def reserve(self, order_id, order_book_id, side, position_effect, quantity):
+        # 冻结平仓单对应的可平数量，只在区分平今平昨的交易所经 split_close 拆分后调用
+        holding = self._holding(order_book_id, OPPOSITE_SIDE[side])
+        bucket = TODAY if position_effect == POSITION_EFFECT.CLOSE_TODAY else YESTERDAY
+        holding.frozen[bucket] += quantity
+        self._reservations[order_id] = (holding, bucket, quantity)
+
+    def release(self, order_id):
+        reservation = self._reservations.pop(order_id, None)
+        if reservation is not None:
+            holding, bucket, frozen = reservation
+            holding.frozen[bucket] -= frozen
+
+    def holding_list(self, order_book_id, side, bucket=TODAY):
+        holding = self.get(order_book_id, side)
+        return holding.holding_list(bucket) if holding is not None else []
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import ctypes
+import ctypes.util
+from threading import Thread, Event, Lock
+from timeit import default_timer
+
+from rqalpha.utils.logger import system_log
+
+
+CALLBACK_PREFIXES = ('onRtn', 'onRsp', 'onErr', 'onFront', 'onHeartBeat')
+
+# 直方图第 i 个桶统计耗时在 [2^(i-1), 2^i) 微秒内的调用，最后一个桶统计 2^(HISTOGRAM_SIZE-2) 微秒以上的调用
+HISTOGRAM_SIZE = 22
+
+
+def _make_thread_cpu_timer():
+    if hasattr(time, 'thread_time'):
+        return time.thread_time
+    try:
+        # Python 2 没有 thread_time，在 Linux 上直接调用 clock_gettime(CLOCK_THREAD_CPUTIME_ID)
+        class Timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'),
+                                    use_errno=True).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+        ts = Timespec()
+        ts_ref = ctypes.byref(ts)
+
+        def thread_time():
+            clock_gettime(3, ts_ref)
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        if clock_gettime(3, ts_ref) == 0:
+            return thread_time
+    except (OSError, AttributeError, TypeError):
+        pass
+    system_log.warn('当前平台无法获取线程 CPU 时间，回调 CPU 时间将以进程 CPU 时间统计')
+    return getattr(time, 'process_time', None) or time.clock
+
+
+thread_cpu_time = _make_thread_cpu_timer()
+
+
+class CallbackStats(object):
+    __slots__ = ('count', 'wall_total', 'wall_max', 'cpu_total', 'cpu_max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.wall_total = 0.
+        self.wall_max = 0.
+        self.cpu_total = 0.
+        self.cpu_max = 0.
+        self.histogram = [0] * HISTOGRAM_SIZE
+
+    def record(self, wall, cpu):
+        self.count += 1
+        self.wall_total += wall
+        self.cpu_total += cpu
+        if wall > self.wall_max:
+            self.wall_max = wall
+        if cpu > self.cpu_max:
+            self.cpu_max = cpu
+        self.histogram[min(int(wall * 1e6).bit_length(), HISTOGRAM_SIZE - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.wall_total += other.wall_total
+        self.cpu_total += other.cpu_total
+        self.wall_max = max(self.wall_max, other.wall_max)
+        self.cpu_max = max(self.cpu_max, other.cpu_max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, q):
+        """
+        由直方图估算的耗时分位数（秒），返回所在桶的上界，不超过最大耗时。
+        """
+        target = self.count * q
+        cum = 0
+        for i, n in enumerate(self.histogram):
+            cum += n
+            if cum >= target and n:
+                return min((1 << i) * 1e-6, self.wall_max)
+        return 0.
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'wall_total': self.wall_total,
+            'wall_max': self.wall_max,
+            'cpu_total': self.cpu_total,
+            'cpu_max': self.cpu_max,
+            'p50': self.percentile(.5),
+            'p99': self.percentile(.99),
+            'histogram': list(self.histogram),
+        }
+
+
+class CallbackProfiler(object):
+    """
+    CTP 回调耗时统计。
+
+    :meth:`profiled` 生成覆盖了全部回调的子类，每次回调记录墙钟时间及回调线程的 CPU 时间。多账户时同一个类有多个实例，
+    各自在自己的 CTP 线程中回调，因此统计按实例保存，每份统计只有一个线程写入，无需加锁；报告时按 (类名, 回调名)
+    合并各实例的统计，读取方得到的是近似值。
+    """
+    def __init__(self):
+        # (类名, 回调名) -> 各实例的 CallbackStats
+        self._stats = {}
+        self._classes = {}
+        self._lock = Lock()
+        self.overhead = None
+        self._stop = Event()
+
+    def profiled(self, cls):
+        profiled_cls = self._classes.get(cls)
+        if profiled_cls is None:
+            cls_name = cls.__name__
+            names = [name for name in dir(cls)
+                     if name.startswith(CALLBACK_PREFIXES) and callable(getattr(cls, name))]
+            namespace = {name: self._wrap(name, getattr(cls, name)) for name in names}
+            register = self._register
+
+            def __init__(instance, *args, **kwargs):
+                # 回调可能在父类的 __init__ 中开始，须先建立统计
+                instance._callback_stats = register(cls_name, names)
+                cls.__init__(instance, *args, **kwargs)
+            namespace['__init__'] = __init__
+            profiled_cls = self._classes[cls] = type('Profiled' + cls_name, (cls, ), namespace)
+        return profiled_cls
+
+    def _register(self, cls_name, names):
+        instance_stats = {name: CallbackStats() for name in names}
+        with self._lock:
+            for name, stats in instance_stats.items():
+                self._stats.setdefault((cls_name, name), []).append(stats)
+        return instance_stats
+
+    @staticmethod
+    def _wrap(name, method):
+        wall_timer = default_timer
+        cpu_timer = thread_cpu_time
+
+        def wrapper(instance, *args):
+            wall = wall_timer()
+            cpu = cpu_timer()
+            try:
+                return method(instance, *args)
+            finally:
+                instance._callback_stats[name].record(wall_timer() - wall, cpu_timer() - cpu)
+        wrapper.__name__ = name
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    def _merged(self):
+        with self._lock:
+            items = [(key, list(instance_stats)) for key, instance_stats in self._stats.items()]
+        merged = {}
+        for key, instance_stats in items:
+            stats = merged[key] = CallbackStats()
+            for s in instance_stats:
+                stats.merge(s)
+        return {key: stats for key, stats in merged.items() if stats.count}
+
+    def calibrate(self, n=20000):
+        """
+        测量包装层本身每次调用增加的耗时（秒）。
+        """
+        class Target(object):
+            def onRtnCalibrate(self, data):
+                pass
+
+        wrapped = CallbackProfiler().profiled(Target)()
+        plain = Target()
+        payloads = range(n)
+
+        start = default_timer()
+        for i in payloads:
+            plain.onRtnCalibrate(i)
+        plain_cost = default_timer() - start
+
+        start = default_timer()
+        for i in payloads:
+            wrapped.onRtnCalibrate(i)
+        wrapped_cost = default_timer() - start
+
+        self.overhead = max(wrapped_cost - plain_cost, 0.) / n
+        return self.overhead
+
+    def stats(self):
+        return {'%s.%s' % key: stats.to_dict() for key, stats in self._merged().items()}
+
+    def report(self):
+        lines = ['%-48s %9s %10s %9s %9s %9s %10s %9s' % (
+            'callback', 'count', 'wall(ms)', 'avg(us)', 'p99(us)', 'max(us)', 'cpu(ms)', 'max(us)')]
+        items = sorted(self._merged().items(), key=lambda item: item[1].wall_total, reverse=True)
+        for (cls_name, name), stats in items:
+            lines.append('%-48s %9d %10.1f %9.1f %9.0f %9.0f %10.1f %9.0f' % (
+                '%s.%s' % (cls_name, name), stats.count, stats.wall_total * 1e3,
+                stats.wall_total / stats.count * 1e6, stats.percentile(.99) * 1e6, stats.wall_max * 1e6,
+                stats.cpu_total * 1e3, stats.cpu_max * 1e6))
+        if self.overhead is not None:
+            lines.append('统计本身每次回调约增加 %.2fus' % (self.overhead * 1e6))
+        return '\n'.join(lines)
+
+    def start_reporting(self, interval):
+        def run():
+            while not self._stop.wait(interval):
+                system_log.info('CTP 回调耗时统计:\n{}', self.report())
+
+        thread = Thread(target=run, name='callback_profiler')
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop_reporting(self):
+        self._stop.set()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import deque
+from threading import Thread, Condition
+from time import time
+
+from rqalpha.utils.logger import system_log
+
+
+class TokenBucket(object):
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1
+        self._tokens = float(self.capacity)
+        self._last_time = time()
+
+    def _refill(self, now):
+        if now > self._last_time:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_time) * self.rate)
+        self._last_time = now
+
+    def wait_time(self, now):
+        if not self.rate:
+            return 0
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self, now):
+        if not self.rate:
+            return
+        self._refill(now)
+        self._tokens -= 1
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.
+        self.max_wait = 0.
+
+    def record(self, wait):
+        self.count += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'avg_wait': self.total_wait / self.count if self.count else 0.,
+            'max_wait': self.max_wait,
+        }
+
+
+class RequestQueue(object):
+    """
+    TD 会话的发送队列。
+
+    报单及撤单请求在策略线程中入队后立即返回，由后台线程按令牌桶限速发往柜台，撤单优先于报单。
+    """
+    def __init__(self, name, order_rate=None, cancel_rate=None):
+        self.name = name
+
+        self._orders = deque()
+        self._cancels = deque()
+        self._order_bucket = TokenBucket(order_rate)
+        self._cancel_bucket = TokenBucket(cancel_rate)
+        self._cond = Condition()
+
+        self._order_stats = RequestStats()
+        self._cancel_stats = RequestStats()
+
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name='%s_request_queue' % self.name)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def put_order(self, func, req, req_id):
+        with self._cond:
+            self._orders.append((time(), func, req, req_id))
+            self._cond.notify()
+
+    def put_cancel(self, func, req, req_id):
+        with self._cond:
+            self._cancels.append((time(), func, req, req_id))
+            self._cond.notify()
+
+    @property
+    def depth(self):
+        return len(self._orders) + len(self._cancels)
+
+    def stats(self):
+        return {
+            'order_depth': len(self._orders),
+            'cancel_depth': len(self._cancels),
+            'order': self._order_stats.to_dict(),
+            'cancel': self._cancel_stats.to_dict(),
+        }
+
+    def _next(self):
+        # 调用方需持有锁；返回 (请求, 统计) 或需等待的秒数
+        now = time()
+        wait = None
+        if self._cancels:
+            cancel_wait = self._cancel_bucket.wait_time(now)
+            if cancel_wait == 0:
+                self._cancel_bucket.consume(now)
+                return self._cancels.popleft(), self._cancel_stats
+            wait = cancel_wait
+        if self._orders:
+            order_wait = self._order_bucket.wait_time(now)
+            if order_wait == 0:
+                self._order_bucket.consume(now)
+                return self._orders.popleft(), self._order_stats
+            wait = order_wait if wait is None else min(wait, order_wait)
+        return wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not (self._orders or self._cancels):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                item = self._next()
+                if not isinstance(item, tuple):
+                    self._cond.wait(item)
+                    continue
+
+            (put_time, func, req, req_id), stats = item
+            stats.record(time() - put_time)
+            try:
+                func(req, req_id)
+            except Exception as e:
+                system_log.exception('{} 请求发送失败: {}', self.name, e)
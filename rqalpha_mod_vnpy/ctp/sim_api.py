@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import heapq
+from datetime import datetime, date
+from itertools import count
+from threading import Thread, Condition
+from time import time
+
+import six
+
+from rqalpha.const import COMMISSION_TYPE
+from rqalpha.utils.logger import system_log
+
+from .api import CtpTdApi
+from ..vnpy import defineDict
+from ..utils import make_order_book_id, make_instrument_id
+
+
+SUCCESS = {'ErrorID': 0, 'ErrorMsg': ''}
+
+CLOSE_FLAGS = (
+    defineDict['THOST_FTDC_OF_Close'],
+    defineDict['THOST_FTDC_OF_CloseToday'],
+    defineDict['THOST_FTDC_OF_CloseYesterday'],
+)
+
+# 上期所及能源中心区分平今与平昨
+CLOSE_TODAY_EXCHANGES = ('SHFE', 'INE')
+
+
+def sim_error(error_id, msg):
+    return {'ErrorID': error_id, 'ErrorMsg': msg.encode('GBK')}
+
+
+def load_bundle_instruments(bundle_path):
+    """
+    从 RQAlpha 数据包中读取当前上市的期货合约，生成 CTP 合约查询回报格式的数据。
+    """
+    from rqalpha.data.instrument_store import InstrumentStore
+    from rqalpha.data.future_info_cn import CN_FUTURE_INFO
+
+    instruments = []
+    commissions = {}
+    for ins in InstrumentStore(os.path.join(bundle_path, 'instruments.pk')).get_all_instruments():
+        if ins.type != 'Future' or not ins.order_book_id[-4:].isdigit():
+            continue
+        if not ins.listing:
+            continue
+        instruments.append({
+            'InstrumentID': make_instrument_id(ins.order_book_id, ins.exchange),
+            'ExchangeID': ins.exchange,
+            'VolumeMultiple': ins.contract_multiplier,
+            'LongMarginRatio': ins.margin_rate,
+            'ShortMarginRatio': ins.margin_rate,
+            'ExpireDate': ins.de_listed_date.strftime('%Y%m%d'),
+        })
+        info = CN_FUTURE_INFO.get(ins.underlying_symbol, {}).get('speculation')
+        if info is not None:
+            commissions[ins.order_book_id] = info
+    return instruments, commissions
+
+
+class Scheduler(object):
+    """
+    单线程定时执行器，模拟柜台的回调线程。
+    """
+    def __init__(self, name):
+        self._name = name
+        self._heap = []
+        self._seq = count()
+        self._cond = Condition()
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        thread = Thread(target=self._run, name=self._name)
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def call_later(self, delay, func, *args):
+        with self._cond:
+            heapq.heappush(self._heap, (time() + delay, next(self._seq), func, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._heap:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                due = self._heap[0][0] - time()
+                if due > 0:
+                    self._cond.wait(due)
+                    continue
+                _, _, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception as e:
+                system_log.exception('模拟柜台回调执行失败: {}', e)
+
+
+class SimOrder(object):
+    def __init__(self, req, front_id, session_id, order_sys_id, exchange_id):
+        self.req = req
+        self.front_id = front_id
+        self.session_id = session_id
+        self.order_sys_id = order_sys_id
+        self.exchange_id = exchange_id
+        self.order_book_id = make_order_book_id(req['InstrumentID'])
+        self.is_buy = req['Direction'] == defineDict['THOST_FTDC_D_Buy']
+        self.is_market = req['OrderPriceType'] == defineDict['THOST_FTDC_OPT_AnyPrice']
+        self.price = req['LimitPrice']
+        self.volume = req['VolumeTotalOriginal']
+        self.volume_traded = 0
+        self.status = defineDict['THOST_FTDC_OST_NoTradeQueueing']
+        self.queue_ahead = 0
+
+    @property
+    def remaining(self):
+        return self.volume - self.volume_traded
+
+    @property
+    def is_active(self):
+        return self.status in (defineDict['THOST_FTDC_OST_NoTradeQueueing'],
+                               defineDict['THOST_FTDC_OST_PartTradedQueueing'])
+
+    def to_data(self):
+        data = dict(self.req)
+        data.update({
+            'FrontID': self.front_id,
+            'SessionID': self.session_id,
+            'ExchangeID': self.exchange_id,
+            'OrderSysID': self.order_sys_id,
+            'VolumeTraded': self.volume_traded,
+            'OrderStatus': self.status,
+        })
+        return data
+
+
+class SimPosition(object):
+    def __init__(self):
+        self.yd = 0
+        self.today = 0
+        self.open_cost = 0.
+
+    @property
+    def position(self):
+        return self.yd + self.today
+
+    def roll(self):
+        # 交易日切换，今仓转为昨仓
+        self.yd += self.today
+        self.today = 0
+
+
+class SimTdApi(CtpTdApi):
+    """
+    本地模拟交易柜台。
+
+    继承 CtpTdApi 并替换其底层的请求函数，所有回调仍经由 CtpTdApi 的 onRtnOrder、onRtnTrade、onRspQry* 处理，
+    报单以 DataCache 中的行情快照撮合，可设置报单延迟并模拟限价单的排队位置。同一笔行情的对手价一档挂单量被多个报单
+    依次吃掉，不会重复成交。交易日以行情的交易日为准，切换时今仓转为昨仓，并以各合约上一交易日的最新价作为昨结算价。
+    """
+    def __init__(self, gateway, temp_path, user_id, password, broker_id, address, instruments, commissions,
+                 starting_cash, latency=0., queue_position=True, api_name='sim_td', **kwargs):
+        super(SimTdApi, self).__init__(gateway, temp_path, user_id, password, broker_id, address, None, None,
+                                       api_name=api_name, **kwargs)
+
+        self._instruments = {make_order_book_id(data['InstrumentID']): data for data in instruments}
+        self._commissions = commissions
+        self._starting_cash = starting_cash
+        self._latency = latency
+        self._queue_position = queue_position
+
+        self._scheduler = Scheduler(api_name)
+        self._sim_front_id = 1
+        self._sim_session_id = int(time()) % 100000000
+        self._sys_id_gen = count(1)
+        self._trade_id_gen = count(1)
+
+        self._orders = {}
+        self._active_orders = {}
+        self._positions = {}
+        self._last_volume = {}
+        self._last_prices = {}
+        self._settlement_prices = {}
+        # (order_book_id, 是否买入) -> (行情, 价格, 该价位已成交的量)
+        self._consumed = {}
+        self._trading_day = None
+
+        gateway.add_tick_hook(self._on_tick)
+
+    # ---------------------------- 替换底层接口 ----------------------------
+
+    def createFtdcTraderApi(self, path):
+        self._scheduler.start()
+
+    def subscribePrivateTopic(self, n):
+        pass
+
+    def subscribePublicTopic(self, n):
+        pass
+
+    def registerFront(self, address):
+        pass
+
+    def init(self):
+        self._scheduler.call_later(0, self.onFrontConnected)
+
+    def exit(self):
+        self._scheduler.stop()
+
+    def reqAuthenticate(self, req, n):
+        self._scheduler.call_later(0, self.onRspAuthenticate, {}, SUCCESS, n, True)
+
+    def reqUserLogin(self, req, n):
+        data = {'FrontID': self._sim_front_id, 'SessionID': self._sim_session_id}
+        self._scheduler.call_later(0, self.onRspUserLogin, data, SUCCESS, n, True)
+
+    def reqSettlementInfoConfirm(self, req, n):
+        self._scheduler.call_later(0, self.onRspSettlementInfoConfirm, {}, SUCCESS, n, True)
+
+    def reqQryInstrument(self, req, n):
+        self._scheduler.call_later(0, self._rsp_qry_instrument, n)
+
+    def reqQryInstrumentCommissionRate(self, req, n):
+        self._scheduler.call_later(0, self._rsp_qry_commission, req, n)
+
+    def reqQryTradingAccount(self, req, n):
+        data = {'PreBalance': self._starting_cash}
+        self._scheduler.call_later(0, self.onRspQryTradingAccount, data, SUCCESS, n, True)
+
+    def reqQryInvestorPosition(self, req, n):
+        self._scheduler.call_later(0, self._rsp_qry_position, n)
+
+    def reqQryInvestorPositionDetail(self, req, n):
+        self._scheduler.call_later(0, self._rsp_qry_position_detail, n)
+
+    def reqQryOrder(self, req, n):
+        self._scheduler.call_later(0, self._rsp_qry_order, n)
+
+    def reqOrderInsert(self, req, n):
+        self._scheduler.call_later(self._latency, self._on_order_insert, dict(req), n)
+
+    def reqOrderAction(self, req, n):
+        self._scheduler.call_later(self._latency, self._on_order_action, dict(req), n)
+
+    # ---------------------------- 查询 ----------------------------
+
+    def _rsp_qry_instrument(self, n):
+        instruments = list(self._instruments.values())
+        if not instruments:
+            self.onRspQryInstrument({'InstrumentID': ''}, SUCCESS, n, True)
+        for i, data in enumerate(instruments):
+            self.onRspQryInstrument(data, SUCCESS, n, i == len(instruments) - 1)
+
+    def _rsp_qry_commission(self, req, n):
+        info = self._commissions.get(make_order_book_id(req['InstrumentID']), {})
+        by_money = info.get('commission_type', COMMISSION_TYPE.BY_MONEY) == COMMISSION_TYPE.BY_MONEY
+        data = {
+            'InstrumentID': req['InstrumentID'],
+            'OpenRatioByMoney': info.get('open_commission_ratio', 0) if by_money else 0,
+            'CloseRatioByMoney': info.get('close_commission_ratio', 0) if by_money else 0,
+            'CloseTodayRatioByMoney': info.get('close_commission_today_ratio', 0) if by_money else 0,
+            'OpenRatioByVolume': 0 if by_money else info.get('open_commission_ratio', 0),
+            'CloseRatioByVolume': 0 if by_money else info.get('close_commission_ratio', 0),
+            'CloseTodayRatioByVolume': 0 if by_money else info.get('close_commission_today_ratio', 0),
+        }
+        self.onRspQryInstrumentCommissionRate(data, SUCCESS, n, True)
+
+    def _rsp_qry_position(self, n):
+        items = [(key, pos) for key, pos in self._positions.items() if pos.position > 0]
+        if not items:
+            self.onRspQryInvestorPosition({'InstrumentID': ''}, SUCCESS, n, True)
+        for i, ((order_book_id, is_buy), pos) in enumerate(items):
+            data = {
+                'InstrumentID': self._instruments[order_book_id]['InstrumentID'],
+                'PosiDirection': defineDict['THOST_FTDC_PD_Long'] if is_buy else defineDict['THOST_FTDC_PD_Short'],
+                'YdPosition': pos.yd,
+                'TodayPosition': pos.today,
+                'Position': pos.position,
+                'Commission': 0.,
+                'CloseProfit': 0.,
+                'OpenCost': pos.open_cost,
+                'PreSettlementPrice': self._settlement_price(order_book_id, pos),
+            }
+            self.onRspQryInvestorPosition(data, SUCCESS, n, i == len(items) - 1)
+
+    def _settlement_price(self, order_book_id, pos):
+        # 尚未经历交易日切换时以开仓均价代替
+        settlement_price = self._settlement_prices.get(order_book_id)
+        if settlement_price is None:
+            return pos.open_cost / (pos.position * self._instruments[order_book_id]['VolumeMultiple'])
+        return settlement_price
+
+    def _rsp_qry_position_detail(self, n):
+        # 模拟柜台不记录逐笔持仓，今仓及昨仓各以开仓均价返回一条
+        trading_day = str(self._trading_day) if self._trading_day else date.today().strftime('%Y%m%d')
+        items = []
+        for (order_book_id, is_buy), pos in self._positions.items():
+            if pos.position <= 0:
+                continue
+            data = self._instruments[order_book_id]
+            open_price = pos.open_cost / (pos.position * data['VolumeMultiple'])
+            for volume, open_date in ((pos.yd, ''), (pos.today, trading_day)):
+                if volume > 0:
+                    items.append({
+                        'InstrumentID': data['InstrumentID'],
+                        'ExchangeID': data['ExchangeID'],
+                        'Direction': defineDict['THOST_FTDC_D_Buy'] if is_buy else defineDict['THOST_FTDC_D_Sell'],
+                        'TradeID': '',
+                        'OpenDate': open_date,
+                        'TradingDay': trading_day,
+                        'Volume': volume,
+                        'OpenPrice': open_price,
+                    })
+        if not items:
+            self.onRspQryInvestorPositionDetail({'InstrumentID': ''}, SUCCESS, n, True)
+        for i, data in enumerate(items):
+            self.onRspQryInvestorPositionDetail(data, SUCCESS, n, i == len(items) - 1)
+
+    def _rsp_qry_order(self, n):
+        orders = list(self._orders.values())
+        if not orders:
+            self.onRspQryOrder({'InstrumentID': ''}, SUCCESS, n, True)
+        for i, sim_order in enumerate(orders):
+            self.onRspQryOrder(sim_order.to_data(), SUCCESS, n, i == len(orders) - 1)
+
+    # ---------------------------- 撮合 ----------------------------
+
+    def _on_order_insert(self, req, n):
+        ins_data = self._instruments.get(make_order_book_id(req['InstrumentID']))
+        if ins_data is None:
+            req['ExchangeID'] = ''
+            self.onErrRtnOrderInsert(req, sim_error(16, u'CTP:找不到合约'))
+            return
+
+        exchange_id = req['ExchangeID'] = ins_data['ExchangeID']
+        offset_flag = req['CombOffsetFlag']
+        if offset_flag in CLOSE_FLAGS:
+            order_book_id = make_order_book_id(req['InstrumentID'])
+            is_buy = req['Direction'] == defineDict['THOST_FTDC_D_Buy']
+            pos = self._position(order_book_id, not is_buy)
+            if exchange_id in CLOSE_TODAY_EXCHANGES:
+                close_today = offset_flag == defineDict['THOST_FTDC_OF_CloseToday']
+                available = pos.today if close_today else pos.yd
+            else:
+                close_today = None
+                available = pos.position
+            # 已报出、尚未成交的平仓单冻结相应的可平数量
+            available -= self._frozen_close(order_book_id, is_buy, close_today)
+            if req['VolumeTotalOriginal'] > available:
+                self.onErrRtnOrderInsert(req, sim_error(30, u'CTP:平仓量超过持仓量'))
+                return
+
+        # 编号带上会话号，重启后不与之前的回报重复
+        order_sys_id = '%d%06d' % (self._sim_session_id, next(self._sys_id_gen))
+        sim_order = SimOrder(req, self._sim_front_id, self._sim_session_id, order_sys_id, exchange_id)
+        key = (sim_order.front_id, sim_order.session_id, req['OrderRef'])
+        self._orders[key] = sim_order
+        self.onRtnOrder(sim_order.to_data())
+
+        tick = self.gateway.get_snapshot(sim_order.order_book_id)
+        if tick is not None:
+            self._match_aggressive(sim_order, tick)
+        if sim_order.is_active:
+            if sim_order.is_market:
+                # 市价单未能立即成交的部分撤销
+                self._cancel(sim_order)
+                return
+            self._active_orders[key] = sim_order
+            if tick is not None:
+                sim_order.queue_ahead = self._queue_volume(sim_order, tick)
+
+    def _on_order_action(self, req, n):
+        key = (req['FrontID'], req['SessionID'], req['OrderRef'])
+        sim_order = self._active_orders.get(key)
+        if sim_order is None:
+            self.onRspOrderAction(req, sim_error(26, u'CTP:报单已全成交或已撤销，不能再撤'), n, True)
+            return
+        self._cancel(sim_order)
+
+    def _on_tick(self, tick_dict):
+        self._scheduler.call_later(0, self._match_tick, tick_dict)
+
+    def _frozen_close(self, order_book_id, is_buy, close_today):
+        """
+        同一方向尚未成交的平仓量。close_today 为 True、False 时只统计平今或平昨单，为 None 时统计全部平仓单。
+        """
+        frozen = 0
+        for sim_order in six.itervalues(self._active_orders):
+            if sim_order.order_book_id != order_book_id or sim_order.is_buy != is_buy:
+                continue
+            offset_flag = sim_order.req['CombOffsetFlag']
+            if offset_flag not in CLOSE_FLAGS:
+                continue
+            if close_today is None or (offset_flag == defineDict['THOST_FTDC_OF_CloseToday']) == close_today:
+                frozen += sim_order.remaining
+        return frozen
+
+    def _roll_trading_day(self, trading_day):
+        if trading_day == self._trading_day:
+            return
+        if self._trading_day is not None:
+            for pos in six.itervalues(self._positions):
+                pos.roll()
+            # 模拟柜台没有结算价，以上一交易日的最新价代替
+            self._settlement_prices.update(self._last_prices)
+        self._trading_day = trading_day
+
+    def _match_tick(self, tick):
+        self._roll_trading_day(tick.date)
+        order_book_id = tick.order_book_id
+        if tick.last:
+            self._last_prices[order_book_id] = tick.last
+        last_volume = self._last_volume.get(order_book_id)
+        self._last_volume[order_book_id] = tick.volume
+        delta_volume = tick.volume - last_volume if last_volume is not None and tick.volume >= last_volume else 0
+
+        for key, sim_order in list(self._active_orders.items()):
+            if sim_order.order_book_id != order_book_id:
+                continue
+            self._match_aggressive(sim_order, tick)
+            if sim_order.is_active:
+                self._match_passive(sim_order, tick, delta_volume)
+
+    def _match_aggressive(self, sim_order, tick):
+        if sim_order.is_buy:
+            price, volume = tick.a1, tick.a1_v
+            crossed = price and (sim_order.is_market or sim_order.price >= price)
+        else:
+            price, volume = tick.b1, tick.b1_v
+            crossed = price and (sim_order.is_market or sim_order.price <= price)
+        if not crossed or not volume:
+            return
+        # 同一笔行情在报单时及行情到达时都可能用于撮合，以成交量及时间区分
+        key = (sim_order.order_book_id, sim_order.is_buy)
+        tick_key = (tick.date, tick.time, tick.volume)
+        consumed = self._consumed.get(key)
+        if consumed is not None and consumed[0] == tick_key and consumed[1] == price:
+            volume -= consumed[2]
+        else:
+            consumed = (tick_key, price, 0)
+        volume = min(volume, sim_order.remaining)
+        if volume > 0:
+            self._consumed[key] = (tick_key, price, consumed[2] + volume)
+            self._fill(sim_order, price, volume)
+
+    def _match_passive(self, sim_order, tick, delta_volume):
+        last = tick.last
+        if not last:
+            return
+        price = sim_order.price
+        if (sim_order.is_buy and last < price) or (not sim_order.is_buy and last > price):
+            self._fill(sim_order, price, sim_order.remaining)
+        elif last == price and delta_volume:
+            if self._queue_position:
+                sim_order.queue_ahead -= delta_volume
+                if sim_order.queue_ahead < 0:
+                    self._fill(sim_order, price, min(-sim_order.queue_ahead, sim_order.remaining))
+                    sim_order.queue_ahead = 0
+            else:
+                self._fill(sim_order, price, sim_order.remaining)
+
+    @staticmethod
+    def _queue_volume(sim_order, tick):
+        # 挂单时同价位已有的挂单量视为排在前面的量
+        side = 'b' if sim_order.is_buy else 'a'
+        for level in range(1, 6):
+            if tick['%s%d' % (side, level)] == sim_order.price:
+                return tick['%s%d_v' % (side, level)]
+        return 0
+
+    def _position(self, order_book_id, is_buy):
+        key = (order_book_id, is_buy)
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._positions[key] = SimPosition()
+        return pos
+
+    def _update_position(self, sim_order, price, volume):
+        offset_flag = sim_order.req['CombOffsetFlag']
+        multiplier = self._instruments[sim_order.order_book_id]['VolumeMultiple']
+        if offset_flag == defineDict['THOST_FTDC_OF_Open']:
+            pos = self._position(sim_order.order_book_id, sim_order.is_buy)
+            pos.today += volume
+            pos.open_cost += price * volume * multiplier
+            return
+
+        pos = self._position(sim_order.order_book_id, not sim_order.is_buy)
+        avg_cost = pos.open_cost / pos.position if pos.position else 0
+        if offset_flag == defineDict['THOST_FTDC_OF_CloseToday']:
+            pos.today -= volume
+        else:
+            from_yd = min(pos.yd, volume)
+            pos.yd -= from_yd
+            pos.today -= volume - from_yd
+        pos.open_cost -= avg_cost * volume
+
+    def _fill(self, sim_order, price, volume):
+        if volume <= 0:
+            return
+        sim_order.volume_traded += volume
+        if sim_order.remaining == 0:
+            sim_order.status = defineDict['THOST_FTDC_OST_AllTraded']
+            self._active_orders.pop((sim_order.front_id, sim_order.session_id, sim_order.req['OrderRef']), None)
+        else:
+            sim_order.status = defineDict['THOST_FTDC_OST_PartTradedQueueing']
+        self._update_position(sim_order, price, volume)
+
+        self.onRtnOrder(sim_order.to_data())
+        self.onRtnTrade({
+            'InstrumentID': sim_order.req['InstrumentID'],
+            'OrderRef': sim_order.req['OrderRef'],
+            'OrderSysID': sim_order.order_sys_id,
+            'ExchangeID': sim_order.exchange_id,
+            'TradeID': '%d%06d' % (self._sim_session_id, next(self._trade_id_gen)),
+            'Direction': sim_order.req['Direction'],
+            'OffsetFlag': sim_order.req['CombOffsetFlag'],
+            'Price': price,
+            'Volume': volume,
+            'TradeDate': date.today().strftime('%Y%m%d'),
+            'TradeTime': datetime.now().strftime('%H:%M:%S'),
+        })
+
+    def _cancel(self, sim_order):
+        sim_order.status = defineDict['THOST_FTDC_OST_Canceled']
+        self._active_orders.pop((sim_order.front_id, sim_order.session_id, sim_order.req['OrderRef']), None)
+        self.onRtnOrder(sim_order.to_data())
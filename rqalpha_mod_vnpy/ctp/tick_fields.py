@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import six
+
+
+# CTP 以 DBL_MAX 表示没有报价
+INVALID_PRICE = 1e300
+
+DERIVED_FIELDS = ('delta_volume', 'delta_turnover', 'vwap', 'tick_vwap', 'mid', 'spread')
+
+
+class DerivedTickFields(object):
+    """
+    由行情的累计成交量、成交额及一档盘口计算的派生字段，每笔行情计算一次并写入 TickDict：
+
+    * delta_volume、delta_turnover：与该合约上一笔行情之间的成交量及成交额
+    * vwap：当日成交均价；tick_vwap：与上一笔行情之间的成交均价，没有成交时为 None
+    * mid、spread：一档买卖价的中间价及价差，任一侧没有报价时为 None
+
+    上一笔行情的交易日及累计值按合约槽位保存在列表中。交易日变化或累计值减小时从 0 起算；
+    启动后某合约的第一笔行情无从得知此前的累计值，增量记为 0。只在行情回调线程中调用。
+    """
+    def __init__(self, market):
+        self._market = market
+        self._slots = {}
+        self._trading_day = []
+        self._volume = []
+        self._turnover = []
+        self._multiplier = []
+
+    def _multiplier_of(self, order_book_id):
+        ins_dict = self._market.ins.get(order_book_id)
+        if ins_dict is None or not ins_dict.contract_multiplier:
+            return None
+        return ins_dict.contract_multiplier
+
+    def refresh_multipliers(self):
+        for order_book_id, slot in six.iteritems(self._slots):
+            self._multiplier[slot] = self._multiplier_of(order_book_id)
+
+    def update(self, tick):
+        # 热点路径，直接读写字典项，不经过 DataDict 的属性访问
+        order_book_id = tick['order_book_id']
+        trading_day = tick['date']
+        volume = tick['volume']
+        turnover = tick['total_turnover']
+
+        slot = self._slots.get(order_book_id)
+        if slot is None:
+            slot = self._slots[order_book_id] = len(self._volume)
+            self._trading_day.append(trading_day)
+            self._volume.append(volume)
+            self._turnover.append(turnover)
+            self._multiplier.append(self._multiplier_of(order_book_id))
+            delta_volume = 0
+            delta_turnover = 0.
+        else:
+            if trading_day != self._trading_day[slot] or volume < self._volume[slot]:
+                self._trading_day[slot] = trading_day
+                delta_volume = volume
+                delta_turnover = turnover
+            else:
+                delta_volume = volume - self._volume[slot]
+                delta_turnover = turnover - self._turnover[slot]
+            self._volume[slot] = volume
+            self._turnover[slot] = turnover
+
+        tick['delta_volume'] = delta_volume
+        tick['delta_turnover'] = delta_turnover
+        multiplier = self._multiplier[slot]
+        if multiplier is not None:
+            if volume:
+                tick['vwap'] = turnover / (volume * multiplier)
+            if delta_volume:
+                tick['tick_vwap'] = delta_turnover / (delta_volume * multiplier)
+
+        bid = tick['b1']
+        ask = tick['a1']
+        if 0 < bid < INVALID_PRICE and 0 < ask < INVALID_PRICE:
+            tick['mid'] = (bid + ask) * .5
+            tick['spread'] = ask - bid
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import six
+
+from rqalpha.events import EVENT
+from rqalpha.model.account.future_account import FutureAccount
+
+
+# FutureAccount.register_event 注册的事件及处理函数
+ACCOUNT_EVENT_HANDLERS = (
+    (EVENT.SETTLEMENT, '_settlement'),
+    (EVENT.ORDER_PENDING_NEW, '_on_order_pending_new'),
+    (EVENT.ORDER_CREATION_REJECT, '_on_order_creation_reject'),
+    (EVENT.ORDER_CANCELLATION_PASS, '_on_order_unsolicited_update'),
+    (EVENT.ORDER_UNSOLICITED_UPDATE, '_on_order_unsolicited_update'),
+    (EVENT.TRADE, '_on_trade'),
+)
+
+
+class ValuationEngine(object):
+    """
+    向量化的持仓估值。
+
+    按合约槽位在 NumPy 数组中保存多空持仓数量、持仓成本、合约乘数及保证金率。行情到达时只写入价格数组，
+    读取时对此前到达的整批行情做一次向量化计算，得到浮动盈亏及保证金。持仓数量及成本仅在成交或结算时更新。
+    """
+    def __init__(self, data_cache, capacity=64):
+        self._cache = data_cache
+        self._slots = {}
+        self._size = 0
+        self._capacity = 0
+
+        self._buy_quantity = None
+        self._sell_quantity = None
+        self._buy_cost = None
+        self._sell_cost = None
+        self._multiplier = None
+        self._margin_rate = None
+        self._price = None
+        self._grow(capacity)
+
+        self._dirty = True
+        self._holding_pnl = 0.
+        self._buy_margin = 0.
+        self._sell_margin = 0.
+
+    def _grow(self, capacity):
+        def grow(array, fill=0.):
+            new = np.full(capacity, fill)
+            if array is not None:
+                new[:self._size] = array[:self._size]
+            return new
+
+        self._buy_quantity = grow(self._buy_quantity)
+        self._sell_quantity = grow(self._sell_quantity)
+        self._buy_cost = grow(self._buy_cost)
+        self._sell_cost = grow(self._sell_cost)
+        self._multiplier = grow(self._multiplier)
+        self._margin_rate = grow(self._margin_rate)
+        self._price = grow(self._price, np.nan)
+        self._capacity = capacity
+
+    def _slot_of(self, position):
+        order_book_id = position.order_book_id
+        slot = self._slots.get(order_book_id)
+        if slot is None:
+            if self._size == self._capacity:
+                self._grow(self._capacity * 2)
+            slot = self._size
+            self._multiplier[slot] = position.contract_multiplier
+            self._margin_rate[slot] = position.margin_rate
+            tick = self._cache.snapshot.get(order_book_id)
+            if tick is not None and tick.last:
+                self._price[slot] = tick.last
+            self._size += 1
+            self._slots[order_book_id] = slot
+        return slot
+
+    def reset(self, positions):
+        self._slots = {}
+        self._size = 0
+        self._price[:] = np.nan
+        for position in six.itervalues(positions):
+            self.update_position(position)
+
+    def update_position(self, position):
+        slot = self._slot_of(position)
+        self._buy_quantity[slot] = position.buy_quantity
+        self._sell_quantity[slot] = position.sell_quantity
+        self._buy_cost[slot] = position._buy_holding_cost
+        self._sell_cost[slot] = position._sell_holding_cost
+        self._dirty = True
+
+    def set_price(self, order_book_id, price):
+        slot = self._slots.get(order_book_id)
+        if slot is not None and price:
+            self._price[slot] = price
+            self._dirty = True
+
+    def refresh(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        n = self._size
+        value = self._multiplier[:n] * self._price[:n]
+        buy_cost = self._buy_cost[:n]
+        sell_cost = self._sell_cost[:n]
+        margin_rate = self._margin_rate[:n]
+        # 尚无行情的合约价格为 NaN，其浮动盈亏不计入
+        self._holding_pnl = float(np.nansum(
+            self._buy_quantity[:n] * value - buy_cost + sell_cost - self._sell_quantity[:n] * value))
+        self._buy_margin = float(np.dot(buy_cost, margin_rate))
+        self._sell_margin = float(np.dot(sell_cost, margin_rate))
+
+    @property
+    def holding_pnl(self):
+        self.refresh()
+        return self._holding_pnl
+
+    @property
+    def buy_margin(self):
+        self.refresh()
+        return self._buy_margin
+
+    @property
+    def sell_margin(self):
+        self.refresh()
+        return self._sell_margin
+
+    @property
+    def margin(self):
+        self.refresh()
+        return self._buy_margin + self._sell_margin
+
+
+class VNPYFutureAccount(FutureAccount):
+    """
+    保证金及浮动盈亏由 :class:`ValuationEngine` 批量计算的期货账户。
+    """
+    def __init__(self, total_cash, positions, valuation, backward_trade_set=None, register_event=True,
+                 account_name=None):
+        if backward_trade_set is None:
+            backward_trade_set = set()
+        # 账户所属网关的名称，订单及成交事件以此区分账户
+        self.account_name = account_name
+        self._valuation = valuation
+        self._settling = False
+        super(VNPYFutureAccount, self).__init__(total_cash, positions, backward_trade_set, register_event)
+        valuation.reset(positions)
+
+    def rebuild(self, total_cash, positions, frozen_cash):
+        """
+        以重新同步的数据在原对象上重建账户，风控、portfolio 及事件监听持有的引用保持有效。
+        已处理的成交编号保留，同步后重传的成交不会重复计入。
+        """
+        self._total_cash = total_cash
+        self._positions = positions
+        self._frozen_cash = frozen_cash
+        self._transaction_cost = 0
+        self._valuation.reset(positions)
+
+    @property
+    def margin(self):
+        if self._settling:
+            return super(VNPYFutureAccount, self).margin
+        return self._valuation.margin
+
+    @property
+    def buy_margin(self):
+        if self._settling:
+            return super(VNPYFutureAccount, self).buy_margin
+        return self._valuation.buy_margin
+
+    @property
+    def sell_margin(self):
+        if self._settling:
+            return super(VNPYFutureAccount, self).sell_margin
+        return self._valuation.sell_margin
+
+    @property
+    def holding_pnl(self):
+        if self._settling:
+            return super(VNPYFutureAccount, self).holding_pnl
+        return self._valuation.holding_pnl
+
+    def _apply_trade(self, trade):
+        super(VNPYFutureAccount, self)._apply_trade(trade)
+        self._valuation.update_position(self._positions[trade.order_book_id])
+
+    def _settlement(self, event):
+        # 结算过程中持仓被逐个修改，期间按持仓逐个计算，完成后重新同步估值数组
+        self._settling = True
+        try:
+            super(VNPYFutureAccount, self)._settlement(event)
+        finally:
+            self._settling = False
+        self._valuation.reset(self._positions)
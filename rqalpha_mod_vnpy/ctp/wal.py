@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+报单、订单回报及成交回报的预写日志，用于进程崩溃后快速恢复。
+
+每个账户每天一个文件，记录依次为合约、费率、同步快照（资金、持仓及订单查询结果）、报单、订单回报及成交回报。
+每条记录由 ``<I I Q B`` 头（记录体长度、CRC32、序号、类型）及 pickle 序列化的记录体组成。
+写入在调用线程中完成，fsync 由后台线程每隔 sync_interval 秒批量执行；sync_interval 为 0 时每条记录写入后立即 fsync。
+记录附带的私有流回报键在该记录 fsync 之后才交给 durable listener（FlowIndex.persist）写入。
+"""
+
+import os
+import struct
+import zlib
+from datetime import date
+from threading import Thread, Event, Lock
+
+from six.moves import cPickle as pickle
+
+from rqalpha.utils.logger import system_log
+
+
+INSTRUMENTS = 1
+COMMISSION = 2
+SYNC = 3
+SUBMIT = 4
+ORDER = 5
+TRADE = 6
+
+HEADER = struct.Struct('<IIQB')
+
+
+def wal_path(directory, account, day=None):
+    return os.path.join(directory, '%s_%s.wal' % (account, (day or date.today()).strftime('%Y%m%d')))
+
+
+def read_records(path):
+    """
+    依次返回 (序号, 类型, 记录体) 及读取结束的位置。文件末尾写了一半或校验失败的记录及其后的内容被忽略。
+    """
+    records = []
+    end = 0
+    if not os.path.exists(path):
+        return records, end
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            size, crc, seq, kind = HEADER.unpack(header)
+            body = f.read(size)
+            if len(body) < size or zlib.crc32(body) & 0xffffffff != crc:
+                break
+            try:
+                payload = pickle.loads(body)
+            except Exception:
+                break
+            records.append((seq, kind, payload))
+            end = f.tell()
+    return records, end
+
+
+class WriteAheadLog(object):
+    """
+    单个账户的预写日志，文件位于 directory 下并按日期区分，跨日后由 :meth:`recover` 切换到当天的文件。
+    """
+    def __init__(self, directory, account, sync_interval=0.05):
+        self._directory = directory
+        self._account = account
+        self._sync_interval = sync_interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._dirty = False
+        self._file = None
+        self._day = None
+        self._records = []
+        # 已写入、尚未 fsync 的记录附带的回报键
+        self._pending_keys = []
+        self._durable_listener = None
+        self.seq = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._open(date.today())
+
+    def _open(self, day):
+        path = wal_path(self._directory, self._account, day)
+        records, end = read_records(path)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        f = open(path, 'ab')
+        if size != end:
+            # 丢弃上次崩溃时写了一半的记录
+            system_log.warn('预写日志 {} 末尾有 {} 字节不完整的记录，已截断', path, size - end)
+            f.truncate(end)
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._publish(self._take_keys())
+            self._file = f
+            self._day = day
+            self._records = records
+            self.seq = records[-1][0] if records else 0
+
+    @property
+    def path(self):
+        return self._file.name
+
+    def recover(self):
+        """
+        返回当天日志中打开时已有记录所对应的 :class:`RecoveredState`，同一天内只返回一次。
+        """
+        if self._day != date.today():
+            self._open(date.today())
+        records, self._records = self._records, []
+        return RecoveredState(records)
+
+    def set_durable_listener(self, listener):
+        """
+        listener(keys) 在 keys 对应的记录 fsync 之后调用，可能在后台线程中调用。
+        """
+        self._durable_listener = listener
+
+    def append(self, kind, payload, flow_key=None):
+        body = pickle.dumps(payload, 2)
+        with self._lock:
+            self.seq += 1
+            self._file.write(HEADER.pack(len(body), zlib.crc32(body) & 0xffffffff, self.seq, kind))
+            self._file.write(body)
+            if flow_key is not None:
+                self._pending_keys.append(flow_key)
+            if self._sync_interval:
+                self._dirty = True
+            else:
+                self._sync()
+                self._publish(self._take_keys())
+            return self.seq
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _take_keys(self):
+        keys, self._pending_keys = self._pending_keys, []
+        return keys
+
+    def _publish(self, keys):
+        if keys and self._durable_listener is not None:
+            self._durable_listener(keys)
+
+    def start(self):
+        if not self._sync_interval or self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self._sync_interval):
+                self.sync()
+
+        self._thread = Thread(target=run, name='wal_sync')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def sync(self):
+        with self._lock:
+            if not self._dirty or self._file.closed:
+                return
+            self._file.flush()
+            self._dirty = False
+            fileno = self._file.fileno()
+            # 取出的键对应的记录都已 flush，fsync 之后即可写入
+            keys = self._take_keys()
+        # fsync 期间不阻塞写入方；此时文件恰好因跨日被关闭的，关闭前已经 fsync
+        try:
+            os.fsync(fileno)
+        except OSError:
+            pass
+        self._publish(keys)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+                self._publish(self._take_keys())
+
+
+class RecoveredState(object):
+    """
+    按顺序应用预写日志中的记录后得到的状态。同步快照之后的订单回报合并进快照中的订单查询结果。
+    """
+    def __init__(self, records):
+        self.ins = None
+        self.commissions = {}
+        self.account = None
+        self.positions = None
+        self.orders = None
+        self.submits = []
+        self.trades = {}
+        self.trades_since_sync = 0
+        self.seq = 0
+        for seq, kind, payload in records:
+            self.apply(kind, payload)
+            self.seq = seq
+
+    @property
+    def synced(self):
+        return self.account is not None
+
+    def apply(self, kind, payload):
+        if kind == INSTRUMENTS:
+            self.ins = payload
+        elif kind == COMMISSION:
+            underlying_symbol, commission_dict = payload
+            self.commissions[underlying_symbol] = commission_dict
+        elif kind == SYNC:
+            self.account, self.positions, self.orders = payload
+            self.trades_since_sync = 0
+        elif kind == SUBMIT:
+            self.submits.append(payload)
+        elif kind == ORDER:
+            if self.orders is not None:
+                self.orders[(payload.front_id, payload.session_id, payload.order_ref)] = payload
+        elif kind == TRADE:
+            if payload.trade_id not in self.trades:
+                self.trades[payload.trade_id] = payload
+                self.trades_since_sync += 1
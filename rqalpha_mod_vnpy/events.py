@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from enum import Enum
+
+
+class VNPY_EVENT(Enum):
+    """
+    本 mod 在 rqalpha 内置事件之外发出的事件，同样经由 event_bus 分发。
+    """
+    # 定时器到期，event.timer 为到期的 Timer
+    TIMER = 'vnpy_timer'
+    # 主力合约切换，event.underlying_symbol 为品种，event.previous 为原主力合约（启动后首次确定时为 None），
+    # event.order_book_id 为新主力合约
+    DOMINANT_CHANGED = 'vnpy_dominant_changed'
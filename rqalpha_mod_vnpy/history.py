@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+import six
+
+from rqalpha.utils.datetime_func import convert_date_to_int, convert_dt_to_int
+from rqalpha.utils.exception import RQInvalidArgument
+from rqalpha.utils.logger import system_log
+
+
+BAR_DTYPE = np.dtype([
+    ('datetime', np.uint64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('total_turnover', np.float64),
+    ('open_interest', np.float64),
+])
+
+
+def next_day(yyyymmdd):
+    day = date(yyyymmdd // 10000, yyyymmdd // 100 % 100, yyyymmdd % 100) + timedelta(days=1)
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def parse_frequency(frequency):
+    """
+    返回 bar 的分钟数，日线返回 None。
+    """
+    if frequency == '1d':
+        return None
+    if frequency.endswith('m') and frequency[:-1].isdigit() and int(frequency[:-1]) > 0:
+        return int(frequency[:-1])
+    raise ValueError('unsupported frequency {}'.format(frequency))
+
+
+class BarBuffer(object):
+    """
+    只追加的结构化数组。单线程写入，先写入数据再增加长度，读取方先读长度再读数组，总能得到完整的前缀。
+    """
+    def __init__(self, dtype, capacity=256):
+        self._array = np.zeros(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def bars(self):
+        size = self._size
+        return self._array[:size]
+
+    def extend(self, bars):
+        n = len(bars)
+        if not n:
+            return
+        size = self._size
+        array = self._array
+        if size + n > len(array):
+            new_array = np.zeros(max(len(array) * 2, size + n), dtype=array.dtype)
+            new_array[:size] = array[:size]
+            array = self._array = new_array
+        if bars.dtype == array.dtype:
+            array[size:size + n] = bars
+        else:
+            target = array[size:size + n]
+            target[:] = 0
+            for name in array.dtype.names:
+                if name in bars.dtype.names:
+                    target[name] = bars[name]
+                elif array.dtype[name].kind == 'f':
+                    target[name] = np.nan
+        self._size = size + n
+
+
+class BarAggregator(object):
+    """
+    将某一频率的 tick 聚合为 bar。分钟线以 bar 结束时刻标记，取行情的自然日，夜盘的 bar 排在下一交易日的日盘之前，
+    结束于午夜的 bar 标记为下一自然日的 00:00；日线以交易日标记。
+
+    某合约的下一个时间段的 tick 到达时，当前 bar 收盘并追加到该合约的 :class:`BarBuffer`。
+    正在形成的 bar 以元组整体替换，读取方不会读到一半更新的数据。
+    """
+    def __init__(self, frequency):
+        self.frequency = frequency
+        self._minutes = parse_frequency(frequency)
+        self._closed = {}
+        self._current = {}
+
+    def _bucket(self, tick):
+        if self._minutes is None:
+            return tick.date * 1000000
+        hhmmss = tick.time // 1000
+        minute_of_day = (hhmmss // 10000) * 60 + hhmmss // 100 % 100
+        end = (minute_of_day // self._minutes + 1) * self._minutes
+        action_day = tick.action_day
+        if end >= 24 * 60:
+            # 上期所等交易所的夜盘跨过午夜
+            end -= 24 * 60
+            action_day = next_day(action_day)
+        return action_day * 1000000 + (end // 60) * 10000 + (end % 60) * 100
+
+    def on_tick(self, tick):
+        order_book_id = tick.order_book_id
+        price = tick.last
+        if not price:
+            return
+        bucket = self._bucket(tick)
+        current = self._current.get(order_book_id)
+
+        if current is not None and current[0] != bucket:
+            if bucket < current[0]:
+                # 乱序到达的过期行情，所属的 bar 已收盘
+                return
+            self._close(order_book_id, current)
+            current = None
+
+        if self._minutes is None:
+            # CTP 的成交量及成交额为当日累计值，即日线的值
+            volume, turnover = tick.volume, tick.total_turnover
+        elif current is None:
+            # 网关已算出与上一笔行情之间的增量，并处理了交易日切换
+            volume, turnover = tick.delta_volume, tick.delta_turnover
+        else:
+            volume, turnover = current[5] + tick.delta_volume, current[6] + tick.delta_turnover
+        if current is None:
+            current = (bucket, price, price, price, price, volume, turnover, tick.open_interest)
+        else:
+            current = (bucket, current[1], max(current[2], price), min(current[3], price), price, volume, turnover,
+                       tick.open_interest)
+        self._current[order_book_id] = current
+
+    def _close(self, order_book_id, bar):
+        buffer = self._closed.get(order_book_id)
+        if buffer is None:
+            buffer = self._closed[order_book_id] = BarBuffer(BAR_DTYPE)
+        # history_bars 对 datetime 做二分查找，已收盘的 bar 必须严格递增，否则丢弃
+        if len(buffer) and buffer.bars['datetime'][-1] >= bar[0]:
+            system_log.warn('{} 的 {} bar {} 不晚于已收盘的 bar {}，已丢弃', order_book_id, self.frequency, bar[0],
+                            buffer.bars['datetime'][-1])
+            return
+        buffer.extend(np.array([bar], dtype=BAR_DTYPE))
+
+    def closed_bars(self, order_book_id):
+        buffer = self._closed.get(order_book_id)
+        if buffer is None:
+            return np.zeros(0, dtype=BAR_DTYPE)
+        return buffer.bars
+
+    def current_bar(self, order_book_id):
+        current = self._current.get(order_book_id)
+        if current is None:
+            return None
+        return np.array([current], dtype=BAR_DTYPE)
+
+
+class HistoryView(object):
+    """
+    某合约某频率的历史数据：数据包中的历史 bar 之后拼接本地聚合的已收盘 bar，随新 bar 收盘增量追加。
+    """
+    def __init__(self, base_bars, dtype):
+        self.buffer = BarBuffer(dtype, capacity=max(256, len(base_bars) * 2))
+        self.buffer.extend(base_bars)
+        self.live_count = 0
+
+    def sync(self, closed_bars):
+        if len(closed_bars) <= self.live_count:
+            return
+        new_bars = closed_bars[self.live_count:]
+        self.live_count = len(closed_bars)
+        bars = self.buffer.bars
+        if len(bars):
+            # 跳过数据包中已有的 bar
+            new_bars = new_bars[new_bars['datetime'] > bars['datetime'][-1]]
+        self.buffer.extend(new_bars)
+
+
+class BarHistory(object):
+    """
+    由 CTP tick 聚合的 bar 与数据包历史数据拼接而成的 history_bars 数据来源。
+
+    拼接结果按 (合约, 频率) 保存在 LRU 缓存中，新 bar 收盘时只追加新增部分，重复调用只需对缓存做一次切片。
+    """
+    def __init__(self, frequencies, cache_size=256):
+        self._aggregators = {'1d': BarAggregator('1d')}
+        for frequency in frequencies:
+            parse_frequency(frequency)
+            self._aggregators[frequency] = BarAggregator(frequency)
+        self._cache_size = cache_size
+        self._views = OrderedDict()
+
+    def supports(self, frequency):
+        return frequency in self._aggregators
+
+    def on_tick(self, tick):
+        for aggregator in self._aggregators.values():
+            aggregator.on_tick(tick)
+
+    def _view_of(self, order_book_id, frequency, load_base_bars):
+        key = (order_book_id, frequency)
+        view = self._views.pop(key, None)
+        if view is None:
+            base_bars = load_base_bars() if frequency == '1d' else None
+            if base_bars is None:
+                view = HistoryView(np.zeros(0, dtype=BAR_DTYPE), BAR_DTYPE)
+            else:
+                view = HistoryView(base_bars, base_bars.dtype)
+            if len(self._views) >= self._cache_size:
+                self._views.popitem(last=False)
+        self._views[key] = view
+        view.sync(self._aggregators[frequency].closed_bars(order_book_id))
+        return view
+
+    def history_bars(self, order_book_id, bar_count, frequency, fields, dt, include_now, load_base_bars):
+        """
+        :param load_base_bars: 返回该合约数据包日线的函数，仅在日线视图首次创建时调用
+        :raises RQInvalidArgument: fields 中有数据中不存在的字段，与 rqalpha 的 history_bars 一致
+        """
+        view = self._view_of(order_book_id, frequency, load_base_bars)
+        bars = view.buffer.bars
+        if fields is not None:
+            invalid_fields = [field for field in ([fields] if isinstance(fields, six.string_types) else fields)
+                              if field not in bars.dtype.names]
+            if invalid_fields:
+                raise RQInvalidArgument(u'function history_bars: invalid field {}, valid fields are {}'.format(
+                    invalid_fields, repr(bars.dtype.names)))
+
+        dt = np.uint64(convert_date_to_int(dt) if frequency == '1d' else convert_dt_to_int(dt))
+        i = bars['datetime'].searchsorted(dt, side='right')
+        if include_now and i == len(bars):
+            current = self._aggregators[frequency].current_bar(order_book_id)
+            if current is not None and (not len(bars) or current['datetime'][0] > bars['datetime'][-1]):
+                tail = BarBuffer(bars.dtype, capacity=bar_count)
+                tail.extend(bars[max(i - bar_count + 1, 0):i])
+                tail.extend(current)
+                bars = tail.bars
+                i = len(bars)
+        bars = bars[max(i - bar_count, 0):i]
+        return bars if fields is None else bars[fields]
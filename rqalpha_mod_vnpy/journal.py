@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+行情、订单及成交回报等热点路径上的调试记录。
+
+调用方先检查 :attr:`EventJournal.enabled`，未开启时不做任何格式化；开启时 :meth:`EventJournal.record` 只把
+(时间, 类型, 原始对象) 追加到队列，由后台线程序列化后写入二进制文件，未配置文件时由后台线程格式化后输出到 DEBUG 日志。
+
+文件中每条记录为 ``<I d B`` 头（记录体长度、时间戳、类型）加上 pickle 序列化的字典，可由 :func:`read_journal` 读取。
+"""
+
+import struct
+from enum import Enum
+from time import time
+from collections import deque
+from threading import Thread, Event
+
+import six
+import logbook
+from six.moves import cPickle as pickle
+
+from rqalpha.utils.logger import system_log
+
+
+TICK = 1
+ORDER = 2
+TRADE = 3
+
+RECORD_NAMES = {
+    TICK: 'tick',
+    ORDER: 'order',
+    TRADE: 'trade',
+}
+
+LOG_FORMATS = {
+    TICK: 'VNPYEventSource: tick {}',
+    ORDER: '订单回报: {}',
+    TRADE: '交易回报: {}',
+}
+
+HEADER = struct.Struct('<IdB')
+
+
+def _plain_value(value):
+    if value is None or isinstance(value, (bool, float) + six.integer_types + six.string_types):
+        return value
+    if isinstance(value, Enum):
+        return value.name
+    return repr(value)
+
+
+def _plain(payload):
+    # 回报中的下单方式等对象不一定能被 pickle，统一转换为基本类型
+    return {key: _plain_value(value) for key, value in six.iteritems(payload)}
+
+
+class EventJournal(object):
+    """
+    热点路径调试记录。enabled 为 None 时由 logger 的级别决定，DEBUG 级别及以下开启。
+
+    队列最多保留 max_pending 条尚未写出的记录，写入跟不上时丢弃最早的记录，不阻塞调用方。
+    """
+    def __init__(self, path=None, enabled=None, logger=system_log, flush_interval=0.1, max_pending=100000):
+        self._path = path
+        self._logger = logger
+        self._flush_interval = flush_interval
+        self._pending = deque(maxlen=max_pending)
+        self._stop = Event()
+        self._thread = None
+        self._file = None
+        if enabled is None:
+            enabled = logger.level <= logbook.DEBUG
+        self.enabled = enabled
+
+    def record(self, kind, payload):
+        # 仅在回调线程及策略线程中追加引用，deque.append 在 GIL 下是原子操作，无需加锁
+        self._pending.append((time(), kind, payload))
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        if self._path is not None:
+            self._file = open(self._path, 'ab')
+            system_log.info('热点路径调试记录写入 {}', self._path)
+
+        def run():
+            while not self._stop.wait(self._flush_interval):
+                self.flush()
+
+        self._thread = Thread(target=run, name='event_journal')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def flush(self):
+        pending = self._pending
+        if self._file is None:
+            while pending:
+                timestamp, kind, payload = pending.popleft()
+                self._logger.debug(LOG_FORMATS[kind], payload)
+            return
+        chunks = []
+        while pending:
+            timestamp, kind, payload = pending.popleft()
+            body = pickle.dumps(_plain(payload), 2)
+            chunks.append(HEADER.pack(len(body), timestamp, kind))
+            chunks.append(body)
+        if chunks:
+            self._file.write(b''.join(chunks))
+            self._file.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.enabled:
+            self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_journal(path):
+    """
+    依次返回文件中的 (时间戳, 类型名, 字段字典)，文件末尾不完整的记录被忽略。
+    """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            size, timestamp, kind = HEADER.unpack(header)
+            body = f.read(size)
+            if len(body) < size:
+                return
+            yield timestamp, RECORD_NAMES.get(kind, kind), pickle.loads(body)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+进程内指标，以 Prometheus 文本格式通过本地 HTTP 端口或定期写入文件的方式输出。
+
+指标对象在启动时创建并由使用方持有引用，热点路径上只做数值的加减及预分配数组的下标写入，不构造标签、字符串或容器。
+队列长度等可以随时读取的值以 :meth:`Gauge.set_function` 注册，仅在输出时求值。
+"""
+
+import os
+from bisect import bisect_left
+from threading import Thread, Event, Lock
+
+from six.moves import BaseHTTPServer
+
+from rqalpha.utils.logger import system_log
+
+
+LATENCY_BUCKETS = (.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1, .5, 1., 5.)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        yield self.name, _format_labels(self.labels), self.value
+
+
+class Gauge(object):
+    type = 'gauge'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, n=1):
+        self.value += n
+
+    def dec(self, n=1):
+        self.value -= n
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        yield self.name, _format_labels(self.labels), self.value if self._function is None else self._function()
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # 最后一个元素统计超出所有上界的观测值
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self):
+        cum = 0
+        for bound, n in zip(self.buckets + (float('inf'), ), self.counts):
+            cum += n
+            yield self.name + '_bucket', _format_labels(self.labels, ('le', _format_value(bound))), cum
+        yield self.name + '_sum', _format_labels(self.labels), self.sum
+        yield self.name + '_count', _format_labels(self.labels), cum
+
+
+class MetricsRegistry(object):
+    """
+    指标注册表。同名指标可以以不同的标签注册多次，例如多账户时各网关以 account 标签区分。
+    """
+    def __init__(self, **const_labels):
+        self._const_labels = tuple(sorted(const_labels.items()))
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get_or_create(self, cls, name, help, labels, *args):
+        labels = self._const_labels + tuple(sorted(labels.items()))
+        key = (name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, help, labels, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError('metric {} is already registered as {}'.format(name, metric.type))
+        return metric
+
+    def counter(self, name, help='', **labels):
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name, help='', **labels):
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name, help='', buckets=LATENCY_BUCKETS, **labels):
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        last_name = None
+        for (name, _), metric in metrics:
+            if name != last_name:
+                lines.append('# HELP %s %s' % (name, metric.help))
+                lines.append('# TYPE %s %s' % (name, metric.type))
+                last_name = name
+            try:
+                for sample_name, labels, value in metric.samples():
+                    lines.append('%s%s %s' % (sample_name, labels, _format_value(value)))
+            except Exception as e:
+                system_log.warn('指标 {} 读取失败: {}', name, e)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class MetricsServer(object):
+    """
+    在后台线程中以 HTTP 提供 /metrics。
+    """
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, name='metrics_server')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        system_log.info('指标服务已启动: http://{}:{}/metrics', *self.address)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsFileWriter(object):
+    """
+    每隔 interval 秒将指标写入文件，先写临时文件再替换，读取方不会读到写了一半的文件。
+    """
+    def __init__(self, registry, path, interval=15):
+        self._registry = registry
+        self._path = path
+        self._interval = interval
+        self._stop = Event()
+
+    def write(self):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self._registry.render())
+        if os.name == 'nt' and os.path.exists(self._path):
+            os.remove(self._path)
+        os.rename(tmp_path, self._path)
+
+    def start(self):
+        def run():
+            while not self._stop.wait(self._interval):
+                try:
+                    self.write()
+                except (IOError, OSError) as e:
+                    system_log.warn('指标文件写入失败: {}', e)
+
+        thread = Thread(target=run, name='metrics_file_writer')
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.write()
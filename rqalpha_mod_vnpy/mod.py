@@ -16,20 +16,27 @@
 # limitations under the License.
 
 import os
-from rqalpha.interface import AbstractMod
 
-vn_ctp_path = None
+from rqalpha.interface import AbstractMod
+from rqalpha.utils.logger import system_log
 
 
 class VNPYMod(AbstractMod):
     def __init__(self):
         self._env = None
         self._gateway = None
+        self._gateways = []
+        self._profiler = None
+        self._metrics_exporters = []
+        self._journal = None
 
     def start_up(self, env, mod_config):
-        global vn_ctp_path
+        from .backends import select_backend
+        select_backend(mod_config.gateway_type, mod_config)
+
+        from .utils import PhaseTimer
+        timer = PhaseTimer()
 
-        vn_ctp_path = os.path.join(mod_config.vn_trader_path, 'gateway/ctpGateway')
         from .vnpy_event_source import VNPYEventSource
         from .vnpy_broker import VNPYBroker
         from .vnpy_data_source import VNPYDataSource
@@ -37,19 +44,109 @@ class VNPYMod(AbstractMod):
 
         from .ctp.gateway import CtpGateway
         from .ctp.data_cache import DataCache
+        from .ctp.wal import WriteAheadLog
+        # 导入时注册 switch_account 等策略 API
+        from . import api  # noqa
+        from .risk import RiskEngine
+        from .history import BarHistory
+        from .metrics import MetricsRegistry, MetricsServer, MetricsFileWriter
+        from .journal import EventJournal
+        from .multiplexer import EventMultiplexer
+        timer.mark('import')
+
         self._env = env
+        if mod_config.callback_profiling.enabled:
+            from .ctp.profiling import CallbackProfiler
+            self._profiler = CallbackProfiler()
+            self._profiler.calibrate()
+
+        metrics = MetricsRegistry()
+        self._journal = EventJournal(mod_config.hot_path_journal.path)
+        multiplexer = EventMultiplexer(metrics)
         data_cache = DataCache()
+        data_cache.market.dominant.switch_ratio = mod_config.dominant_switch_ratio
         self._gateway = CtpGateway(env, data_cache,
                                    mod_config.temp_path, mod_config.CTP.userID, mod_config.CTP.password,
-                                   mod_config.CTP.brokerID)
-        self._gateway.init_td_api(mod_config.CTP.tdAddress)
+                                   mod_config.CTP.brokerID, order_rate_limit=mod_config.order_rate_limit,
+                                   cancel_rate_limit=mod_config.cancel_rate_limit, metrics=metrics,
+                                   journal=self._journal, multiplexer=multiplexer,
+                                   split_close_orders=mod_config.split_close_orders)
+        self._gateway.set_profiler(self._profiler)
+        if mod_config.paper_trading.enabled:
+            self._gateway.init_sim_td_api(env.config.base.data_bundle_path, env.config.base.future_starting_cash,
+                                          latency=mod_config.paper_trading.latency,
+                                          queue_position=mod_config.paper_trading.queue_position)
+        else:
+            self._gateway.init_td_api(mod_config.CTP.tdAddress)
         if mod_config.default_data_source:
             self._gateway.init_md_api(mod_config.CTP.mdAddress)
-        self._gateway.connect_and_sync_data()
-        self._env.set_broker(VNPYBroker(self._gateway))
-        self._env.set_event_source(VNPYEventSource(env, mod_config, self._gateway))
-        self._env.set_data_source(VNPYDataSource(env, data_cache))
+        self._gateways.append(self._gateway)
+
+        sub_accounts = []
+        for name, account_config in mod_config.accounts.items():
+            # 未填写的字段沿用 CTP 中的配置
+            account_config = dict(mod_config.CTP.items(), **dict(account_config.items()))
+            # 各账户的私有流断点文件需分开存放
+            gateway = CtpGateway(env, DataCache(data_cache.market),
+                                 os.path.join(mod_config.temp_path, name), account_config['userID'], account_config['password'],
+                                 account_config['brokerID'], order_rate_limit=mod_config.order_rate_limit,
+                                 cancel_rate_limit=mod_config.cancel_rate_limit, name=name, metrics=metrics,
+                                 journal=self._journal, multiplexer=multiplexer,
+                                 split_close_orders=mod_config.split_close_orders)
+            gateway.share_market_data(self._gateway)
+            gateway.set_profiler(self._profiler)
+            if mod_config.paper_trading.enabled:
+                gateway.init_sim_td_api(env.config.base.data_bundle_path, env.config.base.future_starting_cash,
+                                        latency=mod_config.paper_trading.latency,
+                                        queue_position=mod_config.paper_trading.queue_position)
+            else:
+                gateway.init_td_api(account_config['tdAddress'])
+            sub_accounts.append(gateway)
+            self._gateways.append(gateway)
+        for gateway in self._gateways:
+            gateway.set_topic_modes(mod_config.topic_mode.private, mod_config.topic_mode.public)
+        if mod_config.wal.enabled:
+            wal_directory = os.path.join(mod_config.temp_path, 'wal')
+            for gateway in self._gateways:
+                wal = WriteAheadLog(wal_directory, gateway.name, mod_config.wal.sync_interval)
+                wal.start()
+                gateway.set_wal(wal)
+        timer.mark('init_api')
+
+        for gateway in self._gateways:
+            gateway.connect_and_sync_data()
+        timer.mark('connect_and_sync_data')
+        broker = VNPYBroker(self._gateway, RiskEngine(env, mod_config.risk, lambda: self._gateway.name))
+        for gateway in sub_accounts:
+            broker.add_account(gateway.name, gateway,
+                               RiskEngine(env, mod_config.risk, lambda gateway=gateway: gateway.name))
+        self._env.set_broker(broker)
+        self._env.set_event_source(VNPYEventSource(env, mod_config, self._gateway, metrics, self._journal))
+        bar_history = BarHistory(mod_config.history_frequencies, mod_config.history_cache_size)
+        self._gateway.add_tick_hook(bar_history.on_tick)
+        self._env.set_data_source(VNPYDataSource(env, data_cache, bar_history, lazy=mod_config.lazy_bundle))
         self._env.set_price_board(VNPYPriceBoard(data_cache))
+        timer.mark('data_source')
+        system_log.info('VNPY 启动耗时:\n{}', timer.report())
+        if mod_config.metrics.enabled:
+            if mod_config.metrics.port:
+                self._metrics_exporters.append(MetricsServer(metrics, mod_config.metrics.host, mod_config.metrics.port))
+            if mod_config.metrics.file:
+                self._metrics_exporters.append(MetricsFileWriter(metrics, mod_config.metrics.file,
+                                                                 mod_config.metrics.interval))
+            for exporter in self._metrics_exporters:
+                exporter.start()
+        self._journal.start()
+        if self._profiler is not None and mod_config.callback_profiling.report_interval:
+            self._profiler.start_reporting(mod_config.callback_profiling.report_interval)
 
     def tear_down(self, code, exception=None):
-        self._gateway.exit()
+        for gateway in self._gateways:
+            gateway.exit()
+        for exporter in self._metrics_exporters:
+            exporter.stop()
+        if self._journal is not None:
+            self._journal.stop()
+        if self._profiler is not None:
+            self._profiler.stop_reporting()
+            system_log.info('CTP 回调耗时统计:\n{}', self._profiler.report())
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from threading import Condition, Lock
+from timeit import default_timer
+
+from .metrics import MetricsRegistry
+
+
+# 订单及成交回报，先于行情处理
+PRIORITY_TD = 0
+PRIORITY_TICK = 1
+
+PRIORITY_NAMES = ('td', 'tick')
+
+
+class EventMultiplexer(object):
+    """
+    CTP 回调线程与策略线程之间的事件队列，所有账户的网关共用一个。
+
+    各优先级分别先进先出，:meth:`get` 总是先取出优先级高（数值小）的事件，因此积压的行情不会推迟订单及成交回报的处理。
+    回调线程调用 :meth:`put`，只有策略线程调用 :meth:`get`。
+    """
+    def __init__(self, metrics=None):
+        self._queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self._not_empty = Condition(Lock())
+
+        registry = metrics if metrics is not None else MetricsRegistry()
+        self._latency = []
+        for priority, name in enumerate(PRIORITY_NAMES):
+            self._latency.append(registry.histogram('vnpy_event_queue_latency_seconds', '事件在队列中等待策略线程取出的时间',
+                                                    queue=name))
+            registry.gauge('vnpy_event_queue_depth', '等待策略线程处理的事件数',
+                           queue=name).set_function(lambda priority=priority: len(self._queues[priority]))
+
+    def put(self, priority, item):
+        with self._not_empty:
+            self._queues[priority].append((default_timer(), item))
+            self._not_empty.notify()
+
+    def get(self, timeout=None, max_priority=PRIORITY_TICK):
+        """
+        取出优先级不低于 max_priority 的事件中最早的一个，返回 (优先级, 事件)。
+        timeout 为 None 时一直等待，否则最多等待 timeout 秒，超时返回 None。
+        """
+        with self._not_empty:
+            deadline = None
+            while True:
+                for priority in range(max_priority + 1):
+                    queue = self._queues[priority]
+                    if queue:
+                        put_time, item = queue.popleft()
+                        self._latency[priority].observe(default_timer() - put_time)
+                        return priority, item
+                if timeout is not None:
+                    if deadline is None:
+                        deadline = default_timer() + timeout
+                    remaining = deadline - default_timer()
+                    if remaining <= 0:
+                        return None
+                    self._not_empty.wait(remaining)
+                else:
+                    self._not_empty.wait()
+
+    def qsize(self, priority=None):
+        if priority is None:
+            return sum(len(queue) for queue in self._queues)
+        return len(self._queues[priority])
+
+    def clear(self):
+        with self._not_empty:
+            for queue in self._queues:
+                queue.clear()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from time import time
+
+import six
+
+from rqalpha.events import EVENT
+from rqalpha.const import SIDE, POSITION_EFFECT
+
+
+class RiskCounters(object):
+    """
+    由订单及成交回调增量维护的风控计数器，所有查询均为常数时间。
+    """
+    def __init__(self):
+        self.long_positions = {}
+        self.short_positions = {}
+        self.outstanding_buy = {}
+        self.outstanding_sell = {}
+        self.outstanding_open = {}
+        self.outstanding = 0
+
+        self.submitted = 0
+        self.cancelled = 0
+
+        self._order_times = deque()
+        self._orders = {}
+
+    def net_position(self, order_book_id):
+        return self.long_positions.get(order_book_id, 0) - self.short_positions.get(order_book_id, 0)
+
+    def gross_position(self, order_book_id):
+        return self.long_positions.get(order_book_id, 0) + self.short_positions.get(order_book_id, 0)
+
+    def order_rate(self, now, window=1.):
+        order_times = self._order_times
+        while order_times and order_times[0] <= now - window:
+            order_times.popleft()
+        return len(order_times)
+
+    @property
+    def cancel_ratio(self):
+        return float(self.cancelled) / self.submitted if self.submitted else 0.
+
+    def set_position(self, order_book_id, long_quantity, short_quantity):
+        self.long_positions[order_book_id] = long_quantity
+        self.short_positions[order_book_id] = short_quantity
+
+    def track(self, order):
+        quantity = order.unfilled_quantity
+        order_book_id = order.order_book_id
+        is_open = order.position_effect == POSITION_EFFECT.OPEN
+        self._orders[order.order_id] = [order_book_id, order.side, is_open, quantity]
+        self._add_outstanding(order_book_id, order.side, is_open, quantity)
+
+    def on_submit(self, order, now):
+        self.track(order)
+        self.submitted += 1
+        self._order_times.append(now)
+
+    def on_cancel(self):
+        self.cancelled += 1
+
+    def on_trade(self, trade):
+        order_book_id = trade.order_book_id
+        quantity = trade.last_quantity
+        if trade.side == SIDE.BUY:
+            if trade.position_effect == POSITION_EFFECT.OPEN:
+                self.long_positions[order_book_id] = self.long_positions.get(order_book_id, 0) + quantity
+            else:
+                self.short_positions[order_book_id] = self.short_positions.get(order_book_id, 0) - quantity
+        else:
+            if trade.position_effect == POSITION_EFFECT.OPEN:
+                self.short_positions[order_book_id] = self.short_positions.get(order_book_id, 0) + quantity
+            else:
+                self.long_positions[order_book_id] = self.long_positions.get(order_book_id, 0) - quantity
+
+        record = self._orders.get(trade.order_id)
+        if record is None:
+            return
+        filled = min(quantity, record[3])
+        record[3] -= filled
+        self._add_outstanding(record[0], record[1], record[2], -filled)
+        if record[3] <= 0:
+            del self._orders[trade.order_id]
+
+    def on_order_final(self, order):
+        record = self._orders.pop(order.order_id, None)
+        if record is not None:
+            self._add_outstanding(record[0], record[1], record[2], -record[3])
+
+    def _add_outstanding(self, order_book_id, side, is_open, quantity):
+        outstanding = self.outstanding_buy if side == SIDE.BUY else self.outstanding_sell
+        outstanding[order_book_id] = outstanding.get(order_book_id, 0) + quantity
+        if is_open:
+            self.outstanding_open[order_book_id] = self.outstanding_open.get(order_book_id, 0) + quantity
+        self.outstanding += quantity
+
+
+class MaxNetPositionCheck(object):
+    """
+    买卖双方向的挂单都计入：挂出的买单全部成交而卖单全部撤销时的净多头，以及相反情形下的净空头，均不得超过限额。
+    """
+    def __init__(self, limit):
+        self._limit = limit
+
+    def __call__(self, order, counters):
+        order_book_id = order.order_book_id
+        net = counters.net_position(order_book_id)
+        longest = net + counters.outstanding_buy.get(order_book_id, 0)
+        shortest = net - counters.outstanding_sell.get(order_book_id, 0)
+        if order.side == SIDE.BUY:
+            longest += order.quantity
+        else:
+            shortest -= order.quantity
+        projected = longest if longest >= -shortest else shortest
+        if abs(projected) > self._limit:
+            return 'Order was rejected: net position of {} would reach {}, limit is {}.'.format(
+                order_book_id, projected, self._limit)
+
+
+class MaxGrossPositionCheck(object):
+    def __init__(self, limit):
+        self._limit = limit
+
+    def __call__(self, order, counters):
+        if order.position_effect != POSITION_EFFECT.OPEN:
+            return
+        order_book_id = order.order_book_id
+        projected = (counters.gross_position(order_book_id) + counters.outstanding_open.get(order_book_id, 0) +
+                     order.quantity)
+        if projected > self._limit:
+            return 'Order was rejected: gross position of {} would reach {}, limit is {}.'.format(
+                order_book_id, projected, self._limit)
+
+
+class MaxOutstandingVolumeCheck(object):
+    def __init__(self, limit):
+        self._limit = limit
+
+    def __call__(self, order, counters):
+        if counters.outstanding + order.quantity > self._limit:
+            return 'Order was rejected: outstanding order volume would exceed {}.'.format(self._limit)
+
+
+class MaxOrderRateCheck(object):
+    def __init__(self, limit):
+        self._limit = limit
+
+    def __call__(self, order, counters):
+        if counters.order_rate(time()) >= self._limit:
+            return 'Order was rejected: more than {} orders were sent in the last second.'.format(self._limit)
+
+
+class MaxCancelRatioCheck(object):
+    def __init__(self, limit, min_orders=20):
+        self._limit = limit
+        self._min_orders = min_orders
+
+    def __call__(self, order, counters):
+        if counters.submitted < self._min_orders:
+            return
+        if float(counters.cancelled + 1) / counters.submitted > self._limit:
+            return 'Cancellation was rejected: cancel ratio would exceed {}.'.format(self._limit)
+
+
+class RiskEngine(object):
+    """
+    Broker 内的事前风控。
+
+    风控检查为形如 ``check(order, counters)`` 的可调用对象，返回拒单原因，返回 None 表示通过。
+    可以通过 :meth:`add_check` 及 :meth:`add_cancel_check` 注册自定义检查。
+    """
+    def __init__(self, env, risk_config=None, account_name_of=None):
+        # 多账户时只统计账户名称为 account_name_of() 的成交及订单。按名称而不是账户对象比较，账户对象重建后仍然有效
+        self._account_name_of = account_name_of
+        self._counters = RiskCounters()
+        self._checks = []
+        self._cancel_checks = []
+
+        if risk_config is not None:
+            if risk_config.max_net_position is not None:
+                self.add_check(MaxNetPositionCheck(risk_config.max_net_position))
+            if risk_config.max_gross_position is not None:
+                self.add_check(MaxGrossPositionCheck(risk_config.max_gross_position))
+            if risk_config.max_outstanding_volume is not None:
+                self.add_check(MaxOutstandingVolumeCheck(risk_config.max_outstanding_volume))
+            if risk_config.max_orders_per_second is not None:
+                self.add_check(MaxOrderRateCheck(risk_config.max_orders_per_second))
+            if risk_config.max_cancel_ratio is not None:
+                self.add_cancel_check(MaxCancelRatioCheck(risk_config.max_cancel_ratio))
+
+        event_bus = env.event_bus
+        event_bus.add_listener(EVENT.TRADE, self._on_trade)
+        event_bus.add_listener(EVENT.ORDER_CREATION_REJECT, self._on_order_final)
+        event_bus.add_listener(EVENT.ORDER_CANCELLATION_PASS, self._on_order_final)
+        event_bus.add_listener(EVENT.ORDER_UNSOLICITED_UPDATE, self._on_order_final)
+
+    @property
+    def counters(self):
+        return self._counters
+
+    def add_check(self, check):
+        self._checks.append(check)
+
+    def add_cancel_check(self, check):
+        self._cancel_checks.append(check)
+
+    def sync(self, pos_dicts, open_orders):
+        counters = RiskCounters()
+        for order_book_id, pos_dict in six.iteritems(pos_dicts):
+            counters.set_position(order_book_id, pos_dict.buy_quantity, pos_dict.sell_quantity)
+        for order in open_orders:
+            counters.track(order)
+        self._counters = counters
+
+    def check_submit(self, order):
+        """
+        检查通过时计入计数器并返回 None，否则返回拒单原因。
+        """
+        for check in self._checks:
+            reason = check(order, self._counters)
+            if reason is not None:
+                return reason
+        self._counters.on_submit(order, time())
+
+    def check_cancel(self, order):
+        for check in self._cancel_checks:
+            reason = check(order, self._counters)
+            if reason is not None:
+                return reason
+        self._counters.on_cancel()
+
+    def _is_own(self, event):
+        if self._account_name_of is None:
+            return True
+        return getattr(event.account, 'account_name', None) == self._account_name_of()
+
+    def _on_trade(self, event):
+        if self._is_own(event):
+            self._counters.on_trade(event.trade)
+
+    def _on_order_final(self, event):
+        if self._is_own(event) and event.order.is_final():
+            self._counters.on_order_final(event.order)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+纯 Python 实现的合成 CTP 接口，与 vn.py 编译出的 MdApi、TdApi 具有相同的请求函数及回调，用于在没有 vn.py 及 CTP 前置的机器上
+运行、压测及剖析整个链路。
+
+行情以设定的速率对设定数量的合约做随机游走并推送完整的深度行情字段；报单在合成行情价格可成交时立即成交，否则挂单，
+直至后续行情穿过挂单价。
+"""
+
+import random
+from collections import deque
+from datetime import date, datetime
+from itertools import count
+from threading import Thread, Condition, Lock
+from time import time, sleep
+
+from rqalpha.utils.logger import system_log
+
+
+defineDict = {
+    'THOST_FTDC_D_Buy': '0',
+    'THOST_FTDC_D_Sell': '1',
+    'THOST_FTDC_OF_Open': '0',
+    'THOST_FTDC_OF_Close': '1',
+    'THOST_FTDC_OF_ForceClose': '2',
+    'THOST_FTDC_OF_CloseToday': '3',
+    'THOST_FTDC_OF_CloseYesterday': '4',
+    'THOST_FTDC_OPT_AnyPrice': '1',
+    'THOST_FTDC_OPT_LimitPrice': '2',
+    'THOST_FTDC_HF_Speculation': '1',
+    'THOST_FTDC_CC_Immediately': '1',
+    'THOST_FTDC_FCC_NotForceClose': '0',
+    'THOST_FTDC_TC_IOC': '1',
+    'THOST_FTDC_TC_GFD': '3',
+    'THOST_FTDC_VC_AV': '1',
+    'THOST_FTDC_AF_Delete': '0',
+    'THOST_FTDC_PD_Net': '1',
+    'THOST_FTDC_PD_Long': '2',
+    'THOST_FTDC_PD_Short': '3',
+    'THOST_FTDC_OST_AllTraded': '0',
+    'THOST_FTDC_OST_PartTradedQueueing': '1',
+    'THOST_FTDC_OST_PartTradedNotQueueing': '2',
+    'THOST_FTDC_OST_NoTradeQueueing': '3',
+    'THOST_FTDC_OST_NoTradeNotQueueing': '4',
+    'THOST_FTDC_OST_Canceled': '5',
+    'THOST_TERT_RESTART': 0,
+    'THOST_TERT_RESUME': 1,
+    'THOST_TERT_QUICK': 2,
+}
+
+SUCCESS = {'ErrorID': 0, 'ErrorMsg': ''}
+
+_config = {
+    'tick_rate': 100,
+    'instruments': 20,
+    'starting_cash': 1000000.,
+    'seed': None,
+}
+
+
+def configure(**kwargs):
+    _config.update((k, v) for k, v in kwargs.items() if v is not None)
+    _market.reset()
+
+
+def _instrument_ids(instruments):
+    if isinstance(instruments, int):
+        ids = []
+        for i in range(instruments):
+            ids.append('s%s%s1901' % (chr(ord('a') + i // 26 % 26), chr(ord('a') + i % 26)))
+        return ids
+    return [i.lower() for i in instruments]
+
+
+class CallbackWorker(object):
+    """
+    在独立线程中按顺序执行回调，模拟 CTP API 的回调线程。
+    """
+    def __init__(self, name):
+        self._name = name
+        self._queue = deque()
+        self._cond = Condition()
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        thread = Thread(target=self._run, name=self._name)
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def put(self, func, *args):
+        with self._cond:
+            self._queue.append((func, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                func, args = self._queue.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                system_log.exception('{} 回调执行失败: {}', self._name, e)
+
+
+class SyntheticMarket(object):
+    """
+    MdApi 与 TdApi 共用的合成行情，保存各合约的最新价格及挂单。
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self._random = random.Random(_config['seed'])
+        self.instrument_ids = _instrument_ids(_config['instruments'])
+        self.prices = {i: float(self._random.randint(1000, 5000)) for i in self.instrument_ids}
+        self.volumes = {i: 0 for i in self.instrument_ids}
+        self.resting = {}
+        self.td_apis = []
+
+    def next_tick(self, instrument_id):
+        with self.lock:
+            price = max(self.prices[instrument_id] + self._random.choice((-1., 0., 0., 1.)), 1.)
+            self.prices[instrument_id] = price
+            self.volumes[instrument_id] += self._random.randint(1, 20)
+            volume = self.volumes[instrument_id]
+        now = datetime.now()
+        data = {
+            'InstrumentID': instrument_id,
+            'ExchangeID': 'SHFE',
+            'TradingDay': date.today().strftime('%Y%m%d'),
+            'ActionDay': now.strftime('%Y%m%d'),
+            'UpdateTime': now.strftime('%H:%M:%S'),
+            'UpdateMillisec': now.microsecond // 1000 // 500 * 500,
+            'OpenPrice': price,
+            'LastPrice': price,
+            'HighestPrice': price,
+            'LowestPrice': price,
+            'PreClosePrice': price,
+            'SettlementPrice': 0.,
+            'PreSettlementPrice': price,
+            'Volume': volume,
+            'Turnover': volume * price * 10,
+            'OpenInterest': 100000.,
+            'UpperLimitPrice': price * 1.05,
+            'LowerLimitPrice': price * 0.95,
+        }
+        for level in range(1, 6):
+            data['BidPrice%d' % level] = price - level
+            data['AskPrice%d' % level] = price + level
+            data['BidVolume%d' % level] = self._random.randint(1, 100)
+            data['AskVolume%d' % level] = self._random.randint(1, 100)
+        for td_api in self.td_apis:
+            td_api._on_market_price(instrument_id, price)
+        return data
+
+
+_market = SyntheticMarket()
+
+
+class MdApi(object):
+    def __init__(self):
+        self._worker = CallbackWorker('synthetic_md')
+        self._subscribed = []
+        self._running = False
+
+    def createFtdcMdApi(self, path):
+        self._worker.start()
+
+    def registerFront(self, address):
+        pass
+
+    def init(self):
+        self._worker.put(self.onFrontConnected)
+        self._running = True
+        thread = Thread(target=self._generate, name='synthetic_md_feed')
+        thread.setDaemon(True)
+        thread.start()
+
+    def exit(self):
+        self._running = False
+        self._worker.stop()
+
+    def reqUserLogin(self, req, n):
+        self._worker.put(self.onRspUserLogin, {}, SUCCESS, n, True)
+
+    def subscribeMarketData(self, instrument_id):
+        if instrument_id in _market.prices and instrument_id not in self._subscribed:
+            self._subscribed = self._subscribed + [instrument_id]
+        self._worker.put(self.onRspSubMarketData, {'InstrumentID': instrument_id}, SUCCESS, 0, True)
+
+    def unSubscribeMarketData(self, instrument_id):
+        self._subscribed = [i for i in self._subscribed if i != instrument_id]
+
+    def _generate(self):
+        # 按设定速率在已订阅合约间轮流推送行情，落后时不补发，避免积压
+        interval = 1. / _config['tick_rate']
+        next_time = time()
+        i = 0
+        while self._running:
+            subscribed = self._subscribed
+            if not subscribed:
+                sleep(0.1)
+                next_time = time()
+                continue
+            delay = next_time - time()
+            if delay > 0:
+                sleep(delay)
+            elif delay < -1:
+                next_time = time()
+            next_time += interval
+            i = (i + 1) % len(subscribed)
+            self.onRtnDepthMarketData(_market.next_tick(subscribed[i]))
+
+
+class TdApi(object):
+    def __init__(self):
+        self._worker = CallbackWorker('synthetic_td')
+        self._session_id = int(time()) % 100000000
+        self._sys_id_gen = count(1)
+        self._trade_id_gen = count(1)
+        self._orders = {}
+
+    def createFtdcTraderApi(self, path):
+        self._worker.start()
+        _market.td_apis.append(self)
+
+    def subscribePrivateTopic(self, n):
+        pass
+
+    def subscribePublicTopic(self, n):
+        pass
+
+    def registerFront(self, address):
+        pass
+
+    def init(self):
+        self._worker.put(self.onFrontConnected)
+
+    def exit(self):
+        self._worker.stop()
+        if self in _market.td_apis:
+            _market.td_apis.remove(self)
+
+    def reqAuthenticate(self, req, n):
+        self._worker.put(self.onRspAuthenticate, {}, SUCCESS, n, True)
+
+    def reqUserLogin(self, req, n):
+        self._worker.put(self.onRspUserLogin, {'FrontID': 1, 'SessionID': self._session_id}, SUCCESS, n, True)
+
+    def reqSettlementInfoConfirm(self, req, n):
+        self._worker.put(self.onRspSettlementInfoConfirm, {}, SUCCESS, n, True)
+
+    def reqQryInstrument(self, req, n):
+        ids = _market.instrument_ids
+        for i, instrument_id in enumerate(ids):
+            data = {
+                'InstrumentID': instrument_id,
+                'ExchangeID': 'SHFE',
+                'VolumeMultiple': 10,
+                'LongMarginRatio': 0.1,
+                'ShortMarginRatio': 0.1,
+            }
+            self._worker.put(self.onRspQryInstrument, data, SUCCESS, n, i == len(ids) - 1)
+
+    def reqQryInstrumentCommissionRate(self, req, n):
+        data = {
+            'InstrumentID': req['InstrumentID'],
+            'OpenRatioByMoney': 0.0001,
+            'CloseRatioByMoney': 0.0001,
+            'CloseTodayRatioByMoney': 0.0001,
+            'OpenRatioByVolume': 0.,
+            'CloseRatioByVolume': 0.,
+            'CloseTodayRatioByVolume': 0.,
+        }
+        self._worker.put(self.onRspQryInstrumentCommissionRate, data, SUCCESS, n, True)
+
+    def reqQryTradingAccount(self, req, n):
+        self._worker.put(self.onRspQryTradingAccount, {'PreBalance': _config['starting_cash']}, SUCCESS, n, True)
+
+    def reqQryInvestorPosition(self, req, n):
+        self._worker.put(self.onRspQryInvestorPosition, {'InstrumentID': ''}, SUCCESS, n, True)
+
+    def reqQryInvestorPositionDetail(self, req, n):
+        self._worker.put(self.onRspQryInvestorPositionDetail, {'InstrumentID': ''}, SUCCESS, n, True)
+
+    def reqQryOrder(self, req, n):
+        self._worker.put(self.onRspQryOrder, {'InstrumentID': ''}, SUCCESS, n, True)
+
+    def reqOrderInsert(self, req, n):
+        data = dict(req)
+        data.update({
+            'FrontID': 1,
+            'SessionID': self._session_id,
+            'ExchangeID': 'SHFE',
+            'OrderSysID': '%d%06d' % (self._session_id, next(self._sys_id_gen)),
+            'VolumeTraded': 0,
+            'OrderStatus': defineDict['THOST_FTDC_OST_NoTradeQueueing'],
+        })
+        self._worker.put(self._on_order_insert, data)
+
+    def reqOrderAction(self, req, n):
+        self._worker.put(self._on_order_action, dict(req), n)
+
+    def _on_order_insert(self, data):
+        instrument_id = data['InstrumentID']
+        if instrument_id not in _market.prices:
+            self.onErrRtnOrderInsert(data, {'ErrorID': 16, 'ErrorMsg': u'CTP:找不到合约'.encode('GBK')})
+            return
+        self.onRtnOrder(dict(data))
+        price = _market.prices[instrument_id]
+        if self._crossed(data, price):
+            self._fill(data, price)
+        else:
+            self._orders[data['OrderRef']] = data
+
+    def _on_order_action(self, req, n):
+        data = self._orders.pop(req['OrderRef'], None)
+        if data is None:
+            self.onRspOrderAction(req, {'ErrorID': 26, 'ErrorMsg': u'CTP:报单已全成交或已撤销，不能再撤'.encode('GBK')},
+                                  n, True)
+            return
+        data['OrderStatus'] = defineDict['THOST_FTDC_OST_Canceled']
+        self.onRtnOrder(dict(data))
+
+    def _on_market_price(self, instrument_id, price):
+        if self._orders:
+            self._worker.put(self._match, instrument_id, price)
+
+    def _match(self, instrument_id, price):
+        for order_ref, data in list(self._orders.items()):
+            if data['InstrumentID'] == instrument_id and self._crossed(data, price):
+                del self._orders[order_ref]
+                self._fill(data, data['LimitPrice'])
+
+    @staticmethod
+    def _crossed(data, price):
+        if data['OrderPriceType'] == defineDict['THOST_FTDC_OPT_AnyPrice']:
+            return True
+        if data['Direction'] == defineDict['THOST_FTDC_D_Buy']:
+            return data['LimitPrice'] >= price
+        return data['LimitPrice'] <= price
+
+    def _fill(self, data, price):
+        data['VolumeTraded'] = data['VolumeTotalOriginal']
+        data['OrderStatus'] = defineDict['THOST_FTDC_OST_AllTraded']
+        self.onRtnOrder(dict(data))
+        now = datetime.now()
+        self.onRtnTrade({
+            'InstrumentID': data['InstrumentID'],
+            'ExchangeID': data['ExchangeID'],
+            'OrderRef': data['OrderRef'],
+            'OrderSysID': data['OrderSysID'],
+            'TradeID': '%d%06d' % (self._session_id, next(self._trade_id_gen)),
+            'Direction': data['Direction'],
+            'OffsetFlag': data['CombOffsetFlag'],
+            'Price': price,
+            'Volume': data['VolumeTotalOriginal'],
+            'TradeDate': now.strftime('%Y%m%d'),
+            'TradeTime': now.strftime('%H:%M:%S'),
+        })
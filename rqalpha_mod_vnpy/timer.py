@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime, timedelta, time as dt_time
+from itertools import count
+from math import ceil
+from time import time
+
+import six
+
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def parse_time_of_day(at):
+    if isinstance(at, dt_time):
+        return at
+    if isinstance(at, six.string_types):
+        parts = [int(p) for p in at.split(':')]
+        if 2 <= len(parts) <= 3:
+            return dt_time(*parts)
+    raise ValueError('invalid time of day {!r}, expected HH:MM[:SS] or datetime.time'.format(at))
+
+
+def next_occurrence(at, now):
+    """
+    返回 now 之后第一次到达每天 at 时刻的时间戳。
+    """
+    now_dt = datetime.fromtimestamp(now)
+    target = datetime.combine(now_dt.date(), at)
+    if target <= now_dt:
+        target += timedelta(days=1)
+    return now + (target - now_dt).total_seconds()
+
+
+class Timer(object):
+    __slots__ = ('timer_id', 'callback', 'deadline', 'interval', 'cancelled', 'tick')
+
+    def __init__(self, timer_id, callback, deadline, interval=None):
+        self.timer_id = timer_id
+        self.callback = callback
+        self.deadline = deadline
+        # 为 None 时只触发一次
+        self.interval = interval
+        self.cancelled = False
+        self.tick = None
+
+
+class TimerWheel(object):
+    """
+    分层时间轮。
+
+    时间以 resolution 秒为一格，第 0 层每格对应一个时刻，第 i 层每格覆盖第 i-1 层转一圈的时间。定时器按距到期的格数放入
+    能容纳它的最低一层，低一层转完一圈时把高一层当前格中的定时器重新分配到低层，到期时从第 0 层取出。
+    增删定时器为 O(1)；取消只做标记，到期时跳过。超出最高层范围的定时器放在溢出列表中，最高层转完一圈时重新分配。
+    只在一个线程中使用。
+    """
+    def __init__(self, resolution=0.01, slots=(256, 64, 64, 64), now=None):
+        self.resolution = resolution
+        self._slots = slots
+        self._levels = [[[] for _ in range(n)] for n in slots]
+        # 第 i 层每格的格数
+        self._granularity = [1]
+        for n in slots[:-1]:
+            self._granularity.append(self._granularity[-1] * n)
+        self._span = self._granularity[-1] * slots[-1]
+        self._overflow = []
+        # 第 0 层中的定时器数（含已取消的），为 0 时推进可直接跳到下次重新分配
+        self._level0_count = 0
+        self._current = self._tick_of(time() if now is None else now)
+        self._timers = {}
+        self._ids = count(1)
+
+    def __len__(self):
+        return len(self._timers)
+
+    def _tick_of(self, timestamp):
+        return int(timestamp / self.resolution)
+
+    def schedule(self, callback, deadline, interval=None):
+        timer = Timer(next(self._ids), callback, deadline, interval)
+        self._timers[timer.timer_id] = timer
+        self._insert(timer, self._deadline_tick(deadline))
+        return timer
+
+    def cancel(self, timer_id):
+        timer = self._timers.pop(timer_id, None)
+        if timer is not None:
+            timer.cancelled = True
+        return timer is not None
+
+    def _deadline_tick(self, deadline):
+        # 已经到期的定时器放在下一格，下次推进时取出
+        return max(int(ceil(deadline / self.resolution)), self._current + 1)
+
+    def _insert(self, timer, tick):
+        timer.tick = tick
+        delta = tick - self._current
+        if delta >= self._span:
+            self._overflow.append(timer)
+            return
+        for level, granularity in enumerate(self._granularity):
+            if delta < granularity * self._slots[level]:
+                self._levels[level][(tick // granularity) % self._slots[level]].append(timer)
+                if level == 0:
+                    self._level0_count += 1
+                return
+
+    def _cascade(self, level):
+        granularity = self._granularity[level]
+        slot = self._levels[level][(self._current // granularity) % self._slots[level]]
+        timers = list(slot)
+        del slot[:]
+        if level == len(self._slots) - 1:
+            timers.extend(self._overflow)
+            del self._overflow[:]
+        for timer in timers:
+            if not timer.cancelled:
+                self._insert(timer, timer.tick)
+
+    def advance(self, now):
+        """
+        推进到 now，返回此前到期的定时器。周期定时器在返回前已按下一个到期时间重新放入。
+
+        每一步直接跳到第 0 层下一个有定时器的格或下次重新分配的格中较早的一个，跨过休市等长时间间隔时不逐格推进。
+        """
+        target = self._tick_of(now)
+        if not self._timers:
+            self._current = max(self._current, target)
+            return []
+        expired = []
+        slots0 = self._slots[0]
+        level0 = self._levels[0]
+        while self._current < target:
+            current = self._current
+            step = slots0 - current % slots0
+            if self._level0_count:
+                for k in range(1, step):
+                    if level0[(current + k) % slots0]:
+                        step = k
+                        break
+            current = self._current = min(current + step, target)
+            if current % slots0 == 0:
+                # 从最高层开始，依次把当前格重新分配到低层
+                for level in range(len(self._slots) - 1, 0, -1):
+                    if current % self._granularity[level] == 0:
+                        self._cascade(level)
+            slot = level0[current % slots0]
+            if slot:
+                expired.extend(slot)
+                self._level0_count -= len(slot)
+                del slot[:]
+
+        fired = []
+        for timer in expired:
+            if timer.cancelled:
+                continue
+            fired.append(timer)
+            if timer.interval is None:
+                self._timers.pop(timer.timer_id, None)
+                timer.cancelled = True
+            else:
+                deadline = timer.deadline + timer.interval
+                if deadline <= now:
+                    # 处理不及时错过的周期直接跳过，不补发
+                    deadline += ((now - deadline) // timer.interval + 1) * timer.interval
+                timer.deadline = deadline
+                self._insert(timer, self._deadline_tick(deadline))
+        return fired
+
+    def next_timeout(self, now, max_timeout=1.):
+        """
+        距离下一个可能到期的格的秒数，不超过 max_timeout。第 0 层之内没有定时器时返回到下次重新分配的时间。
+        """
+        if not self._timers:
+            return max_timeout
+        slots0 = self._slots[0]
+        level0 = self._levels[0]
+        current = self._current
+        horizon = slots0 - current % slots0
+        for k in range(1, horizon + 1):
+            if level0[(current + k) % slots0]:
+                break
+        else:
+            k = horizon
+        return max(min((current + k) * self.resolution - now, max_timeout), 0.)
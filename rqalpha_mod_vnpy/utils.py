@@ -15,11 +15,9 @@
 # limitations under the License.
 
 from datetime import timedelta
+from time import time
 import re
 
-from rqalpha.environment import Environment
-from rqalpha.const import POSITION_EFFECT, COMMISSION_TYPE
-
 
 def make_underlying_symbol(id_or_symbol):
     return filter(lambda x: x not in '0123456789 ', id_or_symbol).upper()
@@ -35,31 +33,38 @@ def make_order_book_id(symbol):
     return order_book_id.upper()
 
 
-def cal_commission(trade_dict, position_effect):
-    order_book_id = trade_dict.order_book_id
-    env = Environment.get_instance()
-    info = env.data_proxy.get_commission_info(order_book_id)
-    commission = 0
-    if info['commission_type'] == COMMISSION_TYPE.BY_MONEY:
-        contract_multiplier = env.get_instrument(trade_dict.order_book_id).contract_multiplier
-        if position_effect == POSITION_EFFECT.OPEN:
-            commission += trade_dict.price * trade_dict.amount * contract_multiplier * info['open_commission_ratio']
-        elif position_effect == POSITION_EFFECT.CLOSE:
-            commission += trade_dict.price * trade_dict.amount * contract_multiplier * info['close_commission_ratio']
-        elif position_effect == POSITION_EFFECT.CLOSE_TODAY:
-            commission += trade_dict.price * trade_dict.amount * contract_multiplier * info['close_commission_today_ratio']
-    else:
-        if position_effect == POSITION_EFFECT.OPEN:
-            commission += trade_dict.amount * info['open_commission_ratio']
-        elif position_effect == POSITION_EFFECT.CLOSE:
-            commission += trade_dict.amount * info['close_commission_ratio']
-        elif position_effect == POSITION_EFFECT.CLOSE_TODAY:
-            commission += trade_dict.amount * info['close_commission_today_ratio']
-    return commission
+FUTURE_PATTERN = re.compile('^[a-zA-Z]+[0-9]+$')
 
 
 def is_future(order_book_id):
     if order_book_id is None:
         return False
-    return re.match('^[a-zA-Z]+[0-9]+$', order_book_id) is not None
+    return FUTURE_PATTERN.match(order_book_id) is not None
+
+
+def make_instrument_id(order_book_id, exchange_id):
+    # make_order_book_id 的逆操作：郑商所合约代码只保留年份的最后一位，中金所为大写，其余交易所为小写
+    if exchange_id == 'CZCE':
+        return order_book_id[:-4] + order_book_id[-3:]
+    if exchange_id == 'CFFEX':
+        return order_book_id.upper()
+    return order_book_id.lower()
+
+
+class PhaseTimer(object):
+    """
+    记录启动过程中各阶段的耗时。
+    """
+    def __init__(self):
+        self.phases = []
+        self._start = self._last = time()
+
+    def mark(self, name):
+        now = time()
+        self.phases.append((name, now - self._last))
+        self._last = now
 
+    def report(self):
+        lines = ['%-24s %8.3fs' % (name, cost) for name, cost in self.phases]
+        lines.append('%-24s %8.3fs' % ('total', self._last - self._start))
+        return '\n'.join(lines)
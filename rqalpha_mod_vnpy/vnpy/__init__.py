@@ -15,13 +15,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys
-from ..mod import vn_ctp_path
-sys.path.append(vn_ctp_path)
+from ..backends import load_backend
 
-from vnctpmd import MdApi
-from vnctptd import TdApi
-from ctpDataType import defineDict
+MdApi, TdApi, defineDict = load_backend()
 
 
 __all__ = [
@@ -15,10 +15,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+
+import six
+
 from rqalpha.interface import AbstractBroker
 from rqalpha.environment import Environment
 from rqalpha.model.account import BenchmarkAccount, FutureAccount
 from rqalpha.const import ACCOUNT_TYPE
+from rqalpha.events import Event, EVENT
+from rqalpha.utils.logger import user_system_log
 
 
 def init_accounts(env):
@@ -36,30 +42,178 @@ def init_accounts(env):
 
 
 class VNPYBroker(AbstractBroker):
-    def __init__(self, gateway):
+    """
+    gateway 为默认账户，其持仓构成策略的 portfolio。可通过 :meth:`add_account` 添加共用行情的其他账户，
+    订单发往 :meth:`select_account` 选中的账户，撤单发往订单所属的账户。
+    """
+    def __init__(self, gateway, risk_engine=None):
         self._gateway = gateway
+        self._risk_engine = risk_engine
         self._open_orders = []
+        self._accounts = OrderedDict()
+        self._selected = None
+        # 待撤单完成后再报出的替换订单，原订单 order_id -> (原订单, 请求时原订单的成交量, 替换订单, 报往的账户)
+        self._replacements = {}
+        self.add_account(gateway.name, gateway, risk_engine)
+
+        event_bus = Environment.get_instance().event_bus
+        event_bus.add_listener(EVENT.ORDER_CANCELLATION_PASS, self._on_order_final)
+        event_bus.add_listener(EVENT.ORDER_UNSOLICITED_UPDATE, self._on_order_final)
+        event_bus.add_listener(EVENT.ORDER_CANCELLATION_REJECT, self._on_cancellation_reject)
+        event_bus.add_listener(EVENT.TRADE, self._on_trade)
+
+    def add_account(self, name, gateway, risk_engine=None):
+        if name in self._accounts:
+            raise ValueError('duplicate account name {}'.format(name))
+        self._accounts[name] = (gateway, risk_engine)
+        if self._selected is None:
+            self._selected = name
+        if risk_engine is not None:
+            risk_engine.sync(gateway.get_pos_dicts(), gateway.open_orders)
+
+    @property
+    def account_names(self):
+        return list(self._accounts.keys())
+
+    @property
+    def selected_account(self):
+        return self._selected
+
+    def select_account(self, name):
+        if name not in self._accounts:
+            raise ValueError('unknown account {}'.format(name))
+        self._selected = name
+
+    def get_account_portfolio(self, name):
+        gateway, _ = self._accounts[name]
+        return gateway.get_portfolio()
 
     def after_trading(self):
         pass
 
     def before_trading(self):
-        self._gateway.connect_and_sync_data()
+        # 默认账户持有行情连接，需最先同步
+        for gateway, risk_engine in six.itervalues(self._accounts):
+            gateway.connect_and_sync_data()
+            if risk_engine is not None:
+                risk_engine.sync(gateway.get_pos_dicts(), gateway.open_orders)
         for account, order in self._open_orders:
             order.active()
             self._env.event_bus.publish_event(Event(EVENT.ORDER_CREATION_PASS, account=account, order=order))
 
     def get_open_orders(self, order_book_id=None):
+        if len(self._accounts) == 1:
+            open_orders = self._gateway.open_orders
+        else:
+            open_orders = [order for gateway, _ in six.itervalues(self._accounts) for order in gateway.open_orders]
         if order_book_id is not None:
-            return [order for order in self._gateway.open_orders if order.order_book_id == order_book_id]
+            return [order for order in open_orders if order.order_book_id == order_book_id]
         else:
-            return self._gateway.open_orders
+            return open_orders
 
     def submit_order(self, order):
-        self._gateway.submit_order(order)
+        self.submit_orders([order])
 
     def cancel_order(self, order):
-        self._gateway.cancel_order(order)
+        self.cancel_orders([order])
+
+    def submit_orders(self, orders):
+        self._submit(self._selected, orders)
+
+    def _submit(self, name, orders):
+        gateway, risk_engine = self._accounts[name]
+        # 风控检查策略提交的订单，通过后再拆分平今、平昨
+        gateway.submit_orders(gateway.split_close_orders(self._check_submit(gateway, risk_engine, orders)))
+
+    def cancel_orders(self, orders):
+        if len(self._accounts) == 1:
+            self._gateway.cancel_orders(self._check_cancel(self._gateway, self._risk_engine, orders))
+            return
+        for gateway, risk_engine in six.itervalues(self._accounts):
+            own_orders = [order for order in orders if gateway.owns(order)]
+            if own_orders:
+                gateway.cancel_orders(self._check_cancel(gateway, risk_engine, own_orders))
+
+    def cancel_all(self, order_book_id=None, side=None):
+        orders = [order for order in self.get_open_orders(order_book_id) if side is None or order.side == side]
+        self.cancel_orders(orders)
+        return orders
+
+    def cancel_and_replace(self, orders, new_orders):
+        """
+        撤销 orders，new_orders[i] 在 orders[i] 撤单成功后才报出，数量减去其间 orders[i] 新成交的数量，
+        减至 0 或撤单被拒绝时不再报出。原订单已结束时立即报出。
+        """
+        if len(orders) != len(new_orders):
+            raise ValueError('orders and new_orders should have the same length, got {} and {}'.format(
+                len(orders), len(new_orders)))
+        # 撤单风控拒绝时同步发布 ORDER_CANCELLATION_REJECT，须先登记
+        for order, new_order in zip(orders, new_orders):
+            self._replacements[order.order_id] = (order, order.filled_quantity, new_order, self._selected)
+        self.cancel_orders(orders)
+        for order in orders:
+            self._replace(order)
+
+    def _replace(self, order):
+        if not order.is_final():
+            return
+        replacement = self._replacements.pop(order.order_id, None)
+        if replacement is None:
+            return
+        order, filled_quantity, new_order, name = replacement
+        quantity = new_order.quantity - (order.filled_quantity - filled_quantity)
+        if quantity <= 0:
+            reason = 'Order was rejected: order {} filled {} before it was cancelled.'.format(
+                order.order_id, order.filled_quantity - filled_quantity)
+            self._accounts[name][0].reject_order(new_order, reason)
+            return
+        # 替换订单尚未报出，也未发布过事件，可以直接修改数量
+        new_order._quantity = quantity
+        self._submit(name, [new_order])
+
+    def _on_order_final(self, event):
+        self._replace(event.order)
+
+    def _on_trade(self, event):
+        replacement = self._replacements.get(event.trade.order_id)
+        if replacement is not None:
+            # 撤单前已全部成交
+            self._replace(replacement[0])
+
+    def _on_cancellation_reject(self, event):
+        replacement = self._replacements.pop(event.order.order_id, None)
+        if replacement is not None:
+            order, _, new_order, name = replacement
+            self._accounts[name][0].reject_order(
+                new_order, 'Order was rejected: cancellation of order {} was rejected.'.format(order.order_id))
+
+    @staticmethod
+    def _check_submit(gateway, risk_engine, orders):
+        if risk_engine is None:
+            return orders
+        passed = []
+        for order in orders:
+            reason = risk_engine.check_submit(order)
+            if reason is None:
+                passed.append(order)
+            else:
+                gateway.reject_order(order, reason)
+        return passed
+
+    @staticmethod
+    def _check_cancel(gateway, risk_engine, orders):
+        if risk_engine is None:
+            return orders
+        passed = []
+        for order in orders:
+            reason = risk_engine.check_cancel(order)
+            if reason is None:
+                passed.append(order)
+            else:
+                user_system_log.warn(reason)
+                Environment.get_instance().event_bus.publish_event(
+                    Event(EVENT.ORDER_CANCELLATION_REJECT, account=gateway.account, order=order))
+        return passed
 
     def update(self, calendar_dt, trading_dt, bar_dict):
         pass
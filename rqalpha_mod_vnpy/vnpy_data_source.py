@@ -15,17 +15,123 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+from time import time
+
+import six
+
 from rqalpha.data.base_data_source import BaseDataSource
+from rqalpha.data.converter import StockBarConverter, IndexBarConverter
+from rqalpha.data.converter import FutureDayBarConverter, FundDayBarConverter
+from rqalpha.data.daybar_store import DayBarStore
+from rqalpha.data.date_set import DateSet
+from rqalpha.data.dividend_store import DividendStore
+from rqalpha.data.instrument_store import InstrumentStore
+from rqalpha.data.trading_dates_store import TradingDatesStore
+from rqalpha.data.yield_curve_store import YieldCurveStore
+from rqalpha.data.simple_factor_store import SimpleFactorStore
 from rqalpha.model.snapshot import SnapshotObject
 from rqalpha.utils.logger import system_log
 from datetime import date
 
 
+DAY_BAR_STORES = [
+    ('stocks.bcolz', StockBarConverter),
+    ('indexes.bcolz', IndexBarConverter),
+    ('futures.bcolz', FutureDayBarConverter),
+    ('funds.bcolz', FundDayBarConverter),
+]
+
+LAZY_STORES = {
+    '_instruments': (InstrumentStore, 'instruments.pk'),
+    '_dividends': (DividendStore, 'original_dividends.bcolz'),
+    '_trading_dates': (TradingDatesStore, 'trading_dates.bcolz'),
+    '_yield_curve': (YieldCurveStore, 'yield_curve.bcolz'),
+    '_split_factor': (SimpleFactorStore, 'split_factor.bcolz'),
+    '_ex_cum_factor': (SimpleFactorStore, 'ex_cum_factor.bcolz'),
+    '_st_stock_days': (DateSet, 'st_stock_days.bcolz'),
+    '_suspend_days': (DateSet, 'suspended_days.bcolz'),
+}
+
+
+BUNDLE_OUT_OF_DATE = u"Bundle is out of date, please use `rqalpha update_bundle` to renew your bundle data."
+
+# rqalpha 的 history_bars 接受的复权方式，期货不复权，三者结果相同
+ADJUST_TYPES = ('pre', 'post', 'none')
+
+
+def open_store(path, name, factory, *args):
+    start = time()
+    try:
+        store = factory(os.path.join(path, name), *args)
+    except IOError:
+        raise RuntimeError(BUNDLE_OUT_OF_DATE)
+    system_log.debug('打开数据包 {}，耗时 {:.3f}s', name, time() - start)
+    return store
+
+
+class LazyDayBarStores(object):
+    """
+    按品种类型在首次访问时才打开的日线数据。
+    """
+    def __init__(self, path):
+        self._path = path
+        self._stores = [None] * len(DAY_BAR_STORES)
+
+    def __getitem__(self, i):
+        store = self._stores[i]
+        if store is None:
+            name, converter = DAY_BAR_STORES[i]
+            store = self._stores[i] = open_store(self._path, name, DayBarStore, converter)
+        return store
+
+
 class VNPYDataSource(BaseDataSource):
-    def __init__(self, env, data_cache):
+    def __init__(self, env, data_cache, bar_history=None, lazy=False):
         path = env.config.base.data_bundle_path
-        super(VNPYDataSource, self).__init__(path)
+        if lazy:
+            # 各数据文件在首次访问时才打开，见 __getattr__。启动时只检查文件是否存在，与立即打开时一样尽早发现数据包不完整
+            for name in [name for name, _ in DAY_BAR_STORES] + [name for _, name in six.itervalues(LAZY_STORES)]:
+                if not os.path.exists(os.path.join(path, name)):
+                    raise RuntimeError(BUNDLE_OUT_OF_DATE)
+            self._path = path
+            self._day_bars = LazyDayBarStores(path)
+        else:
+            super(VNPYDataSource, self).__init__(path)
         self._cache = data_cache
+        self._bar_history = bar_history
+
+    def __getattr__(self, item):
+        # 仅在属性不存在时调用，即 lazy 模式下尚未打开的数据文件
+        if item not in LAZY_STORES or '_path' not in self.__dict__:
+            raise AttributeError(item)
+        factory, name = LAZY_STORES[item]
+        store = open_store(self._path, name, factory)
+        setattr(self, item, store)
+        return store
+
+    # BaseDataSource 在 __init__ 中把这两个函数绑定为国债利率数据的方法，lazy 模式下改为在首次调用时打开数据文件
+
+    def get_yield_curve(self, start_date, end_date, tenor=None):
+        return self._yield_curve.get_yield_curve(start_date, end_date, tenor)
+
+    def get_risk_free_rate(self, start_date, end_date):
+        return self._yield_curve.get_risk_free_rate(start_date, end_date)
+
+    def history_bars(self, instrument, bar_count, frequency, fields, dt,
+                     skip_suspended=True, include_now=False,
+                     adjust_type='pre', adjust_orig=None):
+        """
+        期货合约的 bar 由数据包历史数据及本地聚合的 tick 拼接而成。期货没有停牌及复权，skip_suspended 不起作用，
+        adjust_type 只接受 rqalpha 支持的取值。
+        """
+        if self._bar_history is None or instrument.type != 'Future' or not self._bar_history.supports(frequency):
+            return super(VNPYDataSource, self).history_bars(instrument, bar_count, frequency, fields, dt,
+                                                            skip_suspended, include_now, adjust_type, adjust_orig)
+        if adjust_type not in ADJUST_TYPES:
+            raise RuntimeError('invalid adjust_type')
+        return self._bar_history.history_bars(instrument.order_book_id, bar_count, frequency, fields, dt,
+                                              include_now, lambda: self._all_day_bars_of(instrument))
 
     def current_snapshot(self, instrument, frequency, dt):
         if frequency != 'tick':
@@ -44,11 +150,17 @@ class VNPYDataSource(BaseDataSource):
         e = date.fromtimestamp(2147483647)
         return s, e
 
+    def get_dominant_contract(self, underlying_symbol):
+        return self._cache.market.dominant.get(underlying_symbol)
+
+    def get_underlying_contracts(self, underlying_symbol):
+        return list(self._cache.market.index.contracts(underlying_symbol))
+
+    def get_exchange_underlyings(self, exchange_id=None):
+        return list(self._cache.market.index.underlyings(exchange_id))
+
     def get_future_info(self, instrument, hedge_type):
-        order_book_id = instrument.order_book_id
-        try:
-            underlying_symbol = self._cache.ins.get(order_book_id).underlying_symbol
-            hedge_flag = hedge_type.value
-            return self._cache.future_info.get(underlying_symbol).get(hedge_flag)
-        except AttributeError:
+        cost = self._cache.cost_table.get(instrument.order_book_id)
+        if cost is None:
             return None
+        return cost.future_info.get(hedge_type.value)
@@ -16,14 +16,48 @@
 # limitations under the License.
 
 from datetime import timedelta, datetime, date
+from time import time as timestamp
+from timeit import default_timer
 from dateutil.parser import parse
 from threading import Thread
 from enum import Enum
 
+import rqalpha
 from rqalpha.utils.logger import system_log
 from rqalpha.interface import AbstractEventSource
 from rqalpha.events import Event, EVENT
 from rqalpha.utils import RqAttrDict
+from rqalpha.utils import scheduler as mod_scheduler
+from rqalpha.utils.exception import ModifyExceptionFromType
+from rqalpha.execution_context import ExecutionContext
+from rqalpha.const import EXC_TYPE, EXECUTION_PHASE
+
+from .metrics import MetricsRegistry
+from .journal import EventJournal, TICK
+from .events import VNPY_EVENT
+from .multiplexer import PRIORITY_TD
+from .timer import TimerWheel, DAY_SECONDS, parse_time_of_day, next_occurrence
+
+
+# rqalpha 没有公开获取策略 context 的接口，定时器回调的 context 取自调度器的私有属性，只在以下主版本上验证过
+USER_CONTEXT_VERIFIED_VERSIONS = (2, )
+
+
+def user_context():
+    """
+    返回 rqalpha 传给策略函数的 context。
+
+    读取 rqalpha.utils.scheduler 中调度器的私有属性 _ucontext，对该私有属性的访问只在此处，
+    rqalpha 主版本未经验证或属性不存在时抛出 RuntimeError，而不是把错误的 context 传给策略。
+    """
+    version_info = getattr(rqalpha, 'version_info', None)
+    if version_info is not None and version_info[0] not in USER_CONTEXT_VERIFIED_VERSIONS:
+        raise RuntimeError('定时器不支持 rqalpha {}，请升级 rqalpha_mod_vnpy'.format(
+            getattr(rqalpha, '__version__', 'unknown')))
+    ucontext = getattr(mod_scheduler._scheduler, '_ucontext', None)
+    if ucontext is None:
+        raise RuntimeError('无法取得策略的 context，调度器尚未初始化')
+    return ucontext
 
 
 class TimePeriod(Enum):
@@ -35,13 +69,67 @@ class TimePeriod(Enum):
 
 # TODO: 目前只考虑了期货的场景
 class VNPYEventSource(AbstractEventSource):
-    def __init__(self, env, mod_config, gateway):
+    def __init__(self, env, mod_config, gateway, metrics=None, journal=None):
         self._env = env
         self._mod_config = mod_config
         self._gateway = gateway
         self._before_trading_processed = False
         self._after_trading_processed = False
         self._time_period = None
+        self._journal = journal if journal is not None else EventJournal(enabled=False)
+        self._multiplexer = gateway.multiplexer
+        self._timers = TimerWheel()
+
+        registry = metrics if metrics is not None else MetricsRegistry()
+        self._event_counters = {event: registry.counter('vnpy_events_total', '事件源发出的事件数', event=event)
+                                for event in ('before_trading', 'tick', 'after_trading', 'timer', 'td')}
+        self._tick_handling = registry.histogram('vnpy_tick_handling_seconds', '策略线程处理一个 TICK 事件的时间')
+        registry.gauge('vnpy_timers', '已注册的定时器数').set_function(lambda: len(self._timers))
+
+        env.event_bus.add_listener(VNPY_EVENT.TIMER, self._on_timer)
+
+    def schedule_timer(self, func, interval=None, at=None, repeat=True):
+        """
+        注册定时器，返回定时器 id。只在交易时段内触发，与行情在同一线程中依次处理。
+
+        :param func: 到期时以 func(context) 调用
+        :param interval: 每隔 interval 秒触发一次，repeat 为 False 时只在 interval 秒后触发一次
+        :param at: 每天到达 at 时刻（"HH:MM[:SS]" 或 datetime.time）时触发，repeat 为 False 时只触发一次
+        """
+        if (interval is None) == (at is None):
+            raise ValueError('exactly one of interval and at should be given')
+        now = timestamp()
+        if at is not None:
+            deadline = next_occurrence(parse_time_of_day(at), now)
+            period = DAY_SECONDS if repeat else None
+        else:
+            if interval <= 0:
+                raise ValueError('interval should be positive, got {}'.format(interval))
+            deadline = now + interval
+            period = interval if repeat else None
+        return self._timers.schedule(func, deadline, period).timer_id
+
+    def cancel_timer(self, timer_id):
+        return self._timers.cancel(timer_id)
+
+    def _dispatch_td(self, item):
+        # 订单及成交回报在策略线程中处理，处理过程中直接发布 rqalpha 的订单及成交事件
+        handler, data = item
+        self._event_counters['td'].inc()
+        handler(data)
+
+    def _dispatch_pending_td(self):
+        while True:
+            event = self._multiplexer.get(0, PRIORITY_TD)
+            if event is None:
+                return
+            self._dispatch_td(event[1])
+
+    def _on_timer(self, event):
+        ucontext = user_context()
+        with ExecutionContext(EXECUTION_PHASE.SCHEDULED):
+            with ModifyExceptionFromType(EXC_TYPE.USER_EXC):
+                event.timer.callback(ucontext)
 
     def mark_time_period(self, start_date, end_date):
         trading_days = self._env.data_proxy.get_trading_dates(start_date, end_date)
@@ -110,11 +198,14 @@ class VNPYEventSource(AbstractEventSource):
         mark_time_thread.setDaemon(True)
         mark_time_thread.start()
         while True:
+            if self._time_period != TimePeriod.TRADING:
+                self._dispatch_pending_td()
             if self._time_period == TimePeriod.BEFORE_TRADING:
                 if self._after_trading_processed:
                     self._after_trading_processed = False
                 if not self._before_trading_processed:
                     system_log.debug("VNPYEventSource: before trading event")
+                    self._event_counters['before_trading'].inc()
                     yield Event(EVENT.BEFORE_TRADING, calendar_dt=datetime.now(), trading_dt=datetime.now() + timedelta(days=1))
                     self._before_trading_processed = True
                     continue
@@ -123,26 +214,46 @@ class VNPYEventSource(AbstractEventSource):
             elif self._time_period == TimePeriod.TRADING:
                 if not self._before_trading_processed:
                     system_log.debug("VNPYEventSource: before trading event")
+                    self._event_counters['before_trading'].inc()
                     yield Event(EVENT.BEFORE_TRADING, calendar_dt=datetime.now(), trading_dt=datetime.now() + timedelta(days=1))
                     self._before_trading_processed = True
                     continue
                 else:
-                    tick = self._gateway.get_tick()
+                    # 在等待回报及行情的同时等待最近一个定时器到期，回报先于行情处理
+                    event = self._multiplexer.get(self._timers.next_timeout(timestamp()))
+                    for timer in self._timers.advance(timestamp()):
+                        self._event_counters['timer'].inc()
+                        now = datetime.now()
+                        yield Event(VNPY_EVENT.TIMER, calendar_dt=now,
+                                    trading_dt=now + timedelta(days=1) if now.hour > 20 else now, timer=timer)
+                    if event is None:
+                        continue
+                    priority, item = event
+                    if priority == PRIORITY_TD:
+                        self._dispatch_td(item)
+                        continue
+                    tick = item
                     calendar_dt = parse(
-                        ''.join((str(tick.date), str(tick.time / 1000)))) if tick.time >= 100000000 else parse(
-                        '0'.join((str(tick.date), str(tick.time / 1000))))
+                        ''.join((str(tick.action_day), str(tick.time // 1000)))) if tick.time >= 100000000 else parse(
+                        '0'.join((str(tick.action_day), str(tick.time // 1000))))
 
                     if calendar_dt.hour > 20:
                         trading_dt = calendar_dt + timedelta(days=1)
                     else:
                         trading_dt = calendar_dt
-                    system_log.debug("VNPYEventSource: tick {}", tick)
-                    yield Event(EVENT.TICK, calendar_dt=calendar_dt, trading_dt=trading_dt, tick=RqAttrDict(tick))
+                    if self._journal.enabled:
+                        self._journal.record(TICK, tick)
+                    self._event_counters['tick'].inc()
+                    event = Event(EVENT.TICK, calendar_dt=calendar_dt, trading_dt=trading_dt, tick=RqAttrDict(tick))
+                    yield_time = default_timer()
+                    yield event
+                    self._tick_handling.observe(default_timer() - yield_time)
             elif self._time_period == TimePeriod.AFTER_TRADING:
                 if self._before_trading_processed:
                     self._before_trading_processed = False
                 if not self._after_trading_processed:
                     system_log.debug("VNPYEventSource: after trading event")
+                    self._event_counters['after_trading'].inc()
                     yield Event(EVENT.AFTER_TRADING, calendar_dt=datetime.now(), trading_dt=datetime.now())
                     self._after_trading_processed = True
                 else:
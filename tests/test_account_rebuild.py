@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rqalpha.events import EventBus, EVENT, Event
+
+from rqalpha_mod_vnpy.ctp.data_cache import DataCache
+from rqalpha_mod_vnpy.ctp.data_dict import AccountDict
+from rqalpha_mod_vnpy.ctp.valuation import VNPYFutureAccount
+
+
+def make_cache():
+    cache = DataCache()
+    cache.cache_account(AccountDict({'PreBalance': 1000000.}))
+    cache.cache_position({})
+    return cache
+
+
+def test_account_is_rebuilt_in_place(monkeypatch):
+    calls = []
+    monkeypatch.setattr(VNPYFutureAccount, '_on_trade', lambda self, event: calls.append(self))
+    event_bus = EventBus()
+    cache = make_cache()
+    cache.register_event(event_bus)
+
+    account, static_value = cache.account
+    assert static_value == 1000000.
+    # 重新同步后在原对象上重建，风控及 portfolio 持有的引用仍然有效
+    cache.cache_account(AccountDict({'PreBalance': 2000000.}))
+    rebuilt, static_value = cache.account
+    assert rebuilt is account
+    assert static_value == 2000000.
+    assert rebuilt.total_value == 2000000.
+
+    event_bus.publish_event(Event(EVENT.TRADE, account=account, trade=None))
+    assert calls == [account]
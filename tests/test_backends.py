@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from threading import Event
+
+import pytest
+
+from rqalpha_mod_vnpy.backends import load_ctp
+from rqalpha_mod_vnpy.synthetic import CallbackWorker
+
+
+def test_load_ctp_without_config_imports_from_sys_path():
+    # 没有配置时不再报 RuntimeError，而是像此前一样直接从 sys.path 导入
+    try:
+        import vnctpmd  # noqa
+    except ImportError:
+        with pytest.raises(ImportError):
+            load_ctp(None)
+    else:
+        md_api, td_api, define_dict = load_ctp(None)
+        assert 'THOST_FTDC_D_Buy' in define_dict
+
+
+def test_callback_worker_survives_exception():
+    worker = CallbackWorker('test_worker')
+    worker.start()
+    done = Event()
+
+    def fail():
+        raise ValueError('boom')
+
+    worker.put(fail)
+    worker.put(done.set)
+    try:
+        assert done.wait(5)
+    finally:
+        worker.stop()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmarks'))
+
+from bench_hot_paths import compare
+
+
+def result(ops_per_sec, p50_us, p99_us, max_us):
+    return {'count': 100, 'ops_per_sec': ops_per_sec, 'p50_us': p50_us, 'p99_us': p99_us, 'max_us': max_us}
+
+
+def test_compare_flags_throughput_drop_and_latency_rise():
+    baseline = {'a': result(1000., 10., 20., 50.), 'b': result(1000., 10., 20., 50.)}
+    results = {'a': result(800., 10., 20., 50.), 'b': result(1000., 10., 30., 50.)}
+    assert compare(results, baseline, .1) == ['a.ops_per_sec', 'b.p99_us']
+
+
+def test_compare_ignores_improvements_and_missing_fields():
+    baseline = {'a': result(1000., 10., 20., 50.), 'b': {'count': 1, 'ops_per_sec': 10.}}
+    results = {'a': result(2000., 5., 10., 25.), 'b': result(10., 1., 1., 1.), 'c': result(1., 1., 1., 1.)}
+    assert compare(results, baseline, .1) == []
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pytest
+
+from rqalpha.const import SIDE, POSITION_EFFECT, ORDER_STATUS
+from rqalpha.environment import Environment
+from rqalpha.events import EVENT, Event
+from rqalpha.model.order import Order, LimitOrder
+from rqalpha.model.trade import Trade
+from rqalpha.utils import RqAttrDict
+
+from rqalpha_mod_vnpy.vnpy_broker import VNPYBroker
+
+
+class FakeGateway(object):
+    name = 'default'
+    account = None
+    open_orders = []
+
+    def __init__(self):
+        self.submitted = []
+        self.cancelled = []
+        self.rejected = []
+
+    def get_pos_dicts(self):
+        return {}
+
+    def owns(self, order):
+        return True
+
+    def split_close_orders(self, orders):
+        return orders
+
+    def submit_orders(self, orders):
+        self.submitted.extend(orders)
+
+    def cancel_orders(self, orders):
+        self.cancelled.extend(orders)
+
+    def reject_order(self, order, reason):
+        order.mark_rejected(reason)
+        self.rejected.append(order)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setattr(Environment, '_env', None)
+    env = Environment(RqAttrDict({'base': {}}))
+    env.calendar_dt = env.trading_dt = datetime.now()
+    return env
+
+
+def make_order(quantity):
+    return Order.__from_create__('RB1710', quantity, SIDE.BUY, LimitOrder(3000.), POSITION_EFFECT.OPEN)
+
+
+def fill(env, order, quantity):
+    trade = Trade.__from_create__(order.order_id, 3000., quantity, order.side, order.position_effect,
+                                  order.order_book_id)
+    order.fill(trade)
+    env.event_bus.publish_event(Event(EVENT.TRADE, account=None, trade=trade))
+
+
+def cancel(env, order):
+    order.mark_cancelled('cancelled', user_warn=False)
+    env.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_PASS, account=None, order=order))
+
+
+def test_replacement_waits_for_cancellation(env):
+    gateway = FakeGateway()
+    broker = VNPYBroker(gateway)
+    old, new = make_order(5), make_order(5)
+    broker.cancel_and_replace([old], [new])
+    assert gateway.cancelled == [old] and gateway.submitted == []
+
+    cancel(env, old)
+    assert gateway.submitted == [new] and new.quantity == 5
+
+
+def test_replacement_shrinks_by_volume_filled_before_cancellation(env):
+    gateway = FakeGateway()
+    broker = VNPYBroker(gateway)
+    old, new = make_order(5), make_order(5)
+    fill(env, old, 1)
+    broker.cancel_and_replace([old], [new])
+
+    fill(env, old, 2)
+    assert gateway.submitted == []
+    cancel(env, old)
+    assert gateway.submitted == [new] and new.quantity == 3
+
+
+def test_replacement_is_dropped_when_original_fills_or_cancel_is_rejected(env):
+    gateway = FakeGateway()
+    broker = VNPYBroker(gateway)
+    filled, rejected = make_order(2), make_order(2)
+    new_filled, new_rejected = make_order(2), make_order(2)
+    broker.cancel_and_replace([filled, rejected], [new_filled, new_rejected])
+
+    fill(env, filled, 2)
+    env.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_REJECT, account=None, order=rejected))
+    assert gateway.submitted == []
+    assert gateway.rejected == [new_filled, new_rejected]
+    assert new_filled.status == new_rejected.status == ORDER_STATUS.REJECTED
+
+    # 之后的事件不再影响已经处理的替换订单
+    cancel(env, rejected)
+    assert gateway.submitted == []
+
+
+def test_replacement_of_final_order_is_submitted_at_once(env):
+    gateway = FakeGateway()
+    broker = VNPYBroker(gateway)
+    old, new = make_order(2), make_order(2)
+    old.mark_cancelled('cancelled', user_warn=False)
+    broker.cancel_and_replace([old], [new])
+    assert gateway.submitted == [new]
+    with pytest.raises(ValueError):
+        broker.cancel_and_replace([make_order(1)], [])
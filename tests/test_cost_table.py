@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rqalpha.const import SIDE, POSITION_EFFECT, COMMISSION_TYPE
+
+from rqalpha_mod_vnpy.ctp.cost_table import CostTable
+from rqalpha_mod_vnpy.ctp.data_dict import InstrumentDict
+
+
+def make_table():
+    ins_dict = InstrumentDict({'InstrumentID': 'rb1710', 'ExchangeID': 'SHFE', 'VolumeMultiple': 10,
+                               'LongMarginRatio': .1, 'ShortMarginRatio': .2})
+    table = CostTable()
+    table.build({ins_dict.order_book_id: ins_dict}, {ins_dict.underlying_symbol: {'speculation': {}}})
+    table.update_commission(ins_dict.underlying_symbol, {
+        'open_commission_ratio': 1e-4, 'close_commission_ratio': 2e-4, 'close_commission_today_ratio': 3e-4,
+        'commission_type': COMMISSION_TYPE.BY_MONEY,
+    })
+    return table
+
+
+def test_unknown_position_effect_uses_close_rate():
+    table = make_table()
+    close = table.commission('RB1710', 3000., 2, POSITION_EFFECT.CLOSE)
+    assert close == 3000. * 2 * 10 * 2e-4
+    assert table.commission('RB1710', 3000., 2, None) == close
+    assert list(table.batch_commission(['RB1710', 'RB1710', 'AU1712'], [3000.] * 3, [2] * 3,
+                                       [None, POSITION_EFFECT.OPEN, None])) == [close, close / 2, 0.]
+
+
+def test_margin_uses_side_ratio():
+    table = make_table()
+    assert table.margin('RB1710', 3000., 2, SIDE.BUY) == 3000. * 2 * 10 * .1
+    assert table.margin('RB1710', 3000., 2, SIDE.SELL) == 3000. * 2 * 10 * .2
+    assert table.margin('AU1712', 300., 1, SIDE.BUY) == 0.
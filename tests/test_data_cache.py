@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import time
+
+from rqalpha_mod_vnpy.ctp.data_cache import DataCache
+
+
+class FakeTick(object):
+    __slots__ = ('order_book_id', 'last', 'seq')
+
+    def __init__(self, order_book_id, seq):
+        self.order_book_id = order_book_id
+        self.last = 1. + seq % 7
+        self.seq = seq
+
+
+class FakeTrade(object):
+    __slots__ = ('order_book_id', 'trade_id')
+
+    def __init__(self, order_book_id, trade_id):
+        self.order_book_id = order_book_id
+        self.trade_id = trade_id
+
+
+def test_snapshot_copies_only_on_new_keys():
+    cache = DataCache()
+    cache.cache_snapshot(FakeTick('IF1706', 1))
+    snapshot = cache.snapshot
+
+    # 更新已有合约时不复制，新增合约时才发布新的字典，已拿到的版本中合约不变
+    cache.cache_snapshot(FakeTick('IF1706', 2))
+    assert cache.snapshot is snapshot
+    assert snapshot['IF1706'].seq == 2
+    cache.cache_snapshot(FakeTick('IF1707', 3))
+    assert cache.snapshot is not snapshot
+    assert list(snapshot) == ['IF1706']
+    assert sorted(cache.snapshot) == ['IF1706', 'IF1707']
+
+
+def test_trades_version_is_not_modified_by_later_writes():
+    cache = DataCache()
+    assert cache.cache_trade(FakeTrade('RB1710', 1))
+    trades = cache.trades
+
+    assert cache.cache_trade(FakeTrade('RB1710', 2))
+    assert not cache.cache_trade(FakeTrade('RB1710', 2))
+    assert [t.trade_id for t in trades['RB1710']] == [1]
+    assert [t.trade_id for t in cache.trades['RB1710']] == [1, 2]
+
+
+def md_writer(cache, stop, n_instruments, counter):
+    seq = 0
+    while not stop.is_set():
+        seq += 1
+        cache.cache_snapshot(FakeTick('IF%04d' % (seq % n_instruments), seq))
+    counter['ticks'] = seq
+
+
+def td_writer(cache, stop, counter):
+    trade_id = 0
+    while not stop.is_set():
+        trade_id += 1
+        cache.cache_trade(FakeTrade('RB%04d' % (trade_id % 50), trade_id))
+        time.sleep(0)
+    counter['trades'] = trade_id
+
+
+def reader(cache, stop, errors, counter, index):
+    last_seq = {}
+    last_size = 0
+    reads = 0
+    while not stop.is_set():
+        try:
+            snapshot = cache.snapshot
+            if len(snapshot) < last_size:
+                errors.append('快照合约数减少: %d -> %d' % (last_size, len(snapshot)))
+            last_size = len(snapshot)
+            seqs = {}
+            for order_book_id, tick in snapshot.items():
+                if tick.order_book_id != order_book_id:
+                    errors.append('快照键值不一致: %s / %s' % (order_book_id, tick.order_book_id))
+                if tick.seq < last_seq.get(order_book_id, 0):
+                    errors.append('快照版本回退: %s' % order_book_id)
+                seqs[order_book_id] = tick.seq
+            last_seq.update(seqs)
+            # 遍历期间写入方不断写入，拿到的版本中合约不变
+            if len(snapshot) != len(seqs):
+                errors.append('快照在遍历期间增加了合约')
+
+            trades = cache.trades
+            for order_book_id in trades:
+                ids = [t.trade_id for t in trades[order_book_id]]
+                if ids != sorted(ids):
+                    errors.append('成交顺序错乱: %s' % order_book_id)
+        except Exception as e:
+            errors.append('%s: %s' % (type(e).__name__, e))
+        reads += 1
+    counter['reads_%d' % index] = reads
+
+
+def test_concurrent_readers_see_consistent_versions():
+    """
+    一个行情线程不断写入快照（持续新增合约并更新已有合约），一个交易线程不断追加成交，
+    多个读取线程同时遍历快照及成交，检查读到的每个版本是否一致。
+    """
+    # 缩短线程切换间隔，尽量制造交错
+    if hasattr(sys, 'setswitchinterval'):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+    else:
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+
+    cache = DataCache()
+    stop = threading.Event()
+    errors = []
+    counter = {}
+    threads = [
+        threading.Thread(target=md_writer, args=(cache, stop, 200, counter)),
+        threading.Thread(target=td_writer, args=(cache, stop, counter)),
+    ]
+    threads += [threading.Thread(target=reader, args=(cache, stop, errors, counter, i)) for i in range(4)]
+    try:
+        for t in threads:
+            t.start()
+        time.sleep(1.)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        if hasattr(sys, 'setswitchinterval'):
+            sys.setswitchinterval(interval)
+        else:
+            sys.setcheckinterval(interval)
+
+    assert counter['ticks'] > 0 and counter['trades'] > 0
+    assert errors == []
+    assert [t.trade_id for t in cache.trades['RB0001']] == sorted(t.trade_id for t in cache.trades['RB0001'])
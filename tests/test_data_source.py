@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+from rqalpha.utils import RqAttrDict
+
+from rqalpha_mod_vnpy import vnpy_data_source
+from rqalpha_mod_vnpy.vnpy_data_source import VNPYDataSource, DAY_BAR_STORES, LAZY_STORES
+
+
+class YieldCurveStore(object):
+    opened = []
+
+    def __init__(self, path):
+        self.opened.append(path)
+
+    def get_yield_curve(self, start_date, end_date, tenor=None):
+        return ('yield_curve', start_date, end_date, tenor)
+
+    def get_risk_free_rate(self, start_date, end_date):
+        return 0.03
+
+
+def make_bundle(path):
+    for name in [name for name, _ in DAY_BAR_STORES] + [name for _, name in LAZY_STORES.values()]:
+        open(os.path.join(str(path), name), 'w').close()
+
+
+def make_env(path):
+    return RqAttrDict({'config': {'base': {'data_bundle_path': str(path)}}})
+
+
+def test_lazy_data_source_serves_yield_curve(tmpdir, monkeypatch):
+    make_bundle(tmpdir)
+    monkeypatch.setitem(LAZY_STORES, '_yield_curve', (YieldCurveStore, 'yield_curve.bcolz'))
+    del YieldCurveStore.opened[:]
+
+    data_source = VNPYDataSource(make_env(tmpdir), None, lazy=True)
+    assert YieldCurveStore.opened == []
+
+    assert data_source.get_risk_free_rate('20170101', '20170201') == 0.03
+    assert data_source.get_yield_curve('20170101', '20170201', '1Y') == ('yield_curve', '20170101', '20170201', '1Y')
+    # 只在首次调用时打开一次
+    assert YieldCurveStore.opened == [os.path.join(str(tmpdir), 'yield_curve.bcolz')]
+
+
+def test_lazy_data_source_checks_bundle_path(tmpdir):
+    make_bundle(tmpdir)
+    os.remove(os.path.join(str(tmpdir), 'trading_dates.bcolz'))
+    with pytest.raises(RuntimeError):
+        VNPYDataSource(make_env(tmpdir), None, lazy=True)
+    with pytest.raises(RuntimeError):
+        VNPYDataSource(make_env(os.path.join(str(tmpdir), 'missing')), None, lazy=True)
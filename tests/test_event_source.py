@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import rqalpha
+from rqalpha.utils import scheduler as mod_scheduler
+
+from rqalpha_mod_vnpy.vnpy_event_source import user_context
+
+
+class Scheduler(object):
+    def __init__(self, ucontext):
+        self._ucontext = ucontext
+
+
+def test_user_context_comes_from_scheduler(monkeypatch):
+    ucontext = object()
+    monkeypatch.setattr(mod_scheduler, '_scheduler', Scheduler(ucontext))
+    assert user_context() is ucontext
+
+
+def test_user_context_rejects_missing_context(monkeypatch):
+    monkeypatch.setattr(mod_scheduler, '_scheduler', None)
+    with pytest.raises(RuntimeError):
+        user_context()
+
+
+def test_user_context_rejects_unverified_rqalpha(monkeypatch):
+    monkeypatch.setattr(mod_scheduler, '_scheduler', Scheduler(object()))
+    monkeypatch.setattr(rqalpha, 'version_info', (3, 0, 0), raising=False)
+    with pytest.raises(RuntimeError):
+        user_context()
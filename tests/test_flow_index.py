@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from rqalpha_mod_vnpy.ctp.data_dict import TradeDict
+from rqalpha_mod_vnpy.ctp.flow_index import FlowIndex, trade_key
+from rqalpha_mod_vnpy.ctp.wal import WriteAheadLog, RecoveredState, TRADE, read_records
+from rqalpha_mod_vnpy.vnpy import defineDict
+
+
+def trade_data(trade_id, trading_day='20170104'):
+    return {
+        'TradingDay': trading_day,
+        'OrderRef': '1',
+        'OrderSysID': '  100',
+        'TradeID': trade_id,
+        'InstrumentID': 'rb1710',
+        'ExchangeID': 'SHFE',
+        'Direction': defineDict['THOST_FTDC_D_Buy'],
+        'OffsetFlag': defineDict['THOST_FTDC_OF_Open'],
+        'Volume': 1,
+        'Price': 3000.,
+    }
+
+
+def flow_path(wal):
+    return os.path.splitext(wal.path)[0] + '.flow'
+
+
+def open_flow(wal, load):
+    # 与 CtpGateway.connect_and_sync_data 相同
+    flow_index = FlowIndex()
+    flow_index.open(flow_path(wal), load=load)
+    wal.set_durable_listener(flow_index.persist)
+    return flow_index
+
+
+def process_trade(flow_index, wal, data):
+    # 与 CtpTdApi.onRtnTrade 及 CtpGateway.on_trade 的顺序相同
+    flow_key = flow_index.add_trade(data)
+    if flow_key is None:
+        return False
+    wal.append(TRADE, TradeDict(data), flow_key)
+    return True
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_flow_key_is_written_after_wal_record_is_durable(tmpdir):
+    wal = WriteAheadLog(str(tmpdir), 'test', sync_interval=60)
+    flow_index = open_flow(wal, load=False)
+
+    assert process_trade(flow_index, wal, trade_data('1'))
+    # 同一进程内重传的回报直接丢弃
+    assert not process_trade(flow_index, wal, trade_data('1'))
+    assert read_lines(flow_path(wal)) == []
+
+    wal.sync()
+    assert read_lines(flow_path(wal)) == [trade_key(trade_data('1'))]
+    wal.close()
+    flow_index.close()
+
+
+def test_flow_key_is_written_with_each_record_without_sync_interval(tmpdir):
+    wal = WriteAheadLog(str(tmpdir), 'test', sync_interval=0)
+    flow_index = open_flow(wal, load=False)
+    assert process_trade(flow_index, wal, trade_data('1'))
+    assert read_lines(flow_path(wal)) == [trade_key(trade_data('1'))]
+    wal.close()
+    flow_index.close()
+
+
+def test_replayed_trade_is_kept_when_its_wal_record_was_lost(tmpdir):
+    wal = WriteAheadLog(str(tmpdir.mkdir('before')), 'test', sync_interval=60)
+    crashed_flow_index = open_flow(wal, load=False)
+    assert process_trade(crashed_flow_index, wal, trade_data('1'))
+    wal.sync()
+    durable_size = os.path.getsize(wal.path)
+    assert process_trade(crashed_flow_index, wal, trade_data('2'))
+
+    # 崩溃时磁盘上只有 fsync 过的内容：第一笔成交的记录及其回报键
+    after = tmpdir.mkdir('after')
+    with open(wal.path, 'rb') as f:
+        after.join(os.path.basename(wal.path)).write_binary(f.read(durable_size))
+    after.join(os.path.basename(flow_path(wal))).write('\n'.join(read_lines(flow_path(wal))) + '\n')
+
+    recovered = WriteAheadLog(str(after), 'test', sync_interval=60)
+    records, _ = read_records(recovered.path)
+    assert list(RecoveredState(records).trades) == ['1']
+    flow_index = open_flow(recovered, load=True)
+    # 柜台重传的两笔成交中，只有预写日志中已有的一笔被丢弃
+    assert not process_trade(flow_index, recovered, trade_data('1'))
+    assert process_trade(flow_index, recovered, trade_data('2'))
+    recovered.close()
+    flow_index.close()
+    wal.close()
+    crashed_flow_index.close()
+
+
+def test_trade_ids_recycled_on_a_later_trading_day_are_not_duplicates():
+    flow_index = FlowIndex()
+    assert flow_index.add_trade(trade_data('1'))
+    assert not flow_index.add_trade(trade_data('1'))
+    assert flow_index.add_trade(trade_data('1', '20170105'))
+
+    flow_index.reset()
+    assert len(flow_index) == 0
+    assert flow_index.add_trade(trade_data('1'))
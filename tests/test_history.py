@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pytest
+
+from rqalpha.utils import RqAttrDict
+from rqalpha.utils.exception import RQInvalidArgument
+
+from rqalpha_mod_vnpy.ctp import data_dict
+from rqalpha_mod_vnpy.ctp.data_dict import TickDict
+from rqalpha_mod_vnpy.history import BarHistory
+from rqalpha_mod_vnpy.vnpy_data_source import VNPYDataSource
+
+from test_data_source import make_bundle, make_env
+
+
+def make_tick(trading_day, action_day, update_time, price, delta_volume=1):
+    tick = TickDict({
+        'InstrumentID': 'rb1710',
+        'TradingDay': trading_day,
+        'ActionDay': action_day,
+        'UpdateTime': update_time,
+        'UpdateMillisec': 0,
+        'OpenPrice': price,
+        'LastPrice': price,
+        'HighestPrice': price,
+        'LowestPrice': price,
+        'PreClosePrice': price,
+        'SettlementPrice': 0.,
+        'PreSettlementPrice': price,
+        'Volume': 0,
+        'Turnover': 0.,
+        'OpenInterest': 100,
+        'BidPrice1': price, 'BidPrice2': 0., 'BidPrice3': 0., 'BidPrice4': 0., 'BidPrice5': 0.,
+        'BidVolume1': 1, 'BidVolume2': 0, 'BidVolume3': 0, 'BidVolume4': 0, 'BidVolume5': 0,
+        'AskPrice1': price, 'AskPrice2': 0., 'AskPrice3': 0., 'AskPrice4': 0., 'AskPrice5': 0.,
+        'AskVolume1': 1, 'AskVolume2': 0, 'AskVolume3': 0, 'AskVolume4': 0, 'AskVolume5': 0,
+        'UpperLimitPrice': price * 1.1,
+        'LowerLimitPrice': price * 0.9,
+    })
+    tick['delta_volume'] = delta_volume
+    tick['delta_turnover'] = price * delta_volume
+    return tick
+
+
+def no_base_bars():
+    return None
+
+
+def test_night_session_bars_precede_next_day_session():
+    history = BarHistory(['1m'])
+    # 20170104 交易日的夜盘在 20170103 晚上，日盘在 20170104 白天
+    for tick in (make_tick('20170104', '20170103', '21:00:30', 10.),
+                 make_tick('20170104', '20170103', '21:01:30', 11.),
+                 make_tick('20170104', '20170104', '09:00:30', 12.),
+                 make_tick('20170104', '20170104', '09:01:30', 13.)):
+        history.on_tick(tick)
+
+    bars = history.history_bars('RB1710', 10, '1m', None, datetime(2017, 1, 4, 9, 1), False, no_base_bars)
+    assert list(bars['datetime']) == [20170103210100, 20170103210200, 20170104090100]
+    assert list(bars['close']) == [10., 11., 12.]
+
+    # 夜盘时刻只能看到夜盘的 bar
+    bars = history.history_bars('RB1710', 10, '1m', 'close', datetime(2017, 1, 3, 21, 2), False, no_base_bars)
+    assert list(bars) == [10., 11.]
+
+    # 日线仍以交易日标记
+    day_bar = history.history_bars('RB1710', 1, '1d', None, datetime(2017, 1, 4), True, no_base_bars)
+    assert list(day_bar['datetime']) == [20170104000000]
+
+
+def test_night_session_action_day_falls_back_to_local_date(monkeypatch):
+    class FakeDate(object):
+        @staticmethod
+        def today():
+            return datetime(2017, 1, 3).date()
+
+    monkeypatch.setattr(data_dict, 'date', FakeDate)
+    # 大商所夜盘的 ActionDay 为交易日
+    assert make_tick('20170104', '20170104', '21:00:30', 10.).action_day == 20170103
+    assert make_tick('20170104', '20170104', '09:00:30', 10.).action_day == 20170104
+    assert make_tick('20170104', '', '09:00:30', 10.).action_day == 20170104
+
+
+def test_out_of_order_tick_is_dropped():
+    history = BarHistory(['1m'])
+    for tick in (make_tick('20170104', '20170104', '09:00:30', 10.),
+                 make_tick('20170104', '20170104', '09:01:30', 11.),
+                 make_tick('20170104', '20170104', '09:00:50', 9.),
+                 make_tick('20170104', '20170104', '09:02:30', 12.)):
+        history.on_tick(tick)
+
+    bars = history.history_bars('RB1710', 10, '1m', None, datetime(2017, 1, 4, 9, 2), False, no_base_bars)
+    assert list(bars['datetime']) == [20170104090100, 20170104090200]
+    assert list(bars['close']) == [10., 11.]
+
+
+def test_history_bars_rejects_missing_fields():
+    history = BarHistory(['1m'])
+    history.on_tick(make_tick('20170104', '20170104', '09:00:30', 10.))
+    with pytest.raises(RQInvalidArgument):
+        history.history_bars('RB1710', 1, '1m', ['close', 'limit_up'], datetime(2017, 1, 4, 9, 1), True,
+                             no_base_bars)
+    with pytest.raises(RQInvalidArgument):
+        history.history_bars('RB1710', 1, '1m', 'settlement', datetime(2017, 1, 4, 9, 1), True, no_base_bars)
+
+
+def test_data_source_rejects_invalid_adjust_type(tmpdir):
+    make_bundle(tmpdir)
+    history = BarHistory(['1m'])
+    history.on_tick(make_tick('20170104', '20170104', '09:00:30', 10.))
+    data_source = VNPYDataSource(make_env(tmpdir), None, history, lazy=True)
+    instrument = RqAttrDict({'order_book_id': 'RB1710', 'type': 'Future'})
+
+    bars = data_source.history_bars(instrument, 1, '1m', 'close', datetime(2017, 1, 4, 9, 1),
+                                    include_now=True, adjust_type='none')
+    assert list(bars) == [10.]
+    with pytest.raises(RuntimeError):
+        data_source.history_bars(instrument, 1, '1m', 'close', datetime(2017, 1, 4, 9, 1), adjust_type='forward')
+
+
+def test_bars_around_midnight_are_separate(monkeypatch):
+    class FakeDate(object):
+        @staticmethod
+        def today():
+            return datetime(2017, 1, 4).date()
+
+    # 午夜之后 ActionDay 与交易日相同，取本机日期
+    monkeypatch.setattr(data_dict, 'date', FakeDate)
+    history = BarHistory(['1m'])
+    for tick in (make_tick('20170104', '20170103', '23:58:30', 10.),
+                 make_tick('20170104', '20170103', '23:59:30', 11.),
+                 make_tick('20170104', '20170104', '00:00:30', 12.),
+                 make_tick('20170104', '20170104', '00:01:30', 13.)):
+        history.on_tick(tick)
+
+    bars = history.history_bars('RB1710', 10, '1m', None, datetime(2017, 1, 4, 0, 1), False, no_base_bars)
+    assert list(bars['datetime']) == [20170103235900, 20170104000000, 20170104000100]
+    assert list(bars['close']) == [10., 11., 12.]
+
+
+def test_stale_bar_is_dropped_instead_of_raising():
+    history = BarHistory(['1m'])
+    aggregator = history._aggregators['1m']
+    aggregator._close('RB1710', (20170104090100, 10., 10., 10., 10., 1., 10., 100.))
+    aggregator._close('RB1710', (20170104090100, 11., 11., 11., 11., 1., 11., 100.))
+    assert list(aggregator.closed_bars('RB1710')['close']) == [10.]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from threading import Thread
+
+from rqalpha_mod_vnpy.ctp.profiling import CallbackProfiler
+
+
+class Api(object):
+    def __init__(self, name):
+        self.name = name
+        self.received = 0
+
+    def onRtnTick(self, data):
+        self.received += 1
+
+
+def test_instances_in_separate_threads_are_counted_exactly():
+    profiler = CallbackProfiler()
+    apis = [profiler.profiled(Api)(str(i)) for i in range(4)]
+    assert profiler.profiled(Api) is type(apis[0])
+    assert apis[0].name == '0'
+
+    threads = [Thread(target=lambda api=api: [api.onRtnTick(i) for i in range(20000)]) for api in apis]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = profiler.stats()['Api.onRtnTick']
+    assert stats['count'] == 80000 == sum(api.received for api in apis)
+    assert sum(stats['histogram']) == 80000
+    assert 'Api.onRtnTick' in profiler.report()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pytest
+
+from rqalpha.const import SIDE, POSITION_EFFECT
+from rqalpha.environment import Environment
+from rqalpha.events import EVENT, Event
+from rqalpha.model.order import Order, LimitOrder
+from rqalpha.utils import RqAttrDict
+
+from rqalpha_mod_vnpy.risk import RiskEngine, MaxNetPositionCheck
+
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setattr(Environment, '_env', None)
+    env = Environment(RqAttrDict({'base': {}}))
+    env.calendar_dt = env.trading_dt = datetime.now()
+    return env
+
+
+def make_order(side, quantity, position_effect=POSITION_EFFECT.OPEN):
+    return Order.__from_create__('RB1710', quantity, side, LimitOrder(3000.), position_effect)
+
+
+class Account(object):
+    def __init__(self, account_name):
+        self.account_name = account_name
+
+
+def test_net_position_counts_open_orders_on_both_sides(env):
+    engine = RiskEngine(env)
+    engine.add_check(MaxNetPositionCheck(10))
+    assert engine.check_submit(make_order(SIDE.BUY, 8)) is None
+    # 买单全部成交、卖单撤销时净多头为 8，卖单不论多少都不会使净多头超限
+    assert engine.check_submit(make_order(SIDE.SELL, 10)) is None
+    assert engine.check_submit(make_order(SIDE.SELL, 1)) is not None
+    assert engine.check_submit(make_order(SIDE.BUY, 3)) is not None
+    assert engine.check_submit(make_order(SIDE.BUY, 2)) is None
+
+    engine = RiskEngine(env)
+    engine.add_check(MaxNetPositionCheck(10))
+    engine.counters.set_position('RB1710', 8, 0)
+    engine.counters.track(make_order(SIDE.BUY, 4))
+    # 挂出的买单已使净多头可能超限，卖单不能抵消尚未成交的买单
+    assert engine.check_submit(make_order(SIDE.SELL, 2, POSITION_EFFECT.CLOSE)) is not None
+
+
+def test_counters_only_follow_own_account_by_name(env):
+    engine = RiskEngine(env, account_name_of=lambda: 'a')
+    order = make_order(SIDE.BUY, 2)
+    engine.check_submit(order)
+
+    order.mark_cancelled('cancelled', user_warn=False)
+    env.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_PASS, account=Account('b'), order=order))
+    assert engine.counters.outstanding == 2
+    # 账户对象重建后仍按名称识别
+    env.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_PASS, account=Account('a'), order=order))
+    assert engine.counters.outstanding == 0
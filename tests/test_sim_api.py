@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rqalpha_mod_vnpy.ctp.sim_api import SimTdApi
+from rqalpha_mod_vnpy.vnpy import defineDict
+
+from test_history import make_tick
+
+
+class FakeGateway(object):
+    def __init__(self):
+        self.snapshot = {}
+        self.trades = []
+        self.errors = []
+
+    def add_tick_hook(self, hook):
+        pass
+
+    def get_snapshot(self, order_book_id):
+        return self.snapshot.get(order_book_id)
+
+    def on_order(self, order_dict, flow_key=None):
+        pass
+
+    def on_trade(self, trade_dict, flow_key=None):
+        self.trades.append((trade_dict.order_id, trade_dict.amount))
+
+    def on_err(self, error):
+        self.errors.append(error['ErrorID'])
+
+
+def make_api():
+    gateway = FakeGateway()
+    instruments = [{'InstrumentID': 'rb1710', 'ExchangeID': 'SHFE', 'VolumeMultiple': 10,
+                    'LongMarginRatio': .1, 'ShortMarginRatio': .1}]
+    return gateway, SimTdApi(gateway, None, 'sim', 'sim', 'sim', None, instruments, {}, 1000000.)
+
+
+def quote(trading_day, update_time, price, volume, ask_volume=3, bid_volume=3):
+    tick = make_tick(trading_day, trading_day, update_time, price)
+    tick['volume'] = volume
+    tick['a1_v'] = ask_volume
+    tick['b1_v'] = bid_volume
+    return tick
+
+
+def insert(api, order_ref, is_buy, offset_flag, price, quantity):
+    api._on_order_insert({
+        'InstrumentID': 'rb1710',
+        'OrderRef': str(order_ref),
+        'Direction': defineDict['THOST_FTDC_D_Buy'] if is_buy else defineDict['THOST_FTDC_D_Sell'],
+        'OrderPriceType': defineDict['THOST_FTDC_OPT_LimitPrice'],
+        'LimitPrice': price,
+        'VolumeTotalOriginal': quantity,
+        'CombOffsetFlag': defineDict[offset_flag],
+    }, 0)
+
+
+def test_orders_share_top_of_book_volume_of_a_tick():
+    gateway, api = make_api()
+    tick = gateway.snapshot['RB1710'] = quote('20170104', '09:00:01', 3000., 100)
+
+    insert(api, 1, True, 'THOST_FTDC_OF_Open', 3000., 2)
+    insert(api, 2, True, 'THOST_FTDC_OF_Open', 3000., 2)
+    assert gateway.trades == [(1, 2), (2, 1)]
+
+    # 同一笔行情到达时不再成交
+    api._match_tick(tick)
+    assert gateway.trades == [(1, 2), (2, 1)]
+
+    api._match_tick(quote('20170104', '09:00:02', 3000., 100))
+    assert gateway.trades == [(1, 2), (2, 1), (2, 1)]
+
+
+def test_today_position_rolls_into_yesterday_on_new_trading_day():
+    gateway, api = make_api()
+    api._match_tick(quote('20170104', '14:59:59', 3000., 100))
+    gateway.snapshot['RB1710'] = quote('20170104', '14:59:59', 3000., 100)
+    insert(api, 1, True, 'THOST_FTDC_OF_Open', 3000., 2)
+    assert gateway.trades == [(1, 2)]
+
+    api._match_tick(quote('20170105', '21:00:01', 3000., 10))
+    gateway.snapshot['RB1710'] = quote('20170105', '21:00:01', 3000., 10, bid_volume=0)
+    insert(api, 2, False, 'THOST_FTDC_OF_CloseToday', 3000., 1)
+    assert gateway.errors == [30]
+    insert(api, 3, False, 'THOST_FTDC_OF_Close', 3000., 2)
+    assert gateway.errors == [30]
+
+
+def test_pending_close_orders_freeze_closable_volume():
+    gateway, api = make_api()
+    gateway.snapshot['RB1710'] = quote('20170104', '09:00:01', 3000., 100)
+    insert(api, 1, True, 'THOST_FTDC_OF_Open', 3000., 2)
+    assert gateway.trades == [(1, 2)]
+
+    # 挂在对手价之外，不成交
+    insert(api, 2, False, 'THOST_FTDC_OF_CloseToday', 3100., 2)
+    insert(api, 3, False, 'THOST_FTDC_OF_CloseToday', 3100., 1)
+    assert gateway.trades == [(1, 2)]
+    assert gateway.errors == [30]
+
+
+def test_last_price_of_previous_day_is_reported_as_pre_settlement_price():
+    gateway, api = make_api()
+    positions = []
+    api.onRspQryInvestorPosition = lambda data, error, n, last: positions.append(data)
+
+    gateway.snapshot['RB1710'] = quote('20170104', '09:00:01', 3000., 100)
+    insert(api, 1, True, 'THOST_FTDC_OF_Open', 3000., 2)
+    api._match_tick(quote('20170104', '14:59:59', 3050., 200))
+    api._rsp_qry_position(0)
+    assert positions[-1]['PreSettlementPrice'] == 3000.
+
+    api._match_tick(quote('20170105', '21:00:01', 3100., 10))
+    api._rsp_qry_position(0)
+    assert (positions[-1]['YdPosition'], positions[-1]['PreSettlementPrice']) == (2, 3050.)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pytest
+
+from rqalpha.const import SIDE, POSITION_EFFECT, ORDER_STATUS
+from rqalpha.environment import Environment
+from rqalpha.events import EVENT
+from rqalpha.model.order import Order, LimitOrder
+from rqalpha.utils import RqAttrDict
+
+from rqalpha_mod_vnpy.ctp.api import POSITION_EFFECT_MAPPING, SIDE_MAPPING
+from rqalpha_mod_vnpy.ctp.data_cache import DataCache
+from rqalpha_mod_vnpy.ctp.data_dict import AccountDict, InstrumentDict, OrderDict, TradeDict
+from rqalpha_mod_vnpy.ctp.gateway import CtpGateway
+from rqalpha_mod_vnpy.ctp.lot_ledger import TODAY, YESTERDAY
+from rqalpha_mod_vnpy.ctp.valuation import VNPYFutureAccount
+from rqalpha_mod_vnpy.vnpy import defineDict
+
+
+class FakeTdApi(object):
+    front_id = 1
+    session_id = 1
+
+    def __init__(self):
+        self.sent = []
+        self.cancelled = []
+
+    def sendOrder(self, order):
+        self.sent.append(order)
+
+    def cancelOrder(self, order):
+        self.cancelled.append(order)
+
+
+@pytest.fixture
+def gateway(tmpdir, monkeypatch):
+    monkeypatch.setattr(Environment, '_env', None)
+    # 只检查订单事件，不计算账户的持仓变化
+    monkeypatch.setattr(VNPYFutureAccount, '_on_trade', lambda self, event: None)
+    env = Environment(RqAttrDict({'base': {}}))
+    env.calendar_dt = env.trading_dt = datetime.now()
+
+    cache = DataCache()
+    ins_dict = InstrumentDict({'InstrumentID': 'rb1710', 'ExchangeID': 'SHFE', 'VolumeMultiple': 10,
+                               'LongMarginRatio': .1, 'ShortMarginRatio': .1})
+    cache.cache_ins({ins_dict.order_book_id: ins_dict})
+    cache.cache_account(AccountDict({'PreBalance': 1000000.}))
+    cache.cache_position({})
+    # 多头昨仓 2 手、今仓 2 手
+    cache.ledger.seed([RqAttrDict({'order_book_id': 'RB1710', 'side': SIDE.BUY, 'is_today': is_today,
+                                   'open_price': 3000., 'quantity': 2}) for is_today in (False, True)])
+
+    gateway = CtpGateway(env, cache, str(tmpdir), 'u', 'p', 'b')
+    gateway.td_api = FakeTdApi()
+    gateway.events = []
+    for event_type in (EVENT.ORDER_PENDING_NEW, EVENT.ORDER_CREATION_PASS, EVENT.ORDER_CREATION_REJECT,
+                       EVENT.ORDER_CANCELLATION_PASS, EVENT.ORDER_UNSOLICITED_UPDATE, EVENT.TRADE):
+        env.event_bus.add_listener(event_type, lambda event, event_type=event_type: gateway.events.append(
+            (event_type, (event.trade if event_type == EVENT.TRADE else event.order).order_id)))
+    return gateway
+
+
+def order_data(order, status, traded=0):
+    return OrderDict({
+        'InstrumentID': 'rb1710', 'ExchangeID': 'SHFE', 'OrderRef': str(order.order_id), 'FrontID': 1,
+        'SessionID': 1, 'OrderSysID': 'S%d' % order.order_id, 'Direction': SIDE_MAPPING[order.side],
+        'CombOffsetFlag': POSITION_EFFECT_MAPPING[order.position_effect], 'LimitPrice': order.price,
+        'VolumeTotalOriginal': order.quantity, 'VolumeTraded': traded, 'OrderStatus': defineDict[status],
+    })
+
+
+def trade_data(order, quantity):
+    return TradeDict({
+        'InstrumentID': 'rb1710', 'ExchangeID': 'SHFE', 'OrderRef': str(order.order_id),
+        'OrderSysID': 'S%d' % order.order_id, 'TradeID': 'T%d' % order.order_id,
+        'Direction': SIDE_MAPPING[order.side], 'OffsetFlag': POSITION_EFFECT_MAPPING[order.position_effect],
+        'Price': 3000., 'Volume': quantity,
+    })
+
+
+def submit_close(gateway, quantity):
+    order = Order.__from_create__('RB1710', quantity, SIDE.SELL, LimitOrder(3000.), POSITION_EFFECT.CLOSE)
+    gateway.submit_orders(gateway.split_close_orders([order]))
+    return order
+
+
+def test_split_children_fill_the_unchanged_parent(gateway):
+    parent = submit_close(gateway, 3)
+    # 策略持有的订单不变，报出的是两笔子订单
+    assert (parent.quantity, parent.position_effect) == (3, POSITION_EFFECT.CLOSE)
+    first, second = gateway.td_api.sent
+    assert (first.quantity, first.position_effect) == (2, POSITION_EFFECT.CLOSE)
+    assert (second.quantity, second.position_effect) == (1, POSITION_EFFECT.CLOSE_TODAY)
+    assert gateway.owns(parent)
+
+    gateway.process_order(order_data(first, 'THOST_FTDC_OST_NoTradeQueueing'))
+    gateway.process_order(order_data(second, 'THOST_FTDC_OST_NoTradeQueueing'))
+    assert gateway.open_orders == [parent]
+    assert gateway.events == [(EVENT.ORDER_PENDING_NEW, parent.order_id),
+                              (EVENT.ORDER_CREATION_PASS, parent.order_id)]
+
+    gateway.process_order(order_data(first, 'THOST_FTDC_OST_AllTraded', 2))
+    gateway.process_trade(trade_data(first, 2))
+    assert parent.filled_quantity == 2 and parent.status == ORDER_STATUS.ACTIVE
+    gateway.process_trade(trade_data(second, 1))
+    gateway.process_order(order_data(second, 'THOST_FTDC_OST_AllTraded', 1))
+
+    assert parent.status == ORDER_STATUS.FILLED and parent.filled_quantity == 3
+    assert gateway.open_orders == []
+    assert gateway.events[2:] == [(EVENT.TRADE, parent.order_id)] * 2
+    holding = gateway._cache.ledger.get('RB1710', SIDE.BUY)
+    assert holding.quantity == [1, 0] and holding.frozen == [0, 0]
+
+
+def test_cancelling_parent_cancels_children(gateway):
+    parent = submit_close(gateway, 3)
+    first, second = gateway.td_api.sent
+    for child in (first, second):
+        gateway.process_order(order_data(child, 'THOST_FTDC_OST_NoTradeQueueing'))
+
+    gateway.cancel_orders([parent])
+    assert gateway.td_api.cancelled == [first, second]
+    gateway.process_order(order_data(first, 'THOST_FTDC_OST_Canceled'))
+    assert parent.status == ORDER_STATUS.ACTIVE
+    gateway.process_order(order_data(second, 'THOST_FTDC_OST_Canceled'))
+
+    assert parent.status == ORDER_STATUS.CANCELLED
+    assert gateway.events[-1] == (EVENT.ORDER_CANCELLATION_PASS, parent.order_id)
+    assert gateway.open_orders == []
+    holding = gateway._cache.ledger.get('RB1710', SIDE.BUY)
+    assert holding.frozen[TODAY] == holding.frozen[YESTERDAY] == 0
+
+
+def test_close_larger_than_position_is_rejected(gateway):
+    parent = submit_close(gateway, 5)
+    assert gateway.td_api.sent == []
+    assert parent.status == ORDER_STATUS.REJECTED
+    assert gateway.events == [(EVENT.ORDER_PENDING_NEW, parent.order_id),
+                              (EVENT.ORDER_CREATION_REJECT, parent.order_id)]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from math import ceil
+from timeit import default_timer
+
+from rqalpha_mod_vnpy.timer import TimerWheel
+
+
+START = 1500000000.
+DAY = 24 * 3600
+
+
+def test_advance_jumps_across_multi_hour_gap():
+    wheel = TimerWheel(now=START)
+    periodic = wheel.schedule(None, START + 1, interval=1)
+    once = wheel.schedule(None, START + 3 * 3600)
+
+    assert wheel.advance(START + 1.5) == [periodic]
+    started = default_timer()
+    # 休市 6 小时后第一次推进
+    fired = wheel.advance(START + 6 * 3600)
+    assert default_timer() - started < .05
+    assert fired == [periodic, once] or fired == [once, periodic]
+    assert periodic.deadline == START + 6 * 3600 + 1
+    assert len(wheel) == 1
+    assert wheel.advance(START + 6 * 3600 + 1) == [periodic]
+
+
+def test_timers_fire_once_at_their_deadline_tick():
+    rng = random.Random(1)
+    wheel = TimerWheel(now=START)
+    deadlines = {}
+    for _ in range(500):
+        deadline = START + rng.choice((rng.uniform(0, 5), rng.uniform(0, 600), rng.uniform(0, 3 * DAY)))
+        deadlines[wheel.schedule(None, deadline).timer_id] = deadline
+
+    now = START
+    fired_at = {}
+    while now < START + 3 * DAY + 1:
+        previous = now
+        now += rng.choice((.003, .5, 7., 3600., 8 * 3600.))
+        for timer in wheel.advance(now):
+            assert timer.timer_id not in fired_at
+            fired_at[timer.timer_id] = (previous, now)
+    assert len(fired_at) == len(deadlines)
+    for timer_id, deadline in deadlines.items():
+        # 在推进越过到期格的那一次触发
+        previous, now = fired_at[timer_id]
+        deadline_tick = int(ceil(deadline / wheel.resolution))
+        assert int(previous / wheel.resolution) < deadline_tick <= int(now / wheel.resolution)
+
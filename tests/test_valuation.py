@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 Ricequant, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rqalpha.model.position import Positions
+from rqalpha.model.position.future_position import FuturePosition
+
+from rqalpha_mod_vnpy.ctp.data_cache import DataCache
+from rqalpha_mod_vnpy.ctp.valuation import ValuationEngine, VNPYFutureAccount
+
+
+def make_account(cache):
+    return VNPYFutureAccount(0., Positions(FuturePosition), ValuationEngine(cache), register_event=False)
+
+
+def test_accounts_do_not_share_processed_trade_ids():
+    cache = DataCache()
+    first = make_account(cache)
+    second = make_account(cache)
+
+    first._backward_trade_set.add('1')
+    assert second._backward_trade_set == set()